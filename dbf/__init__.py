@@ -36,22 +36,27 @@ import codecs
 import csv
 import datetime
 import decimal
+import multiprocessing
 import os
+import shutil
 import struct
 import sys
+import threading
 import time
 import traceback
 import warnings
 import weakref
+import zlib
 
 from array import array
-from bisect import bisect_left, bisect_right
-from collections import defaultdict, deque
-from functools import partial
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, deque, namedtuple
+from functools import partial, reduce
 from aenum import Enum, IntEnum, IntFlag, export
 from glob import glob
 from math import floor
-from os import SEEK_END
+from mmap import mmap as MemoryMap, ACCESS_READ, ACCESS_WRITE
+from os import SEEK_CUR, SEEK_END, SEEK_SET
 from textwrap import dedent
 
 try:
@@ -59,6 +64,11 @@ try:
 except ImportError:
     pytz = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 py_ver = sys.version_info[:2]
 if py_ver < (3, 0):
     bytes = str
@@ -96,6 +106,18 @@ default_codepage = 'ascii'
 ## default format if none specified
 default_type = 'db3'
 
+## number of records read per disk access during sequential scans
+default_read_ahead = 256
+
+## number of recently used records each table keeps in memory
+default_record_cache = 1024
+
+## number of bytes of recently read memos each table keeps in memory
+default_memo_cache = 1024 * 1024
+
+## read each memo back after writing it to disk (debugging aid)
+verify_memos = False
+
 temp_dir = os.environ.get("DBF_TEMP") or os.environ.get("TMP") or os.environ.get("TEMP") or ""
 
 ## user-defined pql functions  (pql == primitive query language)
@@ -1976,24 +1998,24 @@ class Period(object):
     "for matching various time ranges"
 
     def __init__(self, year=None, month=None, day=None, hour=None, minute=None, second=None, microsecond=None):
-       #
-       if year:
-           attrs = []
-           if isinstance(year, (Date, datetime.date)):
-               attrs = ['year','month','day']
-           elif isinstance(year, (DateTime, datetime.datetime)):
-               attrs = ['year','month','day','hour','minute','second']
-           elif isinstance(year, (Time, datetime.time)):
-               attrs = ['hour','minute','second']
-           for attr in attrs:
-               value = getattr(year, attr)
-               self._mask[attr] = value
-       #
-       params = vars()
+        params = vars()
         self._mask = {}
+        #
+        if year:
+            attrs = []
+            if isinstance(year, (DateTime, datetime.datetime)):
+                attrs = ['year','month','day','hour','minute','second']
+            elif isinstance(year, (Date, datetime.date)):
+                attrs = ['year','month','day']
+            elif isinstance(year, (Time, datetime.time)):
+                attrs = ['hour','minute','second']
+            for attr in attrs:
+                value = getattr(year, attr)
+                self._mask[attr] = value
+        #
         for attr in ('year', 'month', 'day', 'hour', 'minute', 'second', 'microsecond'):
             value = params[attr]
-            if value is not None:
+            if value is not None and attr not in self._mask:
                 self._mask[attr] = value
 
     def __contains__(self, other):
@@ -2874,12 +2896,33 @@ del Marshaller
 
 # Internal classes
 
+_nav_lock = threading.Lock()
+
 class _Navigation(object):
     """
     Navigation base class that provides VPFish movement methods
     """
 
-    _index = -1
+    @property
+    def _index(self):
+        """
+        current record pointer, kept per thread
+        """
+        try:
+            return self._nav_local.index
+        except AttributeError:
+            return -1
+
+    @_index.setter
+    def _index(self, index):
+        try:
+            local = self._nav_local
+        except AttributeError:
+            with _nav_lock:
+                local = self.__dict__.get('_nav_local')
+                if local is None:
+                    local = self._nav_local = threading.local()
+        local.index = index
 
     def _nav_check(self):
         """
@@ -3057,6 +3100,244 @@ class _Navigation(object):
         return self._index
 
 
+class _RowDecoder(object):
+    """
+    field layout of a table compiled once, so converting record data to python
+    values skips the per-field lookups of the field definitions
+    """
+
+    __slots__ = ('fields', 'by_name', '_subsets', '_row_class')
+
+    def __init__(self, layout):
+        null_start = None
+        if '_NULLFLAGS' in layout:
+            null_start = layout['_NULLFLAGS'][START]
+        fields = []
+        for name in layout.user_fields:
+            fielddef = layout[name]
+            null_offset = null_mask = None
+            if fielddef[FLAGS] & NULLABLE and null_start is not None:
+                byte, bit = divmod(fielddef[NUL], 8)
+                null_offset, null_mask = null_start + byte, 1 << bit
+            retrieve = layout.fieldtypes[fielddef[TYPE]]['Retrieve']
+            fields.append((name, fielddef[START], fielddef[END], retrieve, fielddef, null_offset, null_mask))
+        self._setup(fields)
+
+    def __call__(self, data, memo, decoder, memos=None, offset=0):
+        """
+        returns the values of the fields in data (starting at offset) as a tuple
+        """
+        values = []
+        append = values.append
+        for name, start, end, retrieve, fielddef, null_offset, null_mask in self.fields:
+            if memos and name in memos:
+                append(memos[name])
+            elif null_mask is not None and data[offset+null_offset] & null_mask:
+                append(Null)
+            else:
+                append(retrieve(data[offset+start:offset+end], fielddef, memo, decoder))
+        return tuple(values)
+
+    def _setup(self, fields):
+        self.fields = tuple(fields)
+        self.by_name = dict((field[0], field) for field in fields)
+        self._subsets = {}
+        self._row_class = None
+
+    def field(self, data, name, memo, decoder):
+        """
+        returns the value of field name in data
+        """
+        name, start, end, retrieve, fielddef, null_offset, null_mask = self.by_name[name]
+        if null_mask is not None and data[null_offset] & null_mask:
+            return Null
+        return retrieve(data[start:end], fielddef, memo, decoder)
+
+    def row_class(self):
+        """
+        returns the namedtuple class for rows of these fields (created once)
+        """
+        if self._row_class is None:
+            self._row_class = namedtuple('Row', [field[0].lower() for field in self.fields], rename=True)
+        return self._row_class
+
+    def subset(self, names):
+        """
+        returns a decoder for just the fields in names (created once)
+        """
+        names = tuple(names)
+        decoder = self._subsets.get(names)
+        if decoder is None:
+            fields = []
+            for name in names:
+                if name not in self.by_name:
+                    raise FieldMissingError(name)
+                fields.append(self.by_name[name])
+            decoder = object.__new__(self.__class__)
+            decoder._setup(fields)
+            self._subsets[names] = decoder
+        return decoder
+
+
+class _RowEncoder(object):
+    """
+    field layout of a table compiled once, so converting python values to
+    record data skips the per-field lookups of the field definitions
+    """
+
+    __slots__ = ('fields', 'by_name')
+
+    def __init__(self, layout):
+        null_start = None
+        if '_NULLFLAGS' in layout:
+            null_start = layout['_NULLFLAGS'][START]
+        fields = []
+        for name in layout.user_fields:
+            fielddef = layout[name]
+            null_offset = null_mask = None
+            if fielddef[FLAGS] & NULLABLE and null_start is not None:
+                byte, bit = divmod(fielddef[NUL], 8)
+                null_offset, null_mask = null_start + byte, 1 << bit
+            update = layout.fieldtypes[fielddef[TYPE]]['Update']
+            start, size = fielddef[START], fielddef[LENGTH]
+            fields.append((
+                    name, start, start + size, update, fielddef, null_offset, null_mask,
+                    array('B', b' ' * size), name in layout.memofields,
+                    ))
+        self.fields = tuple(fields)
+        self.by_name = dict((field[0], field) for field in fields)
+
+    def __call__(self, data, values, meta, memos=None, drop=False):
+        """
+        stores values into data; values is either a sequence in field order or a
+        dict of field names and values; if memos is given memo values are saved
+        there instead of being written to the memo file
+        """
+        if isinstance(values, dict):
+            by_name = self.by_name
+            pairs = []
+            for key, value in values.items():
+                key = ensure_unicode(key).upper()
+                field = by_name.get(key)
+                if field is None:
+                    if drop:
+                        continue
+                    raise FieldMissingError(key)
+                pairs.append((field, value))
+        else:
+            if len(values) > len(self.fields):
+                raise DbfError("incoming data has too many values")
+            pairs = zip(self.fields, values)
+        store = self._store
+        memo_pairs = []
+        for field, value in pairs:
+            if field[8]:
+                if memos is not None:
+                    memos[field[0]] = value
+                else:
+                    memo_pairs.append((field, value))
+                continue
+            try:
+                store(data, field, value, meta)
+            except DbfError:
+                error = sys.exc_info()[1]
+                raise error.__class__("field %r: %s" % (field[0], error.args), field[0])
+        # memos are written last so a bad value elsewhere leaves the memo file untouched
+        for field, value in memo_pairs:
+            store(data, field, value, meta)
+
+    @staticmethod
+    def _store(data, field, value, meta):
+        name, start, end, update, fielddef, null_offset, null_mask, blank, memo = field
+        if null_mask is not None:
+            if value is Null:
+                data[null_offset] |= null_mask
+                value = None
+            else:
+                data[null_offset] &= 0xff ^ null_mask
+        if value is not Null:
+            bytes = array('B', update(value, fielddef, meta.memo, meta.input_decoder, meta.encoder))
+            length, size = len(bytes), end - start
+            if length > size:
+                raise DataOverflowError("tried to store %d bytes in %d byte field" % (length, size))
+            data[start:start+length] = bytes
+            if length < size:
+                data[start+length:end] = blank[length:]
+
+    def field(self, data, name, value, meta):
+        """
+        stores value into field name of data
+        """
+        self._store(data, self.by_name[name], value, meta)
+
+
+class _RowMapper(object):
+    """
+    maps record data from one table layout to another: fields whose definition
+    is unchanged are copied as bytes, only the others (and memos, which live in
+    a new memo file) are decoded and encoded again
+    """
+
+    __slots__ = ('old', 'new', 'blank', 'copies', 'nulls', 'converts')
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.blank = bytearray(to_bytes(new.blankrecord))
+        runs = [(0, 1, 0)]                  # the delete flag
+        nulls = []
+        converts = []
+        old_fields = old.row_decoder.by_name
+        new_fields = new.row_encoder.by_name
+        for name in new.user_fields:
+            if name not in old_fields:
+                continue
+            was, now = old[name], new[name]
+            if (
+                    name in old.memofields
+                    or was[TYPE] != now[TYPE]
+                    or was[LENGTH] != now[LENGTH]
+                    or was[DECIMALS] != now[DECIMALS]
+                    or was[FLAGS] != now[FLAGS]
+                ):
+                converts.append(name)
+                continue
+            start, end, new_start = was[START], was[END], now[START]
+            last_start, last_end, last_new = runs[-1]
+            if last_end == start and last_new + (last_end - last_start) == new_start:
+                runs[-1] = last_start, end, last_new
+            else:
+                runs.append((start, end, new_start))
+            null_offset, null_mask = old_fields[name][5:7]
+            if null_mask is not None:
+                nulls.append((null_offset, null_mask) + new_fields[name][5:7])
+        self.copies = tuple((start, end, new_start, new_start + end - start) for start, end, new_start in runs)
+        self.nulls = tuple(nulls)
+        self.converts = tuple(converts)
+
+    def __call__(self, data, offset=0):
+        """
+        returns the new record data for the old record data in data (starting
+        at offset) as a bytearray
+        """
+        row = bytearray(self.blank)
+        for start, end, new_start, new_end in self.copies:
+            row[new_start:new_end] = data[offset+start:offset+end]
+        for null_offset, null_mask, new_offset, new_mask in self.nulls:
+            if data[offset+null_offset] & null_mask:
+                row[new_offset] |= new_mask
+            else:
+                row[new_offset] &= 0xff ^ new_mask
+        if self.converts:
+            old, new = self.old, self.new
+            field = old.row_decoder.field
+            store = new.row_encoder.field
+            record = array('B', data[offset:offset+len(old.blankrecord)])
+            for name in self.converts:
+                store(row, name, field(record, name, old.memo, old.decoder), new)
+        return row
+
+
 class Record(object):
     """
     Provides routines to extract and save data within the fields of a
@@ -3087,7 +3368,7 @@ class Record(object):
             return record
         elif type(kamikaze) == array:
             record._data = kamikaze[:]
-        elif type(kamikaze) == bytes:
+        elif type(kamikaze) in (bytes, bytearray):
             if kamikaze:
                 record._data = array('B', kamikaze)
         else:
@@ -3146,7 +3427,7 @@ class Record(object):
             self._rollback_flux()
 
     def __iter__(self):
-        return (self[field] for field in self._meta.user_fields)
+        return iter(self._as_tuple())
 
     def __getattr__(self, name):
         if name[0:2] == '__' and name[-2:] == '__':
@@ -3265,6 +3546,13 @@ class Record(object):
     def __repr__(self):
         return '%r' % to_bytes(self._data)
 
+    def _as_tuple(self):
+        """
+        returns the values of all user fields, decoded in one pass
+        """
+        meta = self._meta
+        return meta.row_decoder(self._data, meta.memo, meta.decoder, self._memos)
+
     def _commit_flux(self):
         """
         stores field updates to disk; if any errors restores previous contents and propogates exception
@@ -3317,6 +3605,8 @@ class Record(object):
             if fieldtype != _NULLFLAG:    # ignore the nullflags field
                 data_types.append("%s_%s_%s" % (fieldtype.symbol, defs['Empty'], defs['Class']))
         layout.record_sig = ('___'.join(signature), '___'.join(data_types))
+        layout.row_decoder = _RowDecoder(layout)
+        layout.row_encoder = _RowEncoder(layout)
 
     def _reindex_record(self):
         """
@@ -3326,39 +3616,15 @@ class Record(object):
             raise DbfError("%s is closed; cannot alter indices" % self._meta.filename)
         elif not self._write_to_disk:
             raise DbfError("unable to reindex record until it is written to disk")
-        for dbfindex in self._meta.table()._indexen:
-            dbfindex(self)
+        self._meta.table()._indexen.changed(self)
 
     def _retrieve_field_value(self, name):
         """
         calls appropriate routine to convert value stored in field from array
         """
         # check nullable here, binary is handled in the appropriate retrieve_* functions
-        # index = self._meta.fields.index(name)
-        fielddef = self._meta[name]
-        flags = fielddef[FLAGS]
-        nullable = flags & NULLABLE and '_NULLFLAGS' in self._meta
-        if nullable:
-            index = fielddef[NUL]
-            byte, bit = divmod(index, 8)
-            null_def = self._meta['_NULLFLAGS']
-            null_data = self._data[null_def[START]:null_def[END]]
-            try:
-                if null_data[byte] >> bit & 1:
-                    return Null
-            except IndexError:
-                print(null_data)
-                print(index)
-                print(byte, bit)
-                print(len(self._data), self._data)
-                print(null_def)
-                print(null_data)
-                raise
-        record_data = self._data[fielddef[START]:fielddef[END]]
-        field_type = fielddef[TYPE]
-        retrieve = self._meta.fieldtypes[field_type]['Retrieve']
-        datum = retrieve(record_data, fielddef, self._meta.memo, self._meta.decoder)
-        return datum
+        meta = self._meta
+        return meta.row_decoder.field(self._data, name, meta.memo, meta.decoder)
 
     def _rollback_flux(self):
         """
@@ -3390,32 +3656,8 @@ class Record(object):
         calls appropriate routine to convert value to bytes, and save it in record
         """
         # check nullabel here, binary is handled in the appropriate update_* functions
-        fielddef = self._meta[name]
-        index = fielddef[NUL]
-        field_type = fielddef[TYPE]
-        flags = fielddef[FLAGS]
-        nullable = flags & NULLABLE and '_NULLFLAGS' in self._meta
-        update = self._meta.fieldtypes[field_type]['Update']
-        if nullable:
-            byte, bit = divmod(index, 8)
-            null_def = self._meta['_NULLFLAGS']
-            null_data = self._data[null_def[START]:null_def[END]]
-            if value is Null:
-                null_data[byte] |= 1 << bit
-                value = None
-            else:
-                null_data[byte] &= 0xff ^ 1 << bit
-            self._data[null_def[START]:null_def[END]] = null_data
-        if value is not Null:
-            bytes = array('B', update(value, fielddef, self._meta.memo, self._meta.input_decoder, self._meta.encoder))
-            size = fielddef[LENGTH]
-            if len(bytes) > size:
-                raise DataOverflowError("tried to store %d bytes in %d byte field" % (len(bytes), size))
-            blank = array('B', b' ' * size)
-            start = fielddef[START]
-            end = start + size
-            blank[:len(bytes)] = bytes[:]
-            self._data[start:end] = blank[:]
+        meta = self._meta
+        meta.row_encoder.field(self._data, name, value, meta)
         self._dirty = True
 
     def _update_disk(self, location='', data=None):
@@ -3428,13 +3670,17 @@ class Record(object):
                 location = self._recnum * header.record_length + header.start
             if data is None:
                 data = self._data
+            if layout.memo is not None:
+                # the memos the row points to go to disk before the row does
+                layout.memo.flush()
             layout.dfd.seek(location)
             layout.dfd.write(data)
             self._dirty = False
         table = layout.table()
         if table is not None:  # is None when table is being destroyed
-            for index in table._indexen:
-                index(self)
+            if layout.location == ON_DISK:
+                table._table._refresh(self._recnum, data)
+            table._indexen.changed(self)
 
     def _write(self):
         for field, value in self._memos.items():
@@ -3507,32 +3753,8 @@ class RecordTemplate(object):
         calls appropriate routine to convert value to ascii bytes, and save it in record
         """
         # check nullabel here, binary is handled in the appropriate update_* functions
-        fielddef = self._meta[name]
-        index = fielddef[NUL]
-        field_type = fielddef[TYPE]
-        flags = fielddef[FLAGS]
-        nullable = flags & NULLABLE and '_NULLFLAGS' in self._meta
-        update = self._meta.fieldtypes[field_type]['Update']
-        if nullable:
-            byte, bit = divmod(index, 8)
-            null_def = self._meta['_NULLFLAGS']
-            null_data = self._data[null_def[START]:null_def[END]] #.tostring()
-            if value is Null:
-                null_data[byte] |= 1 << bit
-                value = None
-            else:
-                null_data[byte] &= 0xff ^ 1 << bit
-            self._data[null_def[START]:null_def[END]] = null_data
-        if value is not Null:
-            bytes = array('B', update(value, fielddef, self._meta.memo, self._meta.input_decoder, self._meta.encoder))
-            size = fielddef[LENGTH]
-            if len(bytes) > size:
-                raise DataOverflowError("tried to store %d bytes in %d byte field" % (len(bytes), size))
-            blank = array('B', b' ' * size)
-            start = fielddef[START]
-            end = start + size
-            blank[:len(bytes)] = bytes[:]
-            self._data[start:end] = blank[:]
+        meta = self._meta
+        meta.row_encoder.field(self._data, name, value, meta)
 
     def __new__(cls, layout, original_record=None, defaults=None):
         """
@@ -3802,13 +4024,181 @@ class RecordVaporWare(object):
             return self._recno
 
 
+class _MappedFile(object):
+    """
+    File-like access to a disk file through a memory map; reads and writes
+    that fall inside the map use it directly, anything past the end goes
+    through the file and the map is rebuilt when next needed
+    """
+
+    def __init__(self, fd, writable=False):
+        self._fd = fd
+        self._access = (ACCESS_READ, ACCESS_WRITE)[writable]
+        self._map = None
+        self._size = 0
+        self._pos = 0
+        self._remap()
+
+    def _remap(self):
+        """
+        (re)maps the entire file
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fd.flush()
+        self._size = os.fstat(self._fd.fileno()).st_size
+        if self._size:
+            self._map = MemoryMap(self._fd.fileno(), self._size, access=self._access)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fd.close()
+
+    @property
+    def closed(self):
+        return self._fd.closed
+
+    def fileno(self):
+        return self._fd.fileno()
+
+    def find(self, sub, start=0):
+        """
+        returns the offset of the first sub at or after start, or -1
+        """
+        if os.fstat(self._fd.fileno()).st_size != self._size:
+            self._remap()
+        if self._map is None:
+            return -1
+        return self._map.find(sub, start)
+
+    def flush(self):
+        self._fd.flush()
+
+    def read(self, size=-1):
+        end = self._pos + size
+        if (size < 0 or end > self._size) and os.fstat(self._fd.fileno()).st_size != self._size:
+            # file has grown since it was mapped
+            self._remap()
+        if size < 0:
+            end = self._size
+        if self._map is None:
+            return b''
+        data = self._map[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def read_at(self, offset, size):
+        """
+        returns size bytes from offset without touching the file position
+        """
+        end = offset + size
+        if end > self._size and os.fstat(self._fd.fileno()).st_size != self._size:
+            self._remap()
+        if self._map is None:
+            return b''
+        return self._map[offset:end]
+
+    def seek(self, offset, whence=SEEK_SET):
+        if whence == SEEK_CUR:
+            offset += self._pos
+        elif whence == SEEK_END:
+            offset += os.fstat(self._fd.fileno()).st_size
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._pos
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fd.truncate(size)
+        self._remap()
+        return size
+
+    def write(self, data):
+        end = self._pos + len(data)
+        if self._map is not None and end <= self._size:
+            self._map[self._pos:end] = to_bytes(data)
+        else:
+            self._fd.seek(self._pos)
+            self._fd.write(data)
+            self._fd.flush()
+        self._pos = end
+
+
+if hasattr(os, 'pread'):
+    def _read_at(fd, offset, size):
+        """
+        returns size bytes from offset in fd, without using (or moving) the
+        shared file position, so threads can read one handle concurrently
+        """
+        if isinstance(fd, _MappedFile):
+            return fd.read_at(offset, size)
+        fd.flush()      # make any buffered writes visible
+        return os.pread(fd.fileno(), size, offset)
+else:
+    _read_at_lock = threading.RLock()
+    def _read_at(fd, offset, size):
+        """
+        returns size bytes from offset in fd, serializing the seek and read
+        so threads can read one handle concurrently
+        """
+        if isinstance(fd, _MappedFile):
+            return fd.read_at(offset, size)
+        with _read_at_lock:
+            fd.seek(offset)
+            return fd.read(size)
+
+
+def _replace_file(source, target):
+    """
+    renames source over target (in one step where the platform allows it)
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    else:
+        if os.name == 'nt':
+            os.remove(target)
+        os.rename(source, target)
+
+
+def _finish_pack(filename, memoname):
+    """
+    completes or rolls back a Table.pack_memos() cut short between its two
+    renames: the memo file is swapped in first, so a leftover memo .pack file
+    means neither file was replaced (and both .pack files are removed), while
+    a table .pack file on its own is the new table, still to be renamed
+    """
+    table_pack = filename + '.pack'
+    memo_pack = memoname + '.pack'
+    if os.path.exists(memo_pack):
+        os.remove(memo_pack)
+        if os.path.exists(table_pack):
+            os.remove(table_pack)
+    elif os.path.exists(table_pack):
+        _replace_file(table_pack, filename)
+
+
 class _DbfMemo(object):
     """
     Provides access to memo fields as dictionaries
-    Must override _init, _get_memo, and _put_memo to
-    store memo contents to disk
+    Must override _init, _get_memo, _header, _next_block_data, and _stored
+    to store memo contents to disk
+
+    new memos are collected in a write buffer and written, together with the
+    next available block, by flush()
     """
 
+    buffer_size = 1024 * 1024
+    _packed = None      # (file name, next block) of a packed file waiting for swap()
+
     def _init(self):
         """
         Initialize disk file usage
@@ -3819,10 +4209,33 @@ class _DbfMemo(object):
         Retrieve memo contents from disk
         """
 
+    def _map(self, writable):
+        """
+        switches the memo file to a memory map if the table is memory mapped
+        """
+        if self.meta.memory_mapped:
+            self.meta.mfd = _MappedFile(self.meta.mfd, writable=writable)
+
     def _put_memo(self, data):
         """
         Store memo contents to disk
         """
+        return self._buffer(self._stored(data))
+
+    def _header(self, nextmemo):
+        """
+        Returns the complete file header, with nextmemo as the next available block
+        """
+
+    def _next_block_data(self):
+        """
+        Returns the file header bytes that hold the next available block
+        """
+
+    def _stored(self, data):
+        """
+        Returns data as it is stored on disk (with any memo header/terminator)
+        """
 
     def _zap(self):
         """
@@ -3835,9 +4248,58 @@ class _DbfMemo(object):
         self.meta = meta
         self.memory = {}
         self.nextmemo = 1
+        self.cache = LruCache(maxsize=None, maxbytes=meta.memo_cache)
+        self.pending = bytearray()
+        self.pending_block = 0
         self._init()
         self.meta.newmemofile = False
 
+    def _buffer(self, data):
+        """
+        Adds data (a complete memo as stored on disk) to the write buffer,
+        returns its block number
+        """
+        size = self.meta.memo_size
+        thismemo = self.nextmemo
+        if not self.pending:
+            self.pending_block = thismemo
+        else:
+            # pad the previous memo out to its last block
+            self.pending.extend(b'\x00' * ((thismemo - self.pending_block) * size - len(self.pending)))
+        self.pending.extend(data)
+        self.nextmemo = thismemo + (len(data) + size - 1) // size
+        if len(self.pending) >= self.buffer_size:
+            self.flush()
+        return thismemo
+
+    def _verify(self, block, data):
+        """
+        Reads the memo at block back from disk and compares it with data
+        """
+        self.flush()
+        retrieved = self._get_memo(block)
+        if len(retrieved) != len(data):
+            uhoh = open('dbf_memo_dump.err', 'wb')
+            uhoh.write(('block: %d\nnextmemo: %d\nsaved: %d bytes\n' % (block, self.nextmemo, len(data))).encode('ascii'))
+            uhoh.write(bytes(data))
+            uhoh.write(('\nretrieved: %d bytes\n' % len(retrieved)).encode('ascii'))
+            uhoh.write(retrieved)
+            uhoh.close()
+            raise DbfError("unknown error: memo not saved")
+
+    def flush(self):
+        """
+        Writes any buffered memos and the next available block to disk
+        """
+        if self.pending:
+            mfd = self.meta.mfd
+            mfd.seek(self.pending_block * self.meta.memo_size)
+            mfd.write(bytes(self.pending))
+            self.pending = bytearray()
+            mfd.seek(0)
+            mfd.write(self._next_block_data())
+            mfd.flush()
+
     def get_memo(self, block):
         """
         Gets the memo in block
@@ -3845,10 +4307,81 @@ class _DbfMemo(object):
         if self.meta.ignorememos or not block:
             return ''
         if self.meta.location == ON_DISK:
-            return self._get_memo(block)
+            data = self.cache.get(block)
+            if data is None:
+                if self.pending and block >= self.pending_block:
+                    self.flush()
+                data = self._get_memo(block)
+                self.cache[block] = data
+            return data
         else:
             return self.memory[block]
 
+    def pack(self, blocks):
+        """
+        Copies the memos in blocks (block numbers, in the order to store them)
+        into a new memo file that replaces the current one when swap() is
+        called; returns a dict mapping old block numbers to new ones
+        """
+        meta = self.meta
+        mapping = {}
+        if meta.location == IN_MEMORY:
+            for block in blocks:
+                mapping[block] = block
+            for block in list(self.memory):
+                if block not in mapping:
+                    del self.memory[block]
+            return mapping
+        self.flush()
+        self.cache.clear()
+        size = meta.memo_size
+        nextmemo = (512 + size - 1) // size
+        packname = meta.memoname + '.pack'
+        new = open(packname, 'w+b')
+        try:
+            new.write(b'\x00' * (nextmemo * size))
+            for block in blocks:
+                if not block or block in mapping:
+                    continue
+                data = self._stored(self._get_memo(block))
+                used = (len(data) + size - 1) // size
+                new.write(data)
+                new.write(b'\x00' * (used * size - len(data)))
+                mapping[block] = nextmemo
+                nextmemo += used
+            new.seek(0)
+            new.write(self._header(nextmemo))
+            new.flush()
+            os.fsync(new.fileno())
+        except Exception:
+            new.close()
+            os.remove(packname)
+            raise
+        new.close()
+        self._packed = packname, nextmemo
+        return mapping
+
+    def abandon(self):
+        """
+        removes the memo file written by pack() without using it
+        """
+        if self._packed is not None:
+            os.remove(self._packed[0])
+            self._packed = None
+
+    def swap(self):
+        """
+        replaces the memo file with the one written by pack()
+        """
+        meta = self.meta
+        packname, nextmemo = self._packed
+        self._packed = None
+        meta.mfd.close()
+        _replace_file(packname, meta.memoname)
+        meta.mfd = open(meta.memoname, 'r+b')
+        self._map(writable=True)
+        self.nextmemo = nextmemo
+
     def put_memo(self, data):
         """
         Stores data in memo file, returns block number
@@ -3861,8 +4394,19 @@ class _DbfMemo(object):
             self.memory[thismemo] = data
         else:
             thismemo = self._put_memo(data)
+            self.cache.pop(thismemo)
+            if verify_memos:
+                self._verify(thismemo, data)
         return thismemo
 
+    def zap(self):
+        """
+        Removes all memos (and forgets any cached or buffered ones)
+        """
+        self.cache.clear()
+        self.pending = bytearray()
+        self._zap()
+
 
 class _Db3Memo(_DbfMemo):
     """
@@ -3876,10 +4420,12 @@ class _Db3Memo(_DbfMemo):
             if self.meta.newmemofile:
                 self.meta.mfd = open(self.meta.memoname, 'w+b')
                 self.meta.mfd.write(pack_long_int(1) + b'\x00' * 508)
+                self._map(writable=True)
             else:
                 mode = ('rb', 'r+b')[self.meta.status is READ_WRITE]
                 try:
                     self.meta.mfd = open(self.meta.memoname, mode)
+                    self._map(writable=self.meta.status is READ_WRITE)
                     self.meta.mfd.seek(0)
                     next = self.meta.mfd.read(4)
                     self.nextmemo = unpack_long_int(next)
@@ -3888,50 +4434,47 @@ class _Db3Memo(_DbfMemo):
                     raise DbfError("memo file appears to be corrupt: %r" % exc.args).from_exc(None)
 
     def _get_memo(self, block):
-        block = int(block)
-        self.meta.mfd.seek(block * self.meta.memo_size)
-        eom = -1
-        data = b''
-        while eom == -1:
-            newdata = self.meta.mfd.read(self.meta.memo_size)
+        mfd = self.meta.mfd
+        offset = int(block) * self.meta.memo_size
+        if isinstance(mfd, _MappedFile):
+            eom = mfd.find(b'\x1a\x1a', offset)
+            if eom == -1:
+                return mfd.read_at(offset, os.fstat(mfd.fileno()).st_size - offset)
+            return mfd.read_at(offset, eom - offset)
+        # read in growing chunks, only scanning the new bytes (plus one, in case
+        # the terminator straddles two chunks)
+        chunk = self.meta.memo_size * 8
+        data = bytearray()
+        while True:
+            newdata = _read_at(mfd, offset, chunk)
             if not newdata:
-                return data
-            data += newdata
-            eom = data.find(b'\x1a\x1a')
-        return data[:eom]
-
-    def _put_memo(self, data):
-        data = data
-        length = len(data) + self.record_header_length  # room for two ^Z at end of memo
-        blocks = length // self.meta.memo_size
-        if length % self.meta.memo_size:
-            blocks += 1
-        thismemo = self.nextmemo
-        self.nextmemo = thismemo + blocks
-        self.meta.mfd.seek(0)
-        self.meta.mfd.write(pack_long_int(self.nextmemo))
-        self.meta.mfd.seek(thismemo * self.meta.memo_size)
-        self.meta.mfd.write(data)
-        self.meta.mfd.write(b'\x1a\x1a')
-        double_check = self._get_memo(thismemo)
-        if len(double_check) != len(data):
-            uhoh = open('dbf_memo_dump.err', 'wb')
-            uhoh.write('thismemo: %d' % thismemo)
-            uhoh.write('nextmemo: %d' % self.nextmemo)
-            uhoh.write('saved: %d bytes' % len(data))
-            uhoh.write(data)
-            uhoh.write('retrieved: %d bytes' % len(double_check))
-            uhoh.write(double_check)
-            uhoh.close()
-            raise DbfError("unknown error: memo not saved")
-        return thismemo
+                return bytes(data)
+            scan = max(len(data) - 1, 0)
+            data.extend(newdata)
+            eom = data.find(b'\x1a\x1a', scan)
+            if eom != -1:
+                del data[eom:]
+                return bytes(data)
+            offset += len(newdata)
+            chunk = min(chunk * 2, 1024 * 1024)
+
+    def _header(self, nextmemo):
+        return pack_long_int(nextmemo) + b'\x00' * 508
+
+    def _next_block_data(self):
+        return pack_long_int(self.nextmemo)
+
+    def _stored(self, data):
+        # room for two ^Z at end of memo
+        return data + b'\x1a\x1a'
 
     def _zap(self):
         if self.meta.location == ON_DISK and not self.meta.ignorememos:
             mfd = self.meta.mfd
             mfd.seek(0)
             mfd.truncate(0)
-            mfd.write(pack_long_int(1) + b'\x00' * 508)
+            self.nextmemo = 1
+            mfd.write(self._header(self.nextmemo))
             mfd.flush()
 
 class _VfpMemo(_DbfMemo):
@@ -3954,10 +4497,12 @@ class _VfpMemo(_DbfMemo):
                 self.nextmemo = nextmemo
                 self.meta.mfd.write(pack_long_int(nextmemo, bigendian=True) + b'\x00\x00' + \
                         pack_short_int(self.meta.memo_size, bigendian=True) + b'\x00' * 504)
+                self._map(writable=True)
             else:
                 mode = ('rb', 'r+b')[self.meta.status is READ_WRITE]
                 try:
                     self.meta.mfd = open(self.meta.memoname, mode)
+                    self._map(writable=self.meta.status is READ_WRITE)
                     self.meta.mfd.seek(0)
                     header = self.meta.mfd.read(512)
                     self.nextmemo = unpack_long_int(header[:4], bigendian=True)
@@ -3967,24 +4512,20 @@ class _VfpMemo(_DbfMemo):
                     raise DbfError("memo file appears to be corrupt: %r" % exc.args).from_exc(None)
 
     def _get_memo(self, block):
-        self.meta.mfd.seek(block * self.meta.memo_size)
-        header = self.meta.mfd.read(8)
+        offset = block * self.meta.memo_size
+        header = _read_at(self.meta.mfd, offset, 8)
         length = unpack_long_int(header[4:], bigendian=True)
-        return self.meta.mfd.read(length)
+        return _read_at(self.meta.mfd, offset + 8, length)
 
-    def _put_memo(self, data):
-        data = data
-        self.meta.mfd.seek(0)
-        thismemo = unpack_long_int(self.meta.mfd.read(4), bigendian=True)
-        self.meta.mfd.seek(0)
-        length = len(data) + self.record_header_length
-        blocks = length // self.meta.memo_size
-        if length % self.meta.memo_size:
-            blocks += 1
-        self.meta.mfd.write(pack_long_int(thismemo + blocks, bigendian=True))
-        self.meta.mfd.seek(thismemo * self.meta.memo_size)
-        self.meta.mfd.write(b'\x00\x00\x00\x01' + pack_long_int(len(data), bigendian=True) + data)
-        return thismemo
+    def _header(self, nextmemo):
+        return pack_long_int(nextmemo, bigendian=True) + b'\x00\x00' + \
+                pack_short_int(self.meta.memo_size, bigendian=True) + b'\x00' * 504
+
+    def _next_block_data(self):
+        return pack_long_int(self.nextmemo, bigendian=True)
+
+    def _stored(self, data):
+        return b'\x00\x00\x00\x01' + pack_long_int(len(data), bigendian=True) + data
 
     def _zap(self):
         if self.meta.location == ON_DISK and not self.meta.ignorememos:
@@ -3995,8 +4536,7 @@ class _VfpMemo(_DbfMemo):
             if nextmemo * self.meta.memo_size < 512:
                 nextmemo += 1
             self.nextmemo = nextmemo
-            mfd.write(pack_long_int(nextmemo, bigendian=True) + b'\x00\x00' + \
-                    pack_short_int(self.meta.memo_size, bigendian=True) + b'\x00' * 504)
+            mfd.write(self._header(self.nextmemo))
             mfd.flush()
 
 
@@ -4769,11 +5309,46 @@ class CodePage(tuple):
         return self[2]
 
 
+class CacheInfo(tuple):
+    """
+    tuple with named attributes for reporting a cache's hits, misses,
+    maximum size, and current size
+    """
+
+    __slots__= ()
+
+    def __new__(cls, *args):
+        if len(args) != 4:
+            raise TypeError("%s should be called with hits, misses, maxsize, and currsize" % cls.__name__)
+        return tuple.__new__(cls, args)
+
+    def __repr__(self):
+        return "CacheInfo(hits=%r, misses=%r, maxsize=%r, currsize=%r)" % self
+
+    @property
+    def hits(self):
+        return self[0]
+
+    @property
+    def misses(self):
+        return self[1]
+
+    @property
+    def maxsize(self):
+        return self[2]
+
+    @property
+    def currsize(self):
+        return self[3]
+
+
 class Iter(_Navigation):
     """
     Provides iterable behavior for a table
     """
 
+    _index = -1         # an iterator belongs to one thread, so no need for thread-local
+
     def __init__(self, table, include_vapor=False):
         """
         Return a Vapor record as the last record in the iteration
@@ -4886,25 +5461,80 @@ class Table(_Navigation):
     _pack_count = 0
     backup = None
 
+    class _DeferredIndexes(object):
+        """
+        holds back index maintenance; see Table.deferred_indexes()
+        """
+
+        def __init__(self, table):
+            self._table = table
+
+        def __enter__(self):
+            self._table._indexen.deferred += 1
+            return self._table
+
+        def __exit__(self, *exc_info):
+            table = self._table
+            indexen = table._indexen
+            indexen.deferred -= 1
+            if not indexen.deferred:
+                # (already done if the table was closed inside the block)
+                indexen.catch_up(table)
+
     class _Indexen(object):
         """
         implements the weakref structure for seperate indexes
         """
 
         def __init__(self):
-            self._indexen = set()
+            self._indexen = weakref.WeakSet()
+            self.deferred = 0       # depth of deferred_indexes() blocks
+            self.dirty = set()      # record numbers written while deferred
 
         def __iter__(self):
-            self._indexen = set([s for s in self._indexen if s() is not None])
-            return (s() for s in self._indexen if s() is not None)
+            return iter(self._indexen)
 
         def __len__(self):
-            self._indexen = set([s for s in self._indexen if s() is not None])
             return len(self._indexen)
 
         def add(self, new_index):
-            self._indexen.add(weakref.ref(new_index))
-            self._indexen = set([s for s in self._indexen if s() is not None])
+            self._indexen.add(new_index)
+
+        def catch_up(self, table):
+            """
+            applies the updates held back while maintenance was deferred
+            """
+            dirty, self.dirty = self.dirty, set()
+            if dirty and table._meta.status != CLOSED:
+                count = len(table)
+                recnos = sorted(r for r in dirty if 0 <= r < count)
+                for dbfindex in list(self._indexen):
+                    dbfindex.update(table._table[recno] for recno in recnos)
+
+        def changed(self, record):
+            """
+            brings the indices up to date with record (or notes it for later
+            while maintenance is deferred)
+            """
+            if self.deferred:
+                self.dirty.add(record._recnum)
+            else:
+                for dbfindex in self._indexen:
+                    dbfindex(record)
+
+        def discard(self, old_index):
+            self._indexen.discard(old_index)
+
+        def update(self, table, recnos):
+            """
+            brings the indices up to date with the records at recnos (or notes
+            them for later while maintenance is deferred)
+            """
+            if self.deferred:
+                self.dirty.update(recnos)
+                return
+            for dbfindex in list(self._indexen):
+                dbfindex.update(table._table[recno] for recno in recnos)
 
     class _MetaData(dict):
         """
@@ -4917,13 +5547,18 @@ class Table(_Navigation):
         field_types = None        # dictionary of dbf type field specs
         filename = None           # name of .dbf file
         ignorememos = False       # True when memos should be ignored
+        index_file = None         # IndexFile (.pdx) holding persistent indices
         memoname = None           # name of .dbt/.fpt file
         memo_size = None           # size of blocks in memo file
+        memory_mapped = False     # True when dfd is accessed through a memory map
         mfd = None                # file handle
         memo = None               # memo object
+        memo_cache = 0            # bytes of memo data to keep in memory
         memofields = None         # field names of Memo type
         newmemofile = False       # True when memo file needs to be created
         nulls = None              # non-None when Nullable fields present
+        row_decoder = None        # compiled field layout for reading records
+        row_encoder = None        # compiled field layout for writing records
         user_fields = None        # not counting SYSTEM fields
         user_field_count = 0      # also not counting SYSTEM fields
         unicode_errors = 'strict' # default to strict unicode translations
@@ -5103,14 +5738,21 @@ class Table(_Navigation):
     class _Table(object):
         """
         implements the weakref table for records
+
+        the most recently used records are also kept in an LruCache so they
+        survive being dropped by the caller; the weak references keep record
+        identity for every record still alive, and remove themselves when
+        their record is collected
         """
 
         def __init__(self, count, meta):
             self._meta = meta
             self._max_count = count
             self._weakref_list = {}
-            self._accesses = 0
-            self._dead_check = 1024
+            self._cache = LruCache(maxsize=meta.record_cache)
+            self._lock = threading.Lock()
+            self._buffer = 0, 0, bytearray()      # first record, record count, raw data
+            self._last_read = -1
 
         def __getitem__(self, index):
             # maybe = self._weakref_list[index]()
@@ -5120,52 +5762,133 @@ class Table(_Navigation):
                 index = self._max_count + index
             if index >= self._max_count:
                 raise IndexError('index %d greater than available records' % index)
+            maybe = self._cache.get(index)
+            if maybe is not None:
+                return maybe
             maybe = self._weakref_list.get(index)
-            if maybe:
+            if maybe is not None:
                 maybe = maybe()
-            self._accesses += 1
-            if self._accesses >= self._dead_check:
-                for key, value in list(self._weakref_list.items()):
-                    if value() is None:
-                        del self._weakref_list[key]
-            if not maybe:
+            if maybe is None:
                 meta = self._meta
                 if meta.status == CLOSED:
                     raise DbfError("%s is closed; record %d is unavailable" % (meta.filename, index))
-                header = meta.header
-                if index < 0:
-                    index += header.record_count
-                size = header.record_length
-                location = index * size + header.start
-                meta.dfd.seek(location)
-                if meta.dfd.tell() != location:
-                    raise ValueError("unable to seek to offset %d in file" % location)
-                bytes = meta.dfd.read(size)
-                if not bytes:
-                    raise ValueError("unable to read record data from %s at location %d" % (meta.filename, location))
-                maybe = Record(recnum=index, layout=meta, kamikaze=bytes, _fromdisk=True)
-                self._weakref_list[index] = weakref.ref(maybe)
+                data = self._read(index)
+                with self._lock:
+                    # another thread may have loaded the record in the meantime
+                    maybe = self._weakref_list.get(index)
+                    if maybe is not None:
+                        maybe = maybe()
+                    if maybe is None:
+                        maybe = Record(recnum=index, layout=meta, kamikaze=data, _fromdisk=True)
+                        self._track(index, maybe)
+            self._cache[index] = maybe
             return maybe
 
+        def _track(self, index, record):
+            """
+            stores a weak reference to record that removes itself once the record
+            is collected (unless it has been replaced in the meantime)
+            """
+            weak_list = self._weakref_list
+            def discard(ref, index=index):
+                if weak_list.get(index) is ref:
+                    del weak_list[index]
+            weak_list[index] = weakref.ref(record, discard)
+
+        def _read(self, index):
+            """
+            returns the raw data for record index; if index follows the last record
+            read, the next read_ahead records are buffered as well
+            """
+            if self._meta.memory_mapped:
+                # the map is already the buffer
+                return self._read_records(index, 1)
+            size = self._meta.header.record_length
+            first, count, data = self._buffer
+            if not first <= index < first + count:
+                chunk = 1
+                if index == self._last_read + 1:
+                    chunk = max(1, min(self._meta.read_ahead, self._max_count - index))
+                data = bytearray(self._read_records(index, chunk))
+                first, count = index, len(data) // size
+                self._buffer = first, count, data
+            self._last_read = index
+            offset = (index - first) * size
+            return data[offset:offset+size]
+
+        def _read_records(self, index, count):
+            """
+            returns the raw data for count records starting at index
+            """
+            meta = self._meta
+            header = meta.header
+            size = header.record_length
+            location = index * size + header.start
+            data = _read_at(meta.dfd, location, size * count)
+            if len(data) < size:
+                raise ValueError("unable to read record data from %s at location %d" % (meta.filename, location))
+            return data
+
+        def _refresh(self, index, data):
+            """
+            keeps the read buffer in step with record data written to disk
+            """
+            first, count, buffer = self._buffer
+            if first <= index < first + count:
+                size = len(data)
+                offset = (index - first) * size
+                buffer[offset:offset+size] = data
+
         def append(self, record):
-            self._weakref_list[self._max_count] = weakref.ref(record)
+            self._track(self._max_count, record)
+            self._cache[self._max_count] = record
             self._max_count += 1
 
+        def extend(self, count):
+            """
+            accounts for count records written directly to disk
+            """
+            self._max_count += count
+
         def clear(self):
-            for key in list(self._weakref_list.keys()):
-                del self._weakref_list[key]
+            self._cache.clear()
+            self._weakref_list.clear()
             self._max_count = 0
+            self._buffer = 0, 0, bytearray()
+            self._last_read = -1
 
         def flush(self):
-            for maybe in self._weakref_list.values():
+            for maybe in list(self._weakref_list.values()):
                 maybe = maybe()
                 if maybe and not maybe._write_to_disk:
                     raise DbfError("some records have not been written to disk")
 
+        def moved(self, moves, count):
+            """
+            accounts for records moved on disk by a pack; moves holds a
+            (record, new record number) pair for every record still alive,
+            with -1 for those that were packed away
+            """
+            self.clear()
+            self._max_count = count
+            for record, index in moves:
+                record._recnum = index
+                if index >= 0:
+                    self._track(index, record)
+                    self._cache[index] = record
+
+        def drop_buffer(self):
+            """
+            forgets the buffered raw data (the file has been replaced)
+            """
+            self._buffer = 0, 0, bytearray()
+            self._last_read = -1
+
         def pop(self):
             if not self._max_count:
                 raise IndexError('no records exist')
             self._max_count -= 1
+            self._cache.pop(self._max_count)
             record = self._weakref_list[self._max_count]
             del self._weakref_list[self._max_count]
             return record
@@ -5303,6 +6026,40 @@ class Table(_Navigation):
                 specs[i] = s.decode(input_decoding)
         return FieldnameList(specs)
 
+    def _migrate(self, old_table):
+        """
+        copies the records of old_table (the backup made before a layout change)
+        into this (empty) table, converting them read_ahead records at a time
+        """
+        meta = self._meta
+        old_table.open()
+        try:
+            mapper = _RowMapper(old_table._meta, meta)
+            size = old_table._meta.header.record_length
+            header = meta.header
+            count = 0
+            for first, data in old_table._raw_blocks():
+                data = bytearray(data)
+                rows = [mapper(data, offset) for offset in range(0, len(data), size)]
+                if meta.location == IN_MEMORY:
+                    for row in rows:
+                        self._table.append(Record(recnum=count, layout=meta, kamikaze=array('B', bytes(row))))
+                        count += 1
+                else:
+                    if meta.memo is not None:
+                        # the memos the rows point to go to disk before the rows do
+                        meta.memo.flush()
+                    meta.dfd.seek(header.start + count * header.record_length)
+                    meta.dfd.write(b''.join([bytes(row) for row in rows]))
+                    count += len(rows)
+        finally:
+            old_table.close()
+        if meta.location == ON_DISK:
+            self._table.extend(count)
+        header.record_count = count
+        self._update_disk(headeronly=True)
+        self._indexen.update(self, range(count))
+
     def _nav_check(self):
         """
         Raises `DbfError` if table is closed
@@ -5317,6 +6074,61 @@ class Table(_Navigation):
         """
         return array('B', [date.year - 1900, date.month, date.day])
 
+    def _pack_disk(self):
+        """
+        moves the records not flagged as deleted towards the start of the file,
+        one read_ahead block at a time, and truncates the file after them;
+        returns the number of records kept
+        """
+        meta = self._meta
+        header = meta.header
+        size = header.record_length
+        fd = meta.dfd
+        # records still in use keep their identity, but get new numbers
+        alive = {}
+        for index, ref in list(self._table._weakref_list.items()):
+            record = ref()
+            if record is not None:
+                alive[index] = record
+        moves = []
+        kept = 0
+        for first, data in self._raw_blocks():
+            survivors = bytearray()
+            for offset in range(0, len(data), size):
+                record = alive.get(first + offset // size)
+                if data[offset:offset+1] == b'*':
+                    if record is not None:
+                        moves.append((record, -1))
+                    continue
+                if record is not None:
+                    moves.append((record, kept + len(survivors) // size))
+                survivors.extend(data[offset:offset+size])
+            if survivors:
+                if kept != first or len(survivors) != len(data):
+                    fd.seek(header.start + kept * size)
+                    fd.write(bytes(survivors))
+                kept += len(survivors) // size
+        fd.flush()
+        fd.truncate(header.start + kept * size)
+        self._table.moved(moves, kept)
+        return kept
+
+    def _raw_blocks(self, start=0, stop=None):
+        """
+        yields (first record number, raw data) for blocks of up to read_ahead
+        records between start and stop
+        """
+        meta = self._meta
+        start, stop, step = slice(start, stop).indices(len(self))
+        while start < stop:
+            count = min(meta.read_ahead, stop - start)
+            if meta.location == ON_DISK:
+                data = self._table._read_records(start, count)
+            else:
+                data = b''.join([to_bytes(r._data) for r in self._table[start:start+count]])
+            yield start, data
+            start += count
+
     @staticmethod
     def _unpack_date(bytestr):
         """
@@ -5334,6 +6146,8 @@ class Table(_Navigation):
             return
         meta = self._meta
         header = meta.header
+        if meta.memo is not None:
+            meta.memo.flush()
         fd = meta.dfd
         fd.seek(0)
         fd.write(header.data)
@@ -5407,7 +6221,7 @@ class Table(_Navigation):
 
     def __init__(self, filename, field_specs=None, memo_size=128, ignore_memos=False,
                  codepage=None, default_data_types=None, field_data_types=None,    # e.g. 'name':str, 'age':float
-                 dbf_type=None, on_disk=True, unicode_errors='strict'
+                 dbf_type=None, on_disk=True, unicode_errors='strict', mmap=False,
                  ):
         """
         open/create dbf file
@@ -5419,6 +6233,7 @@ class Table(_Navigation):
         keep_memos will also load any memo fields into memory
         meta_only will ignore all records, keeping only basic table information
         codepage will override whatever is set in the table itself
+        mmap will access the table file through a memory map when opened
         """
         if not on_disk:
             if field_specs is None:
@@ -5442,6 +6257,10 @@ class Table(_Navigation):
         meta.memo_types = self._memo_types
         meta.ignorememos = meta.original_ignorememos = ignore_memos
         meta.memo_size = memo_size
+        meta.read_ahead = default_read_ahead
+        meta.record_cache = default_record_cache
+        meta.memo_cache = default_memo_cache
+        meta.memory_mapped = mmap
         meta.input_decoder = codecs.getdecoder(input_decoding)      # from ascii to unicode
         meta.output_encoder = codecs.getencoder(input_decoding)     # and back to ascii
         meta.unicode_errors = unicode_errors
@@ -5520,6 +6339,7 @@ class Table(_Navigation):
         else:
             meta.status = READ_ONLY
             try:
+                _finish_pack(meta.filename, meta.memoname)
                 dfd = meta.dfd = open(meta.filename, 'rb')
             except IOError:
                 e= sys.exc_info()[1]
@@ -5570,6 +6390,8 @@ class Table(_Navigation):
                     ):
                 classes.append(result_type)
             meta[field] = meta[field][:Field.CLASS] + tuple(classes) + meta[field][Field.NUL:]
+        meta.row_decoder = _RowDecoder(meta)
+        meta.row_encoder = _RowEncoder(meta)
         self.close()
 
     def __iter__(self):
@@ -5586,7 +6408,7 @@ class Table(_Navigation):
 
     def __new__(cls, filename, field_specs=None, memo_size=128, ignore_memos=False,
                  codepage=None, default_data_types=None, field_data_types=None,    # e.g. 'name':str, 'age':float
-                 dbf_type=None, on_disk=True, unicode_errors='strict',
+                 dbf_type=None, on_disk=True, unicode_errors='strict', mmap=False,
                  ):
         if dbf_type is None and isinstance(filename, Table):
             return filename
@@ -5697,6 +6519,21 @@ class Table(_Navigation):
         """
         return self._meta.header.update
 
+    @property
+    def memo_cache(self):
+        """
+        number of bytes of recently read memos kept in memory (0 to disable)
+        """
+        return self._meta.memo_cache
+
+    @memo_cache.setter
+    def memo_cache(self, size):
+        if size < 0:
+            raise ValueError("memo_cache cannot be negative, not %r" % (size, ))
+        self._meta.memo_cache = size
+        if self._meta.memo is not None:
+            self._meta.memo.cache.resize(maxbytes=size)
+
     @property
     def memoname(self):
         """
@@ -5704,6 +6541,36 @@ class Table(_Navigation):
         """
         return self._meta.memoname
 
+    @property
+    def read_ahead(self):
+        """
+        number of records read per disk access during sequential scans
+        """
+        return self._meta.read_ahead
+
+    @read_ahead.setter
+    def read_ahead(self, count):
+        if count < 1:
+            raise ValueError("read_ahead must be at least 1, not %r" % (count, ))
+        self._meta.read_ahead = count
+
+    @property
+    def record_cache(self):
+        """
+        number of recently used records kept in memory (0 to disable)
+        """
+        return self._meta.record_cache
+
+    @record_cache.setter
+    def record_cache(self, count):
+        if count < 0:
+            raise ValueError("record_cache cannot be negative, not %r" % (count, ))
+        self._meta.record_cache = count
+        # not hasattr: __getattr__ would build the record table just to resize it
+        table = self.__dict__.get('_table')
+        if self._meta.location == ON_DISK and table is not None:
+            table._cache.resize(count)
+
     @property
     def record_length(self):
         """
@@ -5736,7 +6603,7 @@ class Table(_Navigation):
         """
         adds field(s) to the table layout; format is Name Type(Length,Decimals)[; Name Type(Length,Decimals)[...]]
         backup table is created with _backup appended to name
-        then zaps table, recreates current structure, and copies records back from the backup
+        then zaps table, recreates current structure, and streams records back from the backup
         """
         # for python 2, convert field_specs from bytes to unicode if necessary
         if isinstance(field_specs, bytes):
@@ -5846,10 +6713,7 @@ class Table(_Navigation):
         self._build_header_fields()
         self._update_disk()
         if old_table is not None:
-            old_table.open()
-            for record in old_table:
-                self.append(scatter(record))
-            old_table.close()
+            self._migrate(old_table)
 
     def allow_nulls(self, fields):
         """
@@ -5877,16 +6741,25 @@ class Table(_Navigation):
                 kamikaze = data._data
         else:
             if isinstance(data, dict):
-                dictdata = dict((ensure_unicode(k).upper(), v) for k, v in data.items())
+                dictdata = data
                 data = b''
             elif isinstance(data, tuple):
                 if len(data) > self.field_count:
                     raise DbfError("incoming data has too many values")
-                tupledata = data
+                tupledata = tuple(ensure_unicode(item) for item in data)
                 data = b''
             elif data:
                 raise TypeError("data to append must be a tuple, dict, record, or template; not a %r" % type(data))
-        newrecord = Record(recnum=header.record_count, layout=meta, kamikaze=kamikaze)
+        if dictdata or tupledata:
+            # encode the whole row before the record is created and written
+            encoded = meta.blankrecord[:]
+            meta.row_encoder(encoded, dictdata or tupledata, meta, drop=drop)
+            newrecord = Record(recnum=header.record_count, layout=meta, kamikaze=encoded)
+            if meta.location == IN_MEMORY:
+                # disk records are indexed as they are written
+                self._indexen.changed(newrecord)
+        else:
+            newrecord = Record(recnum=header.record_count, layout=meta, kamikaze=kamikaze)
         if kamikaze and meta.memofields:
             newrecord._start_flux()
             for field in meta.memofields:
@@ -5897,15 +6770,7 @@ class Table(_Navigation):
         header.record_count += 1
         if not kamikaze:
             try:
-                if dictdata:
-                    gather(newrecord, dictdata, drop=drop)
-                elif tupledata:
-                    newrecord._start_flux()
-                    for index, item in enumerate(tupledata):
-                        item = ensure_unicode(item)
-                        newrecord[index] = item
-                    newrecord._commit_flux()
-                elif data:
+                if data:
                     newrecord._start_flux()
                     data_fields = field_names(data)
                     my_fields = self.field_names
@@ -5938,25 +6803,187 @@ class Table(_Navigation):
             newrecord = multi_record
         self._update_disk(headeronly=True)
 
+    def cache_info(self):
+        """
+        returns CacheInfo(hits, misses, maxsize, currsize) for the record cache
+        (all zeros for in-memory tables, which keep every record)
+        """
+        if self._meta.location == IN_MEMORY:
+            return CacheInfo(0, 0, 0, 0)
+        return self._table._cache.info()
+
     def close(self):
         """
         closes disk files, flushing record data to disk
         ensures table data is available if keep_table
         ensures memo data is available if keep_memos
         """
+        # a deferred_indexes() block may still be holding updates back
+        self._indexen.catch_up(self)
         if self._meta.location == ON_DISK and self._meta.status != CLOSED:
             self._table.flush()
             if self._meta.mfd is not None:
+                self._meta.memo.flush()
                 self._meta.mfd.close()
                 self._meta.mfd = None
             if self._meta.dfd is not None:
                 self._meta.dfd.close()
                 self._meta.dfd = None
+            if self._meta.index_file is not None:
+                # with the table's final size and time, so changes made while
+                # an index is not loaded are caught when it next is
+                for index in list(self._indexen):
+                    if isinstance(index, ContainedIndex) and index.file is self._meta.index_file:
+                        index._seal()
+                self._meta.index_file.close()
         self._meta.status = CLOSED
 
+    def as_numpy(self, start=0, stop=None):
+        """
+        returns a NumPy structured array over the raw records start through stop;
+        disk tables are mapped read-only, so no data is copied -- the array holds
+        its own map and stays usable after the table is closed, but does not see
+        records appended later
+
+        '_DELETED' holds the delete flag, I and memo-block fields are int32, B is
+        float64, Y is int64 in ten-thousandths, T is (julian day, milliseconds),
+        _NULLFLAGS is an array of bytes, and all others are raw bytes
+        """
+        if numpy is None:
+            raise DbfError("NumPy is required for as_numpy()")
+        meta = self._meta
+        if meta.status == CLOSED:
+            raise DbfError('%s is closed' % meta.filename)
+        header = meta.header
+        size = header.record_length
+        start, stop, step = slice(start, stop).indices(len(self))
+        count = max(0, stop - start)
+        names, formats, offsets = ['_DELETED'], ['S1'], [0]
+        for name in meta.fields:
+            fielddef = meta[name]
+            field_type = fielddef[TYPE]
+            length = fielddef[LENGTH]
+            if field_type == INTEGER or field_type in meta.memo_types and length == 4:
+                format = '<i4'
+            elif field_type == DOUBLE:
+                format = '<f8'
+            elif field_type == CURRENCY:
+                format = '<i8'
+            elif field_type == DATETIME:
+                format = ('<i4', 2)
+            elif field_type == _NULLFLAG:
+                format = ('u1', length)
+            else:
+                format = 'S%d' % length
+            names.append(name)
+            formats.append(format)
+            offsets.append(fielddef[START])
+        dtype = numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': size})
+        if not count:
+            return numpy.zeros(0, dtype=dtype)
+        if meta.location == ON_DISK:
+            meta.dfd.flush()
+            data = MemoryMap(meta.dfd.fileno(), 0, access=ACCESS_READ)
+            offset = header.start + start * size
+        else:
+            data = b''.join([to_bytes(r._data) for r in self._table[start:stop]])
+            offset = 0
+        return numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+    def column(self, name, start=0, stop=None, as_type=list):
+        """
+        returns the values of field name for records start through stop, decoded
+        directly from the record data; see columns() for as_type
+        """
+        return self.columns([name], start, stop, as_type)[0]
+
+    def columns(self, names, start=0, stop=None, as_type=list):
+        """
+        returns a list with the values of each field in names for records start
+        through stop, decoded directly from the record data (no Records are created);
+        as_type is applied to each column: list, tuple, array (typecode picked from
+        the field type), numpy.ndarray (if NumPy is installed), or any callable that
+        accepts an iterable
+        """
+        meta = self._meta
+        if meta.status == CLOSED:
+            raise DbfError('%s is closed' % meta.filename)
+        names = self._list_fields(names)
+        size = meta.header.record_length
+        memo = meta.memo
+        decoder = meta.decoder
+        null_start = None
+        if '_NULLFLAGS' in meta:
+            null_start = meta['_NULLFLAGS'][START]
+        decoders = []
+        typecodes = []
+        for name in names:
+            name = name.upper()
+            if name not in meta.user_fields:
+                raise FieldMissingError(name)
+            fielddef = meta[name]
+            field_type = fielddef[TYPE]
+            cls = fielddef[CLASS]
+            if field_type in (INTEGER, ) and cls in (int, 'default'):
+                typecodes.append('i')
+            elif field_type in (DOUBLE, CURRENCY) or field_type in meta.numeric_types and fielddef[DECIMALS]:
+                typecodes.append('d')
+            elif field_type in meta.numeric_types:
+                typecodes.append('q')
+            else:
+                typecodes.append(None)
+            nullable = None
+            if fielddef[FLAGS] & NULLABLE and null_start is not None:
+                byte, bit = divmod(fielddef[NUL], 8)
+                nullable = null_start + byte, 1 << bit
+            if (field_type, cls) in ((INTEGER, int), (INTEGER, 'default'), (DOUBLE, float), (DOUBLE, 'default')) and nullable is None:
+                # fixed-width binary -- unpack straight from the raw data
+                decoders.append((struct.Struct(('<i', '<d')[field_type == DOUBLE]), fielddef[START], None, None, None))
+            else:
+                retrieve = meta.fieldtypes[field_type]['Retrieve']
+                decoders.append((None, fielddef[START], fielddef, retrieve, nullable))
+        columns = [[] for name in names]
+        for first, data in self._raw_blocks(start, stop):
+            length = len(data) - len(data) % size
+            rows = None
+            for (unpacker, offset, fielddef, retrieve, nullable), values in zip(decoders, columns):
+                if unpacker is not None:
+                    unpack_from = unpacker.unpack_from
+                    values.extend([unpack_from(data, o)[0] for o in range(offset, length, size)])
+                    continue
+                if rows is None:
+                    rows = array('B', data[:length])
+                end = offset + fielddef[LENGTH]
+                for o in range(0, length, size):
+                    if nullable is not None and rows[o + nullable[0]] & nullable[1]:
+                        values.append(Null)
+                    else:
+                        values.append(retrieve(rows[o+offset:o+end], fielddef, memo, decoder))
+        results = []
+        for name, typecode, values in zip(names, typecodes, columns):
+            if as_type is array or numpy is not None and as_type is numpy.ndarray:
+                if typecode is None:
+                    raise DbfError("field %s has no %s equivalent" % (name, as_type.__name__))
+                if any(v is None or v is Null for v in values):
+                    raise DbfError("field %s has empty or null values and cannot be stored in %s" % (name, as_type.__name__))
+                if as_type is array:
+                    if typecode == 'q' and py_ver < (3, 3):
+                        typecode = 'l'
+                    values = array(typecode, values)
+                else:
+                    values = numpy.array(values, dtype=typecode)
+            elif as_type is not list:
+                values = as_type(values)
+            results.append(values)
+        return results
+
     def create_backup(self, new_name=None, on_disk=None):
         """
         creates a backup table
+
+        a disk backup of a disk table is a straight copy of the table and memo
+        files unless its layout would differ from the original's, in which case
+        the records are copied one by one
         """
         meta = self._meta
         already_open = meta.status != CLOSED
@@ -5982,23 +7009,64 @@ class Table(_Navigation):
         # use same encoder/decoder as current table, which may have been overridden
         bkup._meta.encoder = self._meta.encoder
         bkup._meta.decoder = self._meta.decoder
-        bkup.open(READ_WRITE)
-        for record in self:
-            bkup.append(record)
-        bkup.close()
+        header, bkup_header = meta.header, bkup._meta.header
+        if (
+                meta.location == ON_DISK and bkup._meta.location == ON_DISK
+                and header.version == bkup_header.version
+                and header.start == bkup_header.start
+                and header.record_length == bkup_header.record_length
+                and header.fields == bkup_header.fields
+                and header.codepage() == bkup_header.codepage()
+            ):
+            bkup.close()
+            if meta.memo is not None:
+                meta.memo.flush()
+            meta.dfd.flush()
+            shutil.copyfile(meta.filename, bkup._meta.filename)
+            if meta.memofields and os.path.exists(meta.memoname):
+                if meta.mfd is not None:
+                    meta.mfd.flush()
+                shutil.copyfile(meta.memoname, bkup._meta.memoname)
+            bkup._meta.header.record_count = header.record_count
+        else:
+            bkup.open(READ_WRITE)
+            for record in self:
+                bkup.append(record)
+            bkup.close()
         self.backup = new_name
         if not already_open:
             self.close()
         return bkup
 
-    def create_index(self, key):
+    def create_hash_index(self, key):
+        """
+        creates an in-memory index using the function key that answers
+        equality lookups (search, [], in) without searching through the keys
+        """
+        meta = self._meta
+        if meta.status == CLOSED:
+            raise DbfError('%s is closed' % meta.filename)
+        return HashIndex(self, key)
+
+    def create_index(self, key, name=None, key_id=None):
         """
-        creates an in-memory index using the function key
+        creates an in-memory index using the function key; if name is given the
+        index is stored in the table's .pdx file instead, and an index already
+        stored there under that name is reused without scanning the table if
+        key_id matches the one it was built with (and rebuilt if not); key_id
+        defaults to the name and code of key, so give one if key is, say, a
+        callable object whose behaviour depends on its state
         """
         meta = self._meta
         if meta.status == CLOSED:
             raise DbfError('%s is closed' % meta.filename)
-        return Index(self, key)
+        if name is None:
+            return Index(self, key)
+        if meta.location == IN_MEMORY:
+            raise DbfError('persistent indices need a table on disk')
+        if meta.index_file is None:
+            meta.index_file = IndexFile(os.path.splitext(meta.filename)[0] + '.pdx')
+        return ContainedIndex(self, key, name, meta.index_file, key_id)
 
     def create_template(self, record=None, defaults=None):
         """
@@ -6006,6 +7074,16 @@ class Table(_Navigation):
         """
         return RecordTemplate(self._meta, original_record=record, defaults=defaults)
 
+    def deferred_indexes(self):
+        """
+        returns a context manager that holds back index maintenance: records
+        written inside it are noted, and when the outermost block exits each
+        index is brought up to date with all of them in one update (indices
+        are stale until then; closing the table inside the block brings them
+        up to date first)
+        """
+        return self._DeferredIndexes(self)
+
     def delete_fields(self, doomed):
         """
         removes field(s) from the table
@@ -6050,10 +7128,7 @@ class Table(_Navigation):
             if name not in meta.fields:
                 del meta[name]
         if old_table is not None:
-            old_table.open()
-            for record in old_table:
-                self.append(scatter(record), drop=True)
-            old_table.close()
+            self._migrate(old_table)
 
     def disallow_nulls(self, fields):
         """
@@ -6084,10 +7159,77 @@ class Table(_Navigation):
         self._build_header_fields()
         self._update_disk()
         if old_table is not None:
-            old_table.open()
-            for record in old_table:
-                self.append(scatter(record))
-            old_table.close()
+            self._migrate(old_table)
+
+    def extend(self, records, drop=False):
+        """
+        adds a record for each dict/tuple/record in records; the records are
+        encoded into one buffer and written read_ahead records at a time, with
+        the header and any indices updated once at the end
+        """
+        meta = self._meta
+        if meta.status != READ_WRITE:
+            raise DbfError('%s not in read/write mode, unable to append records' % meta.filename)
+        if not self.field_count:
+            raise DbfError("No fields defined, cannot append")
+        if meta.location == IN_MEMORY:
+            for data in records:
+                self.append(data, drop=drop)
+            return
+        header = meta.header
+        size = header.record_length
+        first = written = count = header.record_count
+        chunk = meta.read_ahead * size
+        encoder = meta.row_encoder
+        blank = bytearray(meta.blankrecord)
+        row = bytearray(blank)          # each row is encoded here, then copied to buffer
+        buffer = bytearray()
+        def write_rows(buffer, written):
+            if meta.memo is not None:
+                # the memos the rows point to go to disk before the rows do
+                meta.memo.flush()
+            meta.dfd.seek(header.start + written * size)
+            meta.dfd.write(buffer)
+        try:
+            for data in records:
+                if count == meta.max_records:
+                    raise DbfError("table %r is full; unable to add any more records" % self)
+                row[:] = blank
+                if isinstance(data, (Record, RecordTemplate)) and data._meta.record_sig[0] == meta.record_sig[0]:
+                    row[:] = data._data
+                    for field in meta.memofields:
+                        encoder.field(row, field, data[field], meta)
+                elif isinstance(data, tuple):
+                    if len(data) > self.field_count:
+                        raise DbfError("incoming data has too many values")
+                    encoder(row, tuple(ensure_unicode(item) for item in data), meta)
+                elif isinstance(data, dict):
+                    encoder(row, data, meta, drop=drop)
+                elif isinstance(data, (Record, RecordTemplate)):
+                    record = Record(recnum=-1, layout=meta)
+                    record._write_to_disk = False
+                    gather(record, data, drop=drop)
+                    for field, value in record._memos.items():
+                        record._update_field_value(field, value)
+                    row[:] = record._data
+                elif data:
+                    raise TypeError("data to append must be a tuple, dict, record, or template; not a %r" % type(data))
+                buffer.extend(row)
+                count += 1
+                if len(buffer) >= chunk:
+                    write_rows(buffer, written)
+                    written = count
+                    buffer = bytearray()
+        finally:
+            # rows before a failing one are kept (and indexed), as append() in
+            # a loop would have done
+            if buffer:
+                write_rows(buffer, written)
+            self._table.extend(count - first)
+            header.record_count = count
+            self._update_disk(headeronly=True)
+            if count > first:
+                self._indexen.update(self, range(first, count))
 
     def field_info(self, field):
         """
@@ -6119,6 +7261,50 @@ class Table(_Navigation):
         else:
             raise NotFoundError("dbf.Table.index(x): x not in table", data=record)
 
+    def iter_rows(self, fields=None, as_type='tuple', include_deleted=True, start=0, stop=None):
+        """
+        yields the values of fields (default: all) for records start through stop,
+        decoded directly from the record data (no Records are created or cached);
+        as_type is 'tuple', 'namedtuple' (attributes are the lower-cased field
+        names), or 'dict' (keys are the field names, as with scatter())
+        """
+        meta = self._meta
+        if meta.status == CLOSED:
+            raise DbfError('%s is closed' % meta.filename)
+        if as_type not in ('tuple', 'namedtuple', 'dict'):
+            raise DbfError("as_type must be 'tuple', 'namedtuple', or 'dict', not %r" % (as_type, ))
+        decoder = meta.row_decoder
+        if fields is not None:
+            decoder = decoder.subset(self._list_fields(fields))
+        size = meta.header.record_length
+        names = [field[0] for field in decoder.fields]
+        make_row = None
+        if as_type == 'namedtuple':
+            make_row = decoder.row_class()._make
+        for first, data in self._raw_blocks(start, stop):
+            data = array('B', data)
+            memo, codec = meta.memo, meta.decoder
+            for offset in range(0, len(data), size):
+                if not include_deleted and data[offset] == ASTERISK:
+                    continue
+                values = decoder(data, memo, codec, offset=offset)
+                if make_row is not None:
+                    values = make_row(values)
+                elif as_type == 'dict':
+                    values = dict(zip(names, values))
+                yield values
+
+    def memo_cache_info(self):
+        """
+        returns CacheInfo(hits, misses, maxsize, currsize) for the memo cache,
+        with the sizes in bytes (all zeros for tables without an on-disk memo file)
+        """
+        memo = self._meta.memo
+        if memo is None or self._meta.location == IN_MEMORY:
+            return CacheInfo(0, 0, 0, 0)
+        cache = memo.cache
+        return CacheInfo(cache.hits, cache.misses, cache.maxbytes, cache.bytes)
+
     def new(self, filename, field_specs=None, memo_size=None, ignore_memos=None, codepage=None, default_data_types=None, field_data_types=None, on_disk=True):
         """
         returns a new table of the same type
@@ -6152,22 +7338,30 @@ class Table(_Navigation):
             raise FieldMissingError(field)
         return bool(self._meta[field][FLAGS] & NULLABLE)
 
-    def open(self, mode=READ_ONLY):
+    def open(self, mode=READ_ONLY, mmap=None):
         """
         (re)opens disk table, (re)initializes data structures
+        mmap, if given, changes whether the table file is accessed through a memory map
         """
         if mode not in (READ_WRITE, READ_ONLY):
             raise DbfError("mode for open must be dbf.READ_ONLY or dbf.READ_WRITE, not %r" % mode)
         meta = self._meta
+        if mmap is not None and mmap != meta.memory_mapped:
+            if meta.status != CLOSED:
+                self.close()
+            meta.memory_mapped = mmap
         if meta.status == mode:
             return self     # no-op
         meta.status = mode
         if meta.location == IN_MEMORY:
             return self
-        if '_table' in dir(self):
+        if self.__dict__.get('_table') is not None:
             del self._table
         mode = ('rb', 'r+b')[meta.status is READ_WRITE]
+        _finish_pack(meta.filename, meta.memoname)
         dfd = meta.dfd = open(meta.filename, mode)
+        if meta.memory_mapped:
+            dfd = meta.dfd = _MappedFile(dfd, writable=meta.status is READ_WRITE)
         dfd.seek(0)
         header = meta.header = self._TableHeader(dfd.read(32), self._pack_date, self._unpack_date)
         if not header.version in self._supported_tables:
@@ -6192,35 +7386,133 @@ class Table(_Navigation):
         dfd.seek(0)
         return self
 
-    def pack(self):
+    def pack(self, memos=False):
         """
-        physically removes all deleted records
+        physically removes all deleted records; if memos, the memo file is
+        compacted as well (see pack_memos)
         """
         meta = self._meta
         if meta.status != READ_WRITE:
             raise DbfError('%s not in read/write mode, unable to pack records' % meta.filename)
         for dbfindex in self._indexen:
             dbfindex._clear()
-        newtable = []
-        index = 0
-        for record in self._table:
-            if is_deleted(record):
-                record._recnum = -1
-            else:
-                record._recnum = index
-                newtable.append(record)
-                index += 1
         if meta.location == ON_DISK:
-            self._table.clear()
+            index = self._pack_disk()
         else:
-            self._table[:] = []
-        for record in newtable:
-            self._table.append(record)
+            newtable = []
+            index = 0
+            for record in self._table:
+                if is_deleted(record):
+                    record._recnum = -1
+                else:
+                    record._recnum = index
+                    newtable.append(record)
+                    index += 1
+            self._table[:] = newtable
         self._pack_count += 1
         self._meta.header.record_count = index
         self._index = -1
-        self._update_disk()
+        self._update_disk(headeronly=True)
         self.reindex()
+        if memos:
+            self.pack_memos()
+
+    def pack_memos(self):
+        """
+        copies the memos still referenced by records into a new memo file that
+        replaces the old one, recovering the space held by replaced memos and
+        by memos of packed records
+
+        the new memo file and a copy of the table with the new block numbers
+        are written and synced first, and only then renamed over the old
+        files, so a failure before that leaves the table as it was; the two
+        renames are not one atomic step, but a crash between them is detected
+        from the .pack file left behind and completed the next time the table
+        is opened
+        """
+        meta = self._meta
+        if meta.status != READ_WRITE:
+            raise DbfError('%s not in read/write mode, unable to pack memos' % meta.filename)
+        if not meta.memofields:
+            return
+        if meta.ignorememos:
+            raise DbfError('Memos are being ignored, unable to pack')
+        pointers = []
+        for name in meta.memofields:
+            fielddef = meta[name]
+            # VFP stores block numbers as binary integers, the others as text
+            pointers.append((fielddef[START], fielddef[END], fielddef[LENGTH] == 4))
+        def block_at(data, start, end, binary):
+            if binary:
+                return struct.unpack('<i', to_bytes(data[start:end]))[0]
+            return int(to_bytes(data[start:end]).strip() or 0)
+        def remap(data, offset):
+            for start, end, binary in pointers:
+                start += offset
+                end += offset
+                block = block_at(data, start, end, binary)
+                new = mapping.get(block, block)
+                if new != block:
+                    if binary:
+                        new = struct.pack('<i', new)
+                    else:
+                        new = ("%*s" % (end - start, new)).encode('ascii')
+                    if isinstance(data, array):
+                        new = array('B', new)
+                    data[start:end] = new
+        header = meta.header
+        size = header.record_length
+        if meta.location == ON_DISK:
+            # no record may be in the middle of changes
+            self._table.flush()
+            self._update_disk(headeronly=True)
+        blocks = []
+        for first, data in self._raw_blocks():
+            for offset in range(0, len(data), size):
+                for start, end, binary in pointers:
+                    blocks.append(block_at(data, offset+start, offset+end, binary))
+        mapping = meta.memo.pack(blocks)
+        if meta.location == IN_MEMORY:
+            for record in self._table:
+                remap(record._data, 0)
+            return
+        packname = meta.filename + '.pack'
+        end = header.start + len(self) * size
+        try:
+            new = open(packname, 'wb')
+            try:
+                new.write(_read_at(meta.dfd, 0, header.start))
+                for first, data in self._raw_blocks():
+                    data = bytearray(data)
+                    for offset in range(0, len(data), size):
+                        remap(data, offset)
+                    new.write(bytes(data))
+                new.write(_read_at(meta.dfd, end, os.fstat(meta.dfd.fileno()).st_size - end))
+                new.flush()
+                os.fsync(new.fileno())
+            finally:
+                new.close()
+        except Exception:
+            # the table's .pack file goes first, as on its own it would be
+            # taken for a complete one by _finish_pack
+            if os.path.exists(packname):
+                os.remove(packname)
+            meta.memo.abandon()
+            raise
+        # both files are complete on disk; the memo file is swapped in first
+        # so that _finish_pack can tell how far a crash got
+        meta.memo.swap()
+        meta.dfd.close()
+        _replace_file(packname, meta.filename)
+        meta.dfd = open(meta.filename, 'r+b')
+        if meta.memory_mapped:
+            meta.dfd = _MappedFile(meta.dfd, writable=True)
+        # records already in memory get the new block numbers as well
+        self._table.drop_buffer()
+        for ref in list(self._table._weakref_list.values()):
+            record = ref()
+            if record is not None:
+                remap(record._data, 0)
 
     def query(self, criteria):
         """
@@ -6241,6 +7533,8 @@ class Table(_Navigation):
             raise DbfError('%s is closed' % meta.filename)
         for dbfindex in self._indexen:
             dbfindex._reindex()
+        # every index is current again
+        self._indexen.dirty.clear()
 
     def rename_field(self, oldname, newname):
         """
@@ -6302,10 +7596,7 @@ class Table(_Navigation):
             new_struct.append(' '.join([name, spec]))
         self.add_fields(';'.join(new_struct))
         if old_table is not None:
-            old_table.open()
-            for record in old_table:
-                self.append(scatter(record), drop=True)
-            old_table.close()
+            self._migrate(old_table)
 
     def structure(self, fields=None):
         """
@@ -6333,7 +7624,7 @@ class Table(_Navigation):
         else:
             self._table.clear()
             if meta.memo:
-                meta.memo._zap()
+                meta.memo.zap()
         meta.header.record_count = 0
         self._index = -1
         self._update_disk()
@@ -7445,17 +8736,7 @@ class Index(_Navigation):
         self.__doc__ = key.__doc__ or 'unknown'
         self._key = key
         self._previous_status = []
-        for record in table:
-            value = key(record)
-            if value is DoNotIndex:
-                continue
-            rec_num = recno(record)
-            if not isinstance(value, tuple):
-                value = (value, )
-            vindex = bisect_right(self._values, value)
-            self._values.insert(vindex, value)
-            self._rec_by_val.insert(vindex, rec_num)
-            self._records[rec_num] = value
+        self._build(table)
         table._indexen.add(self)
 
     def __call__(self, record):
@@ -7464,17 +8745,17 @@ class Index(_Navigation):
         if rec_num in self._records:
             if self._records[rec_num] == key:
                 return
-            old_key = self._records[rec_num]
-            vindex = bisect_left(self._values, old_key)
-            self._values.pop(vindex)
-            self._rec_by_val.pop(vindex)
-            del self._records[rec_num]
-            assert rec_num not in self._records
+            self._purge(rec_num)
         if key == (DoNotIndex, ):
             return
-        vindex = bisect_right(self._values, key)
-        self._values.insert(vindex, key)
-        self._rec_by_val.insert(vindex, rec_num)
+        if self._values and key < self._values[-1]:
+            vindex = bisect_right(self._values, key)
+            self._values.insert(vindex, key)
+            self._rec_by_val.insert(vindex, rec_num)
+        else:
+            # keys arriving in order just go on the end
+            self._values.append(key)
+            self._rec_by_val.append(rec_num)
         self._records[rec_num] = key
 
     def __contains__(self, data):
@@ -7542,6 +8823,21 @@ class Index(_Navigation):
     def __len__(self):
         return len(self._records)
 
+    def _build(self, records):
+        """
+        indexes records (into an empty index) with a single sort
+        """
+        key = self.key
+        pairs = []
+        for record in records:
+            value = key(record)
+            if value == (DoNotIndex, ):
+                continue
+            pairs.append((value, recno(record)))
+        # stable, so equal keys stay in record order
+        pairs.sort(key=lambda pair: pair[0])
+        self._set(pairs)
+
     def _clear(self):
         """
         removes all entries from index
@@ -7575,7 +8871,11 @@ class Index(_Navigation):
     def _purge(self, rec_num):
         value = self._records.get(rec_num)
         if value is not None:
-            vindex = bisect_left(self._values, value)
+            # equal values are kept in the order they were added, so look for
+            # rec_num among all of them
+            lo = bisect_left(self._values, value)
+            hi = bisect_right(self._values, value, lo)
+            vindex = self._rec_by_val.index(rec_num, lo, hi)
             del self._records[rec_num]
             self._values.pop(vindex)
             self._rec_by_val.pop(vindex)
@@ -7584,8 +8884,8 @@ class Index(_Navigation):
         """
         reindexes all records
         """
-        for record in self._table:
-            self(record)
+        self._clear()
+        self._build(self._table)
 
     def _search(self, match, lo=0, hi=None, where=None):
         if hi is None:
@@ -7595,6 +8895,15 @@ class Index(_Navigation):
         elif where == 'right':
             return bisect_right(self._values, match, lo, hi)
 
+    def _set(self, pairs):
+        """
+        replaces the index contents with pairs, a sorted list of (value, record number)
+        """
+        self._values[:] = [pair[0] for pair in pairs]
+        self._rec_by_val[:] = [pair[1] for pair in pairs]
+        self._records.clear()
+        self._records.update((rec_num, value) for value, rec_num in pairs)
+
     def index(self, record, start=None, stop=None):
         """
         returns the index of record between start and stop
@@ -7675,57 +8984,217 @@ class Index(_Navigation):
                 loc += 1
         return result
 
+    def update(self, records):
+        """
+        updates the index for many (new or changed) records, merging them in
+        with a single pass instead of one insert per record
+        """
+        key = self.key
+        changed = {}
+        for record in records:
+            rec_num = recno(record)
+            value = key(record)
+            if value == self._records.get(rec_num, (DoNotIndex, )):
+                changed.pop(rec_num, None)
+            else:
+                changed[rec_num] = value
+        if not changed:
+            return
+        pairs = [
+                (value, rec_num)
+                for value, rec_num in zip(self._values, self._rec_by_val)
+                if rec_num not in changed
+                ]
+        new = [(changed[rec_num], rec_num) for rec_num in sorted(changed) if changed[rec_num] != (DoNotIndex, )]
+        new.sort(key=lambda pair: pair[0])
+        # both runs are already sorted, so this sort is a merge
+        pairs.extend(new)
+        pairs.sort(key=lambda pair: pair[0])
+        self._set(pairs)
+
 
-class Relation(object):
+class HashIndex(Index):
     """
-    establishes a relation between two dbf tables (not persistent)
+    non-persistent index for equality lookups: a dict of key values to record
+    numbers, so lookups and updates do not depend on the size of the table;
+    positions (and iteration) follow record order, not key order
     """
 
-    relations = {}
+    def __init__(self, table, key):
+        self._table = table
+        self._buckets = {}            # values:set of record numbers
+        self._records = {}            # record numbers:values
+        self._positions = None        # indexed record numbers in order, when needed
+        self.__doc__ = key.__doc__ or 'unknown'
+        self._key = key
+        self._previous_status = []
+        self._build(table)
+        table._indexen.add(self)
 
-    def __new__(cls, src, tgt, src_names=None, tgt_names=None):
-        if (len(src) != 2 or  len(tgt) != 2):
-            raise DbfError("Relation should be called with ((src_table, src_field), (tgt_table, tgt_field))")
-        if src_names and len(src_names) !=2 or tgt_names and len(tgt_names) != 2:
-            raise DbfError('src_names and tgt_names, if specified, must be ("table","field")')
-        src_table, src_field = src
-        tgt_table, tgt_field = tgt
+    def __call__(self, record):
+        rec_num = recno(record)
+        key = self.key(record)
+        old_key = self._records.get(rec_num)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._purge(rec_num)
+        if key == (DoNotIndex, ):
+            return
+        self._buckets.setdefault(key, set()).add(rec_num)
+        self._records[rec_num] = key
+        self._positions = None
+
+    def __contains__(self, data):
+        if not isinstance(data, (Record, RecordTemplate, tuple, dict)):
+            raise TypeError("%r is not a record, templace, tuple, nor dict" % (data, ))
         try:
-            if isinstance(src_field, baseinteger):
-                table, field = src_table, src_field
-                src_field = table.field_names[field]
-            else:
-                src_table.field_names.index(src_field)
-            if isinstance(tgt_field, baseinteger):
-                table, field = tgt_table, tgt_field
-                tgt_field = table.field_names[field]
-            else:
-                tgt_table.field_names.index(tgt_field)
-        except (IndexError, ValueError):
-            raise DbfError('%r not in %r' % (field, table)).from_exc(None)
-        if src_names:
-            src_table_name, src_field_name = src_names
-        else:
-            src_table_name, src_field_name = src_table.filename, src_field
-            if src_table_name[-4:].lower() == '.dbf':
-                src_table_name = src_table_name[:-4]
-        if tgt_names:
-            tgt_table_name, tgt_field_name = tgt_names
-        else:
-            tgt_table_name, tgt_field_name = tgt_table.filename, tgt_field
-            if tgt_table_name[-4:].lower() == '.dbf':
-                tgt_table_name = tgt_table_name[:-4]
-        relation = cls.relations.get(((src_table, src_field), (tgt_table, tgt_field)))
-        if relation is not None:
-            return relation
-        obj = object.__new__(cls)
-        obj._src_table, obj._src_field = src_table, src_field
-        obj._tgt_table, obj._tgt_field = tgt_table, tgt_field
-        obj._src_table_name, obj._src_field_name = src_table_name, src_field_name
-        obj._tgt_table_name, obj._tgt_field_name = tgt_table_name, tgt_field_name
-        obj._tables = dict()
-        cls.relations[((src_table, src_field), (tgt_table, tgt_field))] = obj
-        return obj
+            value = self.key(data)
+            return value in self._buckets
+        except Exception:
+            for record in self:
+                if record == data:
+                    return True
+            return False
+
+    def __getitem__(self, key):
+        '''if key is an integer, returns the matching record;
+        if key is a [slice | string | tuple | record] returns a List;
+        raises NotFoundError on failure'''
+        if isinstance(key, (baseinteger, slice)):
+            if self._positions is None:
+                self._positions = sorted(self._records)
+            if isinstance(key, baseinteger):
+                count = len(self._positions)
+                if not -count <= key < count:
+                    raise NotFoundError("Record %d is not in list." % key)
+                return self._table[self._positions[key]]
+            return self._list(self._positions[key])
+        elif isinstance (key, (basestring, tuple, Record, RecordTemplate)):
+            if isinstance(key, (Record, RecordTemplate)):
+                key = self.key(key)
+            elif isinstance(key, basestring):
+                key = (key, )
+            if key not in self._buckets:
+                raise NotFoundError(key)
+            return self._list(sorted(self._buckets[key]), desc='match = %r' % (key, ))
+        else:
+            raise TypeError('indices must be integers, match objects must by strings or tuples')
+
+    def _build(self, records):
+        """
+        indexes records (into an empty index)
+        """
+        for record in records:
+            self(record)
+
+    def _clear(self):
+        """
+        removes all entries from index
+        """
+        self._buckets.clear()
+        self._records.clear()
+        self._positions = None
+
+    def _list(self, rec_nums, desc=None):
+        """
+        returns a List of the records at rec_nums
+        """
+        result = List(desc=desc)
+        for rec_num in rec_nums:
+            record = self._table[rec_num]
+            result._maybe_add(item=(self._table, rec_num, result.key(record)))
+        return result
+
+    def _purge(self, rec_num):
+        value = self._records.pop(rec_num, None)
+        if value is not None:
+            bucket = self._buckets[value]
+            bucket.discard(rec_num)
+            if not bucket:
+                del self._buckets[value]
+            self._positions = None
+
+    def index_search(self, match, start=None, stop=None, nearest=False, partial=False):
+        """
+        not available: a hash index has no key order (see search)
+        """
+        raise DbfError('hash indices are not in key order; use search()')
+
+    def search(self, match, partial=False):
+        """
+        returns dbf.List of all (partially) matching records; partial matches
+        check every key value
+        """
+        self._nav_check()
+        if not isinstance(match, tuple):
+            match = (match, )
+        if not partial:
+            return self._list(sorted(self._buckets.get(match, ())))
+        rec_nums = []
+        for value, bucket in self._buckets.items():
+            if self._partial_match(value, match):
+                rec_nums.extend(bucket)
+        return self._list(sorted(rec_nums))
+
+    def update(self, records):
+        """
+        updates the index for many (new or changed) records
+        """
+        for record in records:
+            self(record)
+
+
+class Relation(object):
+    """
+    establishes a relation between two dbf tables (not persistent)
+    """
+
+    relations = {}
+
+    def __new__(cls, src, tgt, src_names=None, tgt_names=None):
+        if (len(src) != 2 or  len(tgt) != 2):
+            raise DbfError("Relation should be called with ((src_table, src_field), (tgt_table, tgt_field))")
+        if src_names and len(src_names) !=2 or tgt_names and len(tgt_names) != 2:
+            raise DbfError('src_names and tgt_names, if specified, must be ("table","field")')
+        src_table, src_field = src
+        tgt_table, tgt_field = tgt
+        try:
+            if isinstance(src_field, baseinteger):
+                table, field = src_table, src_field
+                src_field = table.field_names[field]
+            else:
+                src_table.field_names.index(src_field)
+            if isinstance(tgt_field, baseinteger):
+                table, field = tgt_table, tgt_field
+                tgt_field = table.field_names[field]
+            else:
+                tgt_table.field_names.index(tgt_field)
+        except (IndexError, ValueError):
+            raise DbfError('%r not in %r' % (field, table)).from_exc(None)
+        if src_names:
+            src_table_name, src_field_name = src_names
+        else:
+            src_table_name, src_field_name = src_table.filename, src_field
+            if src_table_name[-4:].lower() == '.dbf':
+                src_table_name = src_table_name[:-4]
+        if tgt_names:
+            tgt_table_name, tgt_field_name = tgt_names
+        else:
+            tgt_table_name, tgt_field_name = tgt_table.filename, tgt_field
+            if tgt_table_name[-4:].lower() == '.dbf':
+                tgt_table_name = tgt_table_name[:-4]
+        relation = cls.relations.get(((src_table, src_field), (tgt_table, tgt_field)))
+        if relation is not None:
+            return relation
+        obj = object.__new__(cls)
+        obj._src_table, obj._src_field = src_table, src_field
+        obj._tgt_table, obj._tgt_field = tgt_table, tgt_field
+        obj._src_table_name, obj._src_field_name = src_table_name, src_field_name
+        obj._tgt_table_name, obj._tgt_field_name = tgt_table_name, tgt_field_name
+        obj._tables = dict()
+        cls.relations[((src_table, src_field), (tgt_table, tgt_field))] = obj
+        return obj
 
     def __eq__(yo, other):
         if (yo.src_table == other.src_table
@@ -7826,8 +9295,926 @@ class Relation(object):
             raise NotFoundError("table %s not in relation" % table).from_exc(None)
 
 
-class IndexFile(_Navigation):
-    pass
+def _key_id(key):
+    """
+    returns a string identifying the key function of a persistent index: its
+    qualified name and, for Python functions, its code
+    """
+    name = getattr(key, '__qualname__', None) or getattr(key, '__name__', None) or type(key).__name__
+    parts = ['%s.%s' % (getattr(key, '__module__', None), name)]
+    code = getattr(key, '__code__', None)
+    while code is not None:
+        # nested code objects (in co_consts) are compared by their own code
+        parts.extend([repr(code.co_code), repr(code.co_names)])
+        parts.extend(repr(c) for c in code.co_consts if not hasattr(c, 'co_code'))
+        nested = [c for c in code.co_consts if hasattr(c, 'co_code')]
+        code = nested[0] if nested else None
+    return '\x00'.join(parts)
+
+def _pack_key(value):
+    """
+    returns value (an index entry, or any part of one) as tagged bytes
+    """
+    if value is None:
+        return b'N'
+    elif value is Null:
+        return b'n'
+    elif isinstance(value, Logical):
+        return b'L' + (b'F', b'T', b'?')[(False, True, None).index(value.value)]
+    elif isinstance(value, bool):
+        return (b'F', b'T')[value]
+    elif isinstance(value, baseinteger):
+        if -2**63 <= value < 2**63:
+            return b'i' + struct.pack('<q', value)
+        return b'I' + _pack_key(str(value).encode('ascii'))[1:]
+    elif isinstance(value, float):
+        return b'f' + struct.pack('<d', value)
+    elif isinstance(value, decimal.Decimal):
+        return b'x' + _pack_key(str(value).encode('ascii'))[1:]
+    elif isinstance(value, Char):
+        return b'c' + _pack_key(unicode(value))[1:]
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+        return b'u' + struct.pack('<L', len(value)) + value
+    elif isinstance(value, bytes):
+        return b'b' + struct.pack('<L', len(value)) + value
+    elif isinstance(value, Date):
+        if not value:
+            return b'E'
+        return b'D' + struct.pack('<L', value.toordinal())
+    elif isinstance(value, DateTime):
+        if not value:
+            return b'W'
+        return b'M' + _pack_key(value._datetime)[1:]
+    elif isinstance(value, Time):
+        if not value:
+            return b'J'
+        return b'K' + _pack_key(value._time)[1:]
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            raise DbfError("unable to index time zone aware %r" % (value, ))
+        return b'm' + struct.pack(
+                '<LLL',
+                value.toordinal(),
+                value.hour * 3600 + value.minute * 60 + value.second,
+                value.microsecond,
+                )
+    elif isinstance(value, datetime.date):
+        return b'd' + struct.pack('<L', value.toordinal())
+    elif isinstance(value, datetime.time):
+        if value.tzinfo is not None:
+            raise DbfError("unable to index time zone aware %r" % (value, ))
+        return b'k' + struct.pack('<LL', value.hour * 3600 + value.minute * 60 + value.second, value.microsecond)
+    elif isinstance(value, (tuple, list)):
+        return (b'(', b'[')[isinstance(value, list)] + struct.pack('<L', len(value)) + b''.join(_pack_key(v) for v in value)
+    raise DbfError("unable to store %r (%s) in an index file" % (value, type(value).__name__))
+
+def _unpack_key(data, offset):
+    """
+    returns (value, next offset) for the tagged value at offset in data
+    """
+    def unpack(format):
+        values = struct.unpack_from(format, data, offset + 1)
+        return values, offset + 1 + struct.calcsize(format)
+    tag = data[offset:offset+1]
+    if tag in (b'N', b'n', b'F', b'T', b'E', b'W', b'J'):
+        value = {
+                b'N': None, b'n': Null, b'F': False, b'T': True,
+                b'E': Date(), b'W': DateTime(), b'J': Time(),
+                }[tag]
+        return value, offset + 1
+    elif tag == b'L':
+        value = {b'F': False, b'T': True, b'?': None}[data[offset+1:offset+2]]
+        return Logical(value), offset + 2
+    elif tag == b'i':
+        (value, ), offset = unpack('<q')
+        return value, offset
+    elif tag == b'f':
+        (value, ), offset = unpack('<d')
+        return value, offset
+    elif tag in (b'I', b'x', b'c', b'u', b'b'):
+        (length, ), offset = unpack('<L')
+        value = data[offset:offset+length]
+        if len(value) != length:
+            raise BadDataError("index entry truncated")
+        offset += length
+        if tag == b'I':
+            return int(value.decode('ascii')), offset
+        elif tag == b'x':
+            return Decimal(value.decode('ascii')), offset
+        elif tag == b'b':
+            return bytes(value), offset
+        value = value.decode('utf-8')
+        if tag == b'c':
+            value = Char(value)
+        return value, offset
+    elif tag in (b'd', b'D'):
+        (ordinal, ), offset = unpack('<L')
+        value = datetime.date.fromordinal(ordinal)
+        if tag == b'D':
+            value = Date(value)
+        return value, offset
+    elif tag in (b'm', b'M'):
+        (ordinal, seconds, microseconds), offset = unpack('<LLL')
+        value = datetime.datetime.combine(
+                datetime.date.fromordinal(ordinal),
+                datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60, microseconds),
+                )
+        if tag == b'M':
+            value = DateTime(value)
+        return value, offset
+    elif tag in (b'k', b'K'):
+        (seconds, microseconds), offset = unpack('<LL')
+        value = datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60, microseconds)
+        if tag == b'K':
+            value = Time(value)
+        return value, offset
+    elif tag in (b'(', b'['):
+        (length, ), offset = unpack('<L')
+        value = []
+        for i in range(length):
+            item, offset = _unpack_key(data, offset)
+            value.append(item)
+        if tag == b'(':
+            value = tuple(value)
+        return value, offset
+    raise BadDataError("unknown index entry type %r" % (tag, ))
+
+
+class IndexFile(object):
+    """
+    a .pdx file, holding any number of named, persistent B-tree indices for
+    one table
+
+    the file is a sequence of blocks; block 0 starts with the signature, the
+    next directory block, and the first free block, followed by directory
+    entries of (name, key tree root, record tree root, record count, table
+    size, table modification time, key checksum); every other block is a
+    directory continuation, a tree node, or a free block
+
+    the table size and time are those of the .dbf when the index was last
+    known to match it, or zero while it is open for writing
+
+    tree nodes hold their entries as tagged bytes (see _pack_key), so only
+    None, Null, numbers, strings, and the date, time, and logical types can
+    be indexed; entries are limited to max_entry bytes
+    """
+
+    signature = b'\xea\xaf\x37\xbf'
+    block_size = 4096
+    max_entry = block_size // 4
+    entry = struct.Struct('<16sLLLQQL')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.nodes = LruCache(maxsize=512)
+        self.directory = {}     # name: [directory block, offset, key root, record root, record count, size, mtime, key checksum]
+        self._fd = None
+        self.fd
+
+    @property
+    def fd(self):
+        """
+        the open index file (reopened, and the directory reread, after close())
+        """
+        if self._fd is None:
+            if not os.path.exists(self.filename):
+                fd = open(self.filename, 'w+b')
+                fd.write(self.signature + b'\x00' * (self.block_size - 4))
+                fd.flush()
+            else:
+                try:
+                    fd = open(self.filename, 'r+b')
+                except (IOError, OSError):
+                    # read-only file (or file system)
+                    fd = open(self.filename, 'rb')
+            self._fd = fd
+            self._read_directory()
+        return self._fd
+
+    def _read_directory(self):
+        fd = self._fd
+        data = _read_at(fd, 0, self.block_size)
+        if data[:4] != self.signature:
+            self._fd = None
+            fd.close()
+            raise DbfError("wrong signature -- unable to use index file %r" % self.filename)
+        next_block, self.free = struct.unpack('<LL', data[4:12])
+        self.directory_blocks = [(0, 12)]
+        self._read_entries(0, 12, data)
+        while next_block:
+            block = next_block
+            data = _read_at(fd, block * self.block_size, self.block_size)
+            next_block = struct.unpack('<L', data[:4])[0]
+            self.directory_blocks.append((block, 4))
+            self._read_entries(block, 4, data)
+
+    def _read_entries(self, block, start, data):
+        size = self.entry.size
+        for i in range((self.block_size - 12) // self.entry.size):
+            offset = start + i * size
+            name, key_root, record_root, records, table_size, mtime, key_id = self.entry.unpack(data[offset:offset+size])
+            name = name.rstrip(b'\x00')
+            if name:
+                self.directory[name.decode('ascii')] = [block, offset, key_root, record_root, records, table_size, mtime, key_id]
+
+    def _write(self, offset, data):
+        fd = self.fd
+        fd.seek(offset)
+        fd.write(data)
+
+    def _write_free(self):
+        self._write(8, struct.pack('<L', self.free))
+
+    def allocate(self):
+        """
+        returns an unused block, from the free block chain if possible
+        """
+        block = self.free
+        if block:
+            self.free = struct.unpack('<L', _read_at(self.fd, block * self.block_size + 4, 4))[0]
+            self._write_free()
+        else:
+            fd = self.fd
+            fd.seek(0, SEEK_END)
+            block = fd.tell() // self.block_size
+            fd.write(b'\x00' * self.block_size)
+        return block
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        # the file may change before it is reopened
+        self.nodes.clear()
+        self.directory.clear()
+
+    def flush(self):
+        if self._fd is not None:
+            self._fd.flush()
+
+    def read_node(self, block):
+        """
+        returns the _BTreeNode stored in block
+        """
+        node = self.nodes.get(block)
+        if node is None:
+            data = _read_at(self.fd, block * self.block_size, self.block_size)
+            length = struct.unpack('<L', data[:4])[0]
+            if not length or length > self.block_size - 4:
+                raise BadDataError("block %d of %r is not a node" % (block, self.filename))
+            try:
+                node = _BTreeNode.loads(data[4:4+length])
+            except (struct.error, KeyError, ValueError, OverflowError, RuntimeError) as exc:
+                raise BadDataError("block %d of %r is corrupt: %s" % (block, self.filename, exc))
+            self.nodes[block] = node
+        return node
+
+    def release(self, block):
+        """
+        adds block to the free block chain
+        """
+        self.nodes.pop(block)
+        self._write(block * self.block_size, struct.pack('<LL', 0, self.free))
+        self.free = block
+        self._write_free()
+
+    def remove(self, name):
+        """
+        removes index name from the directory (its nodes must already be released)
+        """
+        block, offset = self.directory.pop(name)[:2]
+        self._write(block * self.block_size + offset, b'\x00' * self.entry.size)
+
+    def save(self, name, key_root, record_root, records, stamp=(0, 0), key_id=0):
+        """
+        stores the directory entry for index name; stamp is the (size, mtime)
+        of the table it matches, and key_id the checksum of its key function
+        """
+        entry = self.directory.get(name)
+        if entry is None:
+            used = set((e[0], e[1]) for e in self.directory.values())
+            for block, start in self.directory_blocks:
+                for i in range((self.block_size - 12) // self.entry.size):
+                    if (block, start + i * self.entry.size) not in used:
+                        entry = [block, start + i * self.entry.size, 0, 0, 0, 0, 0, 0]
+                        break
+                if entry is not None:
+                    break
+            else:
+                last = self.directory_blocks[-1][0]
+                block = self.allocate()
+                self._write(block * self.block_size, b'\x00' * self.block_size)
+                self._write(last * self.block_size + (4 if last else 0), struct.pack('<L', block))
+                self.directory_blocks.append((block, 4))
+                entry = [block, 4, 0, 0, 0, 0, 0, 0]
+            self.directory[name] = entry
+        elif entry[2:] == [key_root, record_root, records] + list(stamp) + [key_id]:
+            return
+        entry[2:] = [key_root, record_root, records] + list(stamp) + [key_id]
+        self._write(
+                entry[0] * self.block_size + entry[1],
+                self.entry.pack(name.encode('ascii'), key_root, record_root, records, stamp[0], stamp[1], key_id),
+                )
+
+    def write_node(self, block, node):
+        """
+        stores node in block; raises DbfError if it does not fit
+        """
+        data = node.dumps()
+        if len(data) > self.block_size - 4:
+            raise DbfError("index node too large for block")
+        self._write(block * self.block_size, struct.pack('<L', len(data)) + data)
+        self.nodes[block] = node
+
+
+class _BTreeNode(object):
+    """
+    one node of a _BTree; leaves hold sorted entries and their neighbours,
+    interior nodes hold the first entry of each child after the first, the
+    children, and the number of entries under each child
+    """
+
+    __slots__ = ('leaf', 'items', 'children', 'counts', 'left', 'right')
+    header = struct.Struct('<BLLLL')     # leaf, item count, child count, left, right
+
+    def __init__(self, leaf, items, children=None, counts=None, left=0, right=0):
+        self.leaf = leaf
+        self.items = items
+        self.children = children or []
+        self.counts = counts or []
+        self.left = left
+        self.right = right
+
+    def __len__(self):
+        if self.leaf:
+            return len(self.items)
+        return sum(self.counts)
+
+    def dumps(self):
+        return b''.join(
+                [self.header.pack(self.leaf, len(self.items), len(self.children), self.left, self.right)]
+                + [_pack_key(item) for item in self.items]
+                + [struct.pack('<%dL' % len(self.children), *self.children)]
+                + [struct.pack('<%dL' % len(self.counts), *self.counts)]
+                )
+
+    @classmethod
+    def loads(cls, data):
+        leaf, items, children, left, right = cls.header.unpack_from(data)
+        offset = cls.header.size
+        entries = []
+        for i in range(items):
+            entry, offset = _unpack_key(data, offset)
+            entries.append(entry)
+        children = list(struct.unpack_from('<%dL' % children, data, offset))
+        offset += 4 * len(children)
+        counts = list(struct.unpack_from('<%dL' % len(children), data, offset))
+        if offset + 4 * len(counts) != len(data):
+            raise BadDataError("node length does not match its contents")
+        return cls(bool(leaf), entries, children, counts, left, right)
+
+
+class _BTree(object):
+    """
+    a B-tree of sorted tuples stored in an IndexFile; searches compare only
+    the first element of each tuple, so (key, record number) entries can be
+    found by key
+    """
+
+    fill = 0.7      # how full bulk loaded nodes are
+
+    def __init__(self, index_file, root=0):
+        self.file = index_file
+        self.root = root
+
+    def __len__(self):
+        if not self.root:
+            return 0
+        return len(self.file.read_node(self.root))
+
+    def _fits(self, node):
+        return len(node.dumps()) <= self.file.block_size - 4
+
+    def _half(self, items):
+        """
+        returns where to split items so the halves hold about the same number
+        of bytes
+        """
+        sizes = [len(_pack_key(item)) for item in items]
+        total, used = sum(sizes), 0
+        for half, size in enumerate(sizes):
+            used += size
+            if used * 2 >= total:
+                break
+        return min(max(half, 1), len(items) - 1)
+
+    def _leaf(self, position):
+        """
+        returns (block, node, offset) of the leaf holding position
+        """
+        block = self.root
+        node = self.file.read_node(block)
+        while not node.leaf:
+            for i, count in enumerate(node.counts):
+                if position < count or i == len(node.counts) - 1:
+                    break
+                position -= count
+            block = node.children[i]
+            node = self.file.read_node(block)
+        return block, node, position
+
+    def _path(self, entry):
+        """
+        returns the (block, node, child) steps from the root down to the leaf
+        where entry belongs
+        """
+        path = []
+        block = self.root
+        node = self.file.read_node(block)
+        while not node.leaf:
+            i = bisect_right(node.items, entry)
+            path.append((block, node, i))
+            block = node.children[i]
+            node = self.file.read_node(block)
+        path.append((block, node, None))
+        return path
+
+    def bisect(self, match, right=False):
+        """
+        returns the position of the first entry whose first element is not less
+        than match (or, if right, greater than match)
+        """
+        if not self.root:
+            return 0
+        find = (bisect_left, bisect_right)[right]
+        position = 0
+        node = self.file.read_node(self.root)
+        while not node.leaf:
+            i = find([item[0] for item in node.items], match)
+            position += sum(node.counts[:i])
+            node = self.file.read_node(node.children[i])
+        return position + find([item[0] for item in node.items], match)
+
+    def build(self, entries):
+        """
+        replaces the contents of the (empty) tree with entries, which must be sorted
+        """
+        if not entries:
+            return
+        write = self.file.write_node
+        limit = (self.file.block_size - 4) * self.fill
+        start = _BTreeNode.header.size
+        def chunks(items, size):
+            groups, group, used = [], [], start
+            for item in items:
+                cost = size(item)
+                if group and used + cost > limit:
+                    groups.append(group)
+                    group, used = [], start
+                group.append(item)
+                used += cost
+            groups.append(group)
+            return groups
+        leaves = chunks(entries, self.size)
+        blocks = [self.file.allocate() for leaf in leaves]
+        level = []
+        for i, items in enumerate(leaves):
+            left = blocks[i-1] if i else 0
+            right = blocks[i+1] if i + 1 < len(blocks) else 0
+            write(blocks[i], _BTreeNode(True, items, left=left, right=right))
+            level.append((items[0], blocks[i], len(items)))
+        while len(level) > 1:
+            groups = chunks(level, lambda child: self.size(child[0]) + 8)
+            next_level = []
+            for group in groups:
+                block = self.file.allocate()
+                node = _BTreeNode(
+                        False,
+                        [child[0] for child in group[1:]],
+                        [child[1] for child in group],
+                        [child[2] for child in group],
+                        )
+                write(block, node)
+                next_level.append((group[0][0], block, sum(node.counts)))
+            level = next_level
+        self.root = level[0][1]
+
+    def clear(self):
+        """
+        releases every node of the tree
+        """
+        if not self.root:
+            return
+        pending = [self.root]
+        while pending:
+            block = pending.pop()
+            node = self.file.read_node(block)
+            if not node.leaf:
+                pending.extend(node.children)
+            self.file.release(block)
+        self.root = 0
+
+    def delete(self, entry):
+        """
+        removes entry, returns False if it was not present
+        """
+        if not self.root:
+            return False
+        read, write = self.file.read_node, self.file.write_node
+        path = self._path(entry)
+        block, leaf, ignore = path.pop()
+        i = bisect_left(leaf.items, entry)
+        if i == len(leaf.items) or leaf.items[i] != entry:
+            return False
+        del leaf.items[i]
+        for parent_block, parent, child in path:
+            parent.counts[child] -= 1
+        if leaf.items or not path:
+            write(block, leaf)
+        else:
+            # drop the empty leaf (and any interior nodes left without children)
+            if leaf.left:
+                neighbour = read(leaf.left)
+                neighbour.right = leaf.right
+                write(leaf.left, neighbour)
+            if leaf.right:
+                neighbour = read(leaf.right)
+                neighbour.left = leaf.left
+                write(leaf.right, neighbour)
+            self.file.release(block)
+            while path:
+                block, node, child = path.pop()
+                del node.children[child]
+                del node.counts[child]
+                if node.items:
+                    del node.items[max(child - 1, 0)]
+                if node.children or not path:
+                    break
+                self.file.release(block)
+            if not path and not node.children:
+                # the root lost its last child
+                node = _BTreeNode(True, [])
+            write(block, node)
+        for parent_block, parent, child in path:
+            write(parent_block, parent)
+        root = read(self.root)
+        if not root.leaf and len(root.children) == 1:
+            self.file.release(self.root)
+            self.root = root.children[0]
+        return True
+
+    def size(self, entry):
+        """
+        returns the stored size of entry; raises DbfError if it is larger than
+        the index file allows
+        """
+        size = len(_pack_key(entry))
+        if size > self.file.max_entry:
+            raise DbfError("index entry is %d bytes, at most %d are allowed" % (size, self.file.max_entry))
+        return size
+
+    def entries(self, start=0):
+        """
+        yields the entries from position start on
+        """
+        if not self.root or start >= len(self):
+            return
+        block, node, offset = self._leaf(start)
+        while True:
+            for entry in node.items[offset:]:
+                yield entry
+            if not node.right:
+                return
+            node = self.file.read_node(node.right)
+            offset = 0
+
+    def entry(self, position):
+        """
+        returns the entry at position
+        """
+        block, node, offset = self._leaf(position)
+        return node.items[offset]
+
+    def find(self, match):
+        """
+        returns the first entry whose first element equals match, or None
+        """
+        position = self.bisect(match)
+        for entry in self.entries(position):
+            if entry[0] == match:
+                return entry
+            break
+        return None
+
+    def insert(self, entry):
+        """
+        adds entry, splitting nodes that grow too large for their block
+        """
+        self.size(entry)
+        read, write, allocate = self.file.read_node, self.file.write_node, self.file.allocate
+        if not self.root:
+            self.root = allocate()
+            write(self.root, _BTreeNode(True, [entry]))
+            return
+        path = self._path(entry)
+        block, node, ignore = path.pop()
+        insort(node.items, entry)
+        for parent_block, parent, child in path:
+            parent.counts[child] += 1
+        while not self._fits(node):
+            # split node, and add the new right half to its parent
+            new_block = allocate()
+            half = self._half(node.items)
+            if node.leaf:
+                new = _BTreeNode(True, node.items[half:], left=block, right=node.right)
+                node.items[half:] = []
+                if new.right:
+                    neighbour = read(new.right)
+                    neighbour.left = new_block
+                    write(new.right, neighbour)
+                node.right = new_block
+                separator = new.items[0]
+            else:
+                separator = node.items[half-1]
+                new = _BTreeNode(False, node.items[half:], node.children[half:], node.counts[half:])
+                node.items[half-1:] = []
+                node.children[half:] = []
+                node.counts[half:] = []
+            write(new_block, new)
+            write(block, node)
+            if path:
+                block, parent, child = path.pop()
+                parent.items.insert(child, separator)
+                parent.children.insert(child + 1, new_block)
+                parent.counts[child] = len(node)
+                parent.counts.insert(child + 1, len(new))
+                node = parent
+            else:
+                old_root = block
+                block = self.root = allocate()
+                node = _BTreeNode(False, [separator], [old_root, new_block], [len(node), len(new)])
+                break
+        write(block, node)
+        for parent_block, parent, child in path:
+            write(parent_block, parent)
+
+
+class ContainedIndex(Index):
+    """
+    a persistent index, stored by name in its table's .pdx file and kept up to
+    date as records are written; lookups read only the nodes they need
+    """
+
+    def __init__(self, table, key, name, index_file, key_id=None):
+        if len(name.encode('ascii')) > 16:
+            raise DbfError("index name %r is longer than 16 characters" % name)
+        self._table = table
+        self.__doc__ = key.__doc__ or 'unknown'
+        self._key = key
+        if key_id is None:
+            key_id = _key_id(key)
+        self._key_id = zlib.crc32(key_id.encode('utf-8')) & 0xffffffff
+        self._previous_status = []
+        self.name = name
+        self.file = index_file
+        index_file.fd       # reread the directory if the file was closed
+        entry = index_file.directory.get(name)
+        if entry is None:
+            entry = [None, None, 0, 0, -1, 0, 0, 0]
+        self._keys = _BTree(index_file, entry[2])
+        self._recnos = _BTree(index_file, entry[3])
+        self._records = entry[4]
+        if self._records != len(table) or tuple(entry[5:7]) != self._stamp() or entry[7] != self._key_id:
+            # new, not closed cleanly, built with another key, or the table
+            # has changed without it
+            self._reindex()
+        elif table._meta.status == READ_WRITE:
+            # until close() stamps it again, the index may fall behind the table
+            self._save(self._records)
+        table._indexen.add(self)
+
+    def __call__(self, record):
+        rec_num = recno(record)
+        key = self.key(record)
+        if key != (DoNotIndex, ):
+            # before anything changes, so a key too large leaves the index intact
+            self._keys.size((key, rec_num))
+        self._change(rec_num, key)
+
+    def __contains__(self, data):
+        if not isinstance(data, (Record, RecordTemplate, tuple, dict)):
+            raise TypeError("%r is not a record, templace, tuple, nor dict" % (data, ))
+        try:
+            value = self.key(data)
+            return self._keys.find(value) is not None
+        except Exception:
+            for record in self:
+                if record == data:
+                    return True
+            return False
+
+    def __getitem__(self, key):
+        '''if key is an integer, returns the matching record;
+        if key is a [slice | string | tuple | record] returns a List;
+        raises NotFoundError on failure'''
+        if isinstance(key, baseinteger):
+            count = len(self)
+            if not -count <= key < count:
+                raise NotFoundError("Record %d is not in list." % key)
+            if key < 0:
+                key += count
+            return self._table[self._keys.entry(key)[1]]
+        elif isinstance(key, slice):
+            result = List()
+            for loc in range(*key.indices(len(self))):
+                rec_num = self._keys.entry(loc)[1]
+                record = self._table[rec_num]
+                result._maybe_add(item=(self._table, rec_num, result.key(record)))
+            return result
+        elif isinstance (key, (basestring, tuple, Record, RecordTemplate)):
+            if isinstance(key, (Record, RecordTemplate)):
+                key = self.key(key)
+            elif isinstance(key, basestring):
+                key = (key, )
+            result = List(desc='match = %r' % (key, ))
+            lo = self._keys.bisect(key)
+            for value, rec_num in self._keys.entries(lo):
+                if value != key:
+                    break
+                record = self._table[rec_num]
+                result._maybe_add(item=(self._table, rec_num, result.key(record)))
+            if not result:
+                raise NotFoundError(key)
+            return result
+        else:
+            raise TypeError('indices must be integers, match objects must by strings or tuples')
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _change(self, rec_num, key):
+        """
+        replaces the entry for rec_num with one for key
+        """
+        old = self._recnos.find(rec_num)
+        if old is not None:
+            if old[1] == key:
+                return
+            self._keys.delete((old[1], rec_num))
+            self._recnos.delete(old)
+        if key != (DoNotIndex, ):
+            self._keys.insert((key, rec_num))
+            self._recnos.insert((rec_num, key))
+        self._save(max(self._records, rec_num + 1))
+
+    def _clear(self):
+        """
+        removes all entries from index
+        """
+        self._keys.clear()
+        self._recnos.clear()
+        self._save(0)
+
+    def _purge(self, rec_num):
+        old = self._recnos.find(rec_num)
+        if old is not None:
+            self._keys.delete((old[1], rec_num))
+            self._recnos.delete(old)
+            self._save(self._records)
+
+    def _reindex(self):
+        """
+        reindexes all records
+        """
+        self._keys.clear()
+        self._recnos.clear()
+        key = self.key
+        pairs = []
+        for record in self._table:
+            value = key(record)
+            if value != (DoNotIndex, ):
+                pairs.append((recno(record), value))
+        self._recnos.build(pairs)
+        pairs = [(value, rec_num) for rec_num, value in pairs]
+        pairs.sort(key=lambda pair: pair[0])
+        self._keys.build(pairs)
+        self._save(len(self._table))
+
+    def _save(self, records, stamp=(0, 0)):
+        self._records = records
+        self.file.save(self.name, self._keys.root, self._recnos.root, records, stamp, self._key_id)
+
+    def _search(self, match, lo=0, hi=None, where=None):
+        if hi is None:
+            hi = len(self)
+        loc = self._keys.bisect(match, right=(where == 'right'))
+        return min(max(loc, lo), hi)
+
+    def _seal(self):
+        """
+        marks the index as matching the table as it now is on disk (called by
+        Table.close())
+        """
+        if self._table._meta.status == READ_WRITE:
+            self._save(self._records, self._stamp())
+
+    def _stamp(self):
+        """
+        returns the (size, modification time) of the table's file
+        """
+        stat = os.stat(self._table._meta.filename)
+        mtime = getattr(stat, 'st_mtime_ns', None)
+        if mtime is None:
+            mtime = int(stat.st_mtime * 1000000000)
+        return stat.st_size, mtime
+
+    def drop(self):
+        """
+        removes the index from the .pdx file (its nodes are reused by other indices)
+        """
+        self._keys.clear()
+        self._recnos.clear()
+        self.file.remove(self.name)
+        self._table._indexen.discard(self)
+
+    def index_search(self, match, start=None, stop=None, nearest=False, partial=False):
+        """
+        returns the index of match between start and stop
+        start and stop default to the first and last record.
+        if nearest is true returns the location of where the match should be
+        otherwise raises NotFoundError
+        """
+        self._nav_check()
+        if not isinstance(match, tuple):
+            match = (match, )
+        if start is None:
+            start = 0
+        if stop is None:
+            stop = len(self)
+        loc = self._search(match, start, stop, where='left')
+        if loc == len(self):
+            if nearest:
+                return IndexLocation(loc, False)
+            raise NotFoundError("dbf.Index.index_search(x): x not in index", data=match)
+        value = self._keys.entry(loc)[0]
+        if value == match or partial and self._partial_match(value, match):
+            return IndexLocation(loc, True)
+        elif nearest:
+            return IndexLocation(loc, False)
+        else:
+            raise NotFoundError("dbf.Index.index_search(x): x not in Index", data=match)
+
+    def search(self, match, partial=False):
+        """
+        returns dbf.List of all (partially) matching records
+        """
+        self._nav_check()
+        result = List()
+        if not isinstance(match, tuple):
+            match = (match, )
+        for value, rec_num in self._keys.entries(self._keys.bisect(match)):
+            if not (value == match or partial and self._partial_match(value, match)):
+                break
+            record = self._table[rec_num]
+            result._maybe_add(item=(self._table, rec_num, result.key(record)))
+        return result
+
+    def update(self, records):
+        """
+        updates the index for many (new or changed) records; large batches are
+        merged with the stored entries in a single pass and the trees rebuilt,
+        instead of one delete and insert per record
+        """
+        key = self.key
+        changed = {}
+        for record in records:
+            rec_num = recno(record)
+            value = key(record)
+            if value != (DoNotIndex, ):
+                self._keys.size((value, rec_num))
+            changed[rec_num] = value
+        if not changed:
+            return
+        count = max(self._records, max(changed) + 1)
+        if len(changed) * 32 < len(self._recnos):
+            for rec_num in sorted(changed):
+                self._change(rec_num, changed[rec_num])
+            return
+        new = [(rec_num, value) for rec_num, value in sorted(changed.items()) if value != (DoNotIndex, )]
+        recnos = [entry for entry in self._recnos.entries() if entry[0] not in changed]
+        keys = [entry for entry in self._keys.entries() if entry[1] not in changed]
+        # each list is two sorted runs, so these sorts are merges
+        recnos.extend(new)
+        recnos.sort(key=lambda entry: entry[0])
+        keys.extend(sorted((value, rec_num) for rec_num, value in new))
+        keys.sort()
+        self._keys.clear()
+        self._recnos.clear()
+        self._recnos.build(recnos)
+        self._keys.build(keys)
+        self._save(count)
+
 
 class BytesType(object):
 
@@ -7861,7 +10248,7 @@ class IntBytesType(BytesType):
         self.one_based = one_based
 
     def from_bytes(self, byte_data):
-        if self.neg_one_is_none and byte_data == '\xff' * self.size:
+        if self.neg_one_is_none and byte_data == b'\xff' * self.size:
             return None
         if self.big_endian:
             value = struct.unpack('>%s' % self.code, byte_data)[0]
@@ -7875,7 +10262,7 @@ class IntBytesType(BytesType):
     def to_bytes(self, value):
         if value is None:
             if self.neg_one_is_none:
-                return '\xff\xff'
+                return b'\xff' * self.size
             raise DbfError('unable to store None in %r' % self.__name__)
         limit = 2 ** (self.size * 8) - 1
         if self.one_based:
@@ -7929,7 +10316,7 @@ class Bytes(BytesType):
 
     def from_bytes(self, byte_data):
         if self.strip_null:
-            return byte_data.rstrip('\x00')
+            return byte_data.rstrip(b'\x00')
         else:
             return byte_data
 
@@ -7937,7 +10324,7 @@ class Bytes(BytesType):
         if not isinstance(value, bytes):
             raise DbfError('value must be bytes [%r]' % value)
         if self.strip_null and len(value) < self.size:
-            value += '\x00' * (self.size - len(value))
+            value += b'\x00' * (self.size - len(value))
         return value
 
 
@@ -7970,7 +10357,7 @@ class DataBlock(object):
         if self.size and total_field_size > self.size:
             raise DbfError('Fields in %r are using %d bytes, but only %d allocated' % (cls, total_field_size, self.size))
         total_field_size = self.size or total_field_size
-        cls._data = str('\x00' * total_field_size)
+        cls._data = b'\x00' * total_field_size
         cls.__len__ = lambda s: len(s._data)
         cls._size_ = total_field_size
         if not initialized:
@@ -7996,13 +10383,20 @@ class LruCache(object):
     """
     keep the most recent n items in the dict
 
+    can be used as a memoizing decorator (with func), or as a mapping via get(),
+    cache[key] = value, del cache[key], and clear()
+
+    maxsize (if not None) limits the number of items, and maxbytes (if given)
+    limits the total sizeof() of the values; get() and calls count hits and
+    misses, and all operations are thread-safe
+
     based on code from Raymond Hettinger: http://stackoverflow.com/a/8334739/208880
     """
 
     class Link(object):
-        __slots__ = 'prev_link', 'next_link', 'key', 'value'
-        def __init__(self, prev=None, next=None, key=None, value=None):
-            self.prev_link, self.next_link, self.key, self.value = prev, next, key, value
+        __slots__ = 'prev_link', 'next_link', 'key', 'value', 'size'
+        def __init__(self, prev=None, next=None, key=None, value=None, size=0):
+            self.prev_link, self.next_link, self.key, self.value, self.size = prev, next, key, value, size
 
         def __iter__(self):
             return iter((self.prev_link, self.next_link, self.key, self.value))
@@ -8013,9 +10407,15 @@ class LruCache(object):
                 value = value[:12] + '...'
             return 'Link<key=%r, value=%r>' % (self.key, value)
 
-    def __init__(self, maxsize, func=None):
+    def __init__(self, maxsize, func=None, maxbytes=None, sizeof=len):
         self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
         self.mapping = {}
+        self.lock = threading.Lock()
         self.tail = self.Link()                      # oldest
         self.head = self.Link(self.tail)             # newest
         self.head.prev_link = self.tail
@@ -8027,36 +10427,139 @@ class LruCache(object):
     def __call__(self, *func):
         if self.func is None:
             [self.func] = func
-            self.__name__ = func.__name__
-            self.__doc__ = func.__doc__
+            self.__name__ = self.func.__name__
+            self.__doc__ = self.func.__doc__
             return self
-        mapping, head, tail = self.mapping, self.head, self.tail
-        link = mapping.get(func, head)
-        if link is head:
-            value = self.func(*func)
-            if len(mapping) >= self.maxsize:
-                old_prev, old_next, old_key, old_value = tail.next_link
-                tail.next_link = old_next
-                old_next.prev_link = tail
-                del mapping[old_key]
-            behind = head.prev_link
-            link = self.Link(behind, head, func, value)
-            mapping[func] = behind.next_link = head.prev_link = link
-        else:
-            link_prev, link_next, func, value = link
-            link_prev.next_link = link_next
-            link_next.prev_link = link_prev
-            behind = head.prev_link
-            behind.next_link = head.prev_link = link
-            link.prev_link = behind
-            link.next_link = head
+        with self.lock:
+            link = self.mapping.get(func)
+            if link is not None:
+                self.hits += 1
+                self._promote(link)
+                return link.value
+            self.misses += 1
+        value = self.func(*func)
+        self[func] = value
         return value
 
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._unlink(self.mapping.pop(key))
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __setitem__(self, key, value):
+        size = 0
+        if self.maxbytes is not None:
+            size = self.sizeof(value)
+        with self.lock:
+            mapping, head = self.mapping, self.head
+            link = mapping.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            if (
+                    self.maxsize is not None and self.maxsize < 1
+                    or self.maxbytes is not None and size > self.maxbytes
+                ):
+                return
+            behind = head.prev_link
+            link = self.Link(behind, head, key, value, size)
+            mapping[key] = behind.next_link = head.prev_link = link
+            self.bytes += size
+            self._shrink()
+
+    def _promote(self, link):
+        """
+        moves link to the newest position
+        """
+        head = self.head
+        link_prev, link_next = link.prev_link, link.next_link
+        link_prev.next_link = link_next
+        link_next.prev_link = link_prev
+        behind = head.prev_link
+        behind.next_link = head.prev_link = link
+        link.prev_link = behind
+        link.next_link = head
+
+    def _shrink(self):
+        """
+        discards the oldest items until the size limits are met
+        """
+        mapping, tail = self.mapping, self.tail
+        while mapping and (
+                self.maxsize is not None and len(mapping) > self.maxsize
+                or self.maxbytes is not None and self.bytes > self.maxbytes
+                ):
+            oldest = tail.next_link
+            del mapping[oldest.key]
+            self._unlink(oldest)
+
+    def _unlink(self, link):
+        link.prev_link.next_link = link.next_link
+        link.next_link.prev_link = link.prev_link
+        self.bytes -= link.size
+
+    def clear(self):
+        """
+        discards all items (the hit and miss counts are kept)
+        """
+        with self.lock:
+            self.mapping.clear()
+            self.head.prev_link = self.tail
+            self.tail.next_link = self.head
+            self.bytes = 0
+
+    def get(self, key, default=None):
+        """
+        returns the value for key (marking it as most recently used), or default
+        """
+        with self.lock:
+            link = self.mapping.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._promote(link)
+            return link.value
+
+    def info(self):
+        """
+        returns a CacheInfo of (hits, misses, maxsize, currsize)
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.mapping))
+
+    def pop(self, key, default=None):
+        """
+        removes key and returns its value, or default if not present
+        """
+        with self.lock:
+            link = self.mapping.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            return link.value
+
+    def resize(self, maxsize=None, maxbytes=None):
+        """
+        changes the size limits, discarding the oldest items as needed
+        """
+        with self.lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._shrink()
+
 
 class Idx(object):
     # default numeric storage is little-endian
     # numbers used as key values, and the 4-byte numbers in leaf nodes are big-endian
 
+    descending = False
+
     @DataBlock(512)
     class Header(object):
         root_node = Int32(0)
@@ -8100,26 +10603,28 @@ class Idx(object):
                 result.append(key(self.pool[start:end]))
             return result
 
-    def __init__(self, table, filename, size_limit=100):
+    def __init__(self, table, filename, size_limit=100, mmap=False):
         self.table = weakref.ref(table)
         self.filename = filename
         self.limit = size_limit
-        with open(filename, 'rb') as idx:
-            self.header = header = self.Header(idx.read(512))
-            # offset = 512
-            @DataBlock(header.key_length+4)
-            class NodeKey(object):
-                key = Bytes(0, header.key_length)
-                rec_no = Int32(header.key_length, big_endian=True)
-            @DataBlock(header.key_length+4)
-            class RecordKey(object):
-                key = Bytes(0, header.key_length)
-                rec_no = Int32(header.key_length, big_endian=True, one_based=True)
-            self.NodeKey = NodeKey
-            self.RecordKey = RecordKey
-            # set up root node
-            idx.seek(header.root_node)
-            self.root_node = self.Node(idx.read(512), self.NodeKey, self.RecordKey)
+        # one handle for the life of the Idx (or a read-only map of the file)
+        idx = open(filename, 'rb')
+        if mmap:
+            idx = _MappedFile(idx)
+        self.file = idx
+        self.header = header = self.Header(_read_at(idx, 0, 512))
+        @DataBlock(header.key_length+4)
+        class NodeKey(object):
+            key = Bytes(0, header.key_length)
+            rec_no = Int32(header.key_length, big_endian=True)
+        @DataBlock(header.key_length+4)
+        class RecordKey(object):
+            key = Bytes(0, header.key_length)
+            rec_no = Int32(header.key_length, big_endian=True, one_based=True)
+        self.NodeKey = NodeKey
+        self.RecordKey = RecordKey
+        # set up root node
+        self.root_node = self.read_node(header.root_node)
         # set up node reader
         self.read_node = LruCache(maxsize=size_limit, func=self.read_node)
         # set up iterating members
@@ -8127,13 +10632,35 @@ class Idx(object):
         self.current_key = None
 
     def __iter__(self):
+        table = self._table()
+        for key in self._leaf_keys():
+            yield table[key.rec_no]
+    forward = __iter__
+
+    def _find(self, key):
+        """
+        returns the leaf node and position of the first entry not before key
+        (the position may be past the end of the leaf)
+        """
+        order = self._order
+        key = order(key)
+        node = self.root_node
+        while not node.is_leaf():
+            # interior entries hold the last key of each child
+            keys = node.keys()
+            i = bisect_left([order(k.key) for k in keys], key)
+            if i == len(keys):
+                i -= 1
+            node = self.read_node(keys[i].rec_no)
+        return node, bisect_left([order(k.key) for k in node.keys()], key)
+
+    def _leaf_keys(self):
+        """
+        yields the leaf entries in index order
+        """
         # find the first leaf node
-        table = self.table()
-        if table is None:
-            raise DbfError('the database linked to %r has been closed' % self.filename)
         node = self.root_node
         if not node.num_keys:
-            yield
             return
         while "looking for a leaf":
             # travel the links down to the first leaf node
@@ -8142,29 +10669,31 @@ class Idx(object):
             node = self.read_node(node.keys()[0].rec_no)
         while "traversing nodes":
             for key in node.keys():
-                yield table[key.rec_no]
+                yield key
             next_node = node.right_peer
             if next_node is None:
                 return
             node = self.read_node(next_node)
-    forward = __iter__
 
-    def read_node(self, offset):
+    def _order(self, key):
         """
-        reads the sector indicated, and returns a Node object
+        returns key in a form that sorts in index order
         """
-        with open(self.filename, 'rb') as idx:
-            idx.seek(offset)
-            return self.Node(idx.read(512), self.NodeKey, self.RecordKey)
+        if self.descending:
+            return bytes(bytearray(0xff ^ b for b in bytearray(key)))
+        return key
 
-    def backward(self):
-        # find the last leaf node
+    def _table(self):
         table = self.table()
         if table is None:
             raise DbfError('the database linked to %r has been closed' % self.filename)
+        return table
+
+    def backward(self):
+        # find the last leaf node
+        table = self._table()
         node = self.root_node
         if not node.num_keys:
-            yield
             return
         while "looking for last leaf":
             # travel the links down to the last leaf node
@@ -8179,6 +10708,573 @@ class Idx(object):
                 return
             node = self.read_node(prev_node)
 
+    def close(self):
+        """
+        closes the index file
+        """
+        self.file.close()
+
+    def key_bytes(self, value, partial=False):
+        """
+        returns value as it is stored in the index: bytes as-is, text encoded
+        with the table's codepage and (unless partial) padded with spaces,
+        numbers as order-preserving doubles, and dates as julian day numbers
+        """
+        if isinstance(value, bytes):
+            data = value
+        elif isinstance(value, basestring):
+            data = self._table()._meta.encoder(value)[0]
+        else:
+            if isinstance(value, (Date, datetime.date)):
+                value = value.toordinal() + VFPTIME
+            elif not isinstance(value, (baseinteger, float, Decimal)):
+                raise TypeError('unable to make an index key from %r' % (value, ))
+            data = bytearray(struct.pack('>d', float(value)))
+            if value >= 0:
+                data[0] |= 0x80
+            else:
+                data = bytearray(0xff ^ b for b in data)
+            return bytes(data)
+        if not partial:
+            data += b' ' * (self.header.key_length - len(data))
+        return data
+
+    def range(self, lo=None, hi=None):
+        """
+        yields the records from the first key at lo up to (but not including)
+        the first key at hi, in index order (so lo is the larger key for a
+        descending index); lo and hi are converted by key_bytes (None is
+        unbounded)
+        """
+        table = self._table()
+        order = self._order
+        if lo is None:
+            lo = b''
+        else:
+            lo = self.key_bytes(lo, partial=True)
+        if hi is not None:
+            hi = order(self.key_bytes(hi, partial=True))
+        if not self.root_node.num_keys:
+            return
+        node, i = self._find(lo)
+        while "traversing nodes":
+            for key in node.keys()[i:]:
+                if hi is not None and order(key.key) >= hi:
+                    return
+                yield table[key.rec_no]
+            if node.right_peer is None:
+                return
+            node = self.read_node(node.right_peer)
+            i = 0
+
+    def read_node(self, offset):
+        """
+        reads the sector indicated, and returns a Node object
+        """
+        return self.Node(_read_at(self.file, offset, 512), self.NodeKey, self.RecordKey)
+
+    def seek(self, key, partial=False):
+        """
+        returns the first record whose key matches key (if partial, whose key
+        starts with key), reading one node per level of the index; raises
+        NotFoundError if there is none
+        """
+        match = self.key_bytes(key, partial=partial)
+        if self.root_node.num_keys:
+            node, i = self._find(match)
+            keys = node.keys()
+            if i == len(keys) and node.right_peer is not None:
+                keys, i = self.read_node(node.right_peer).keys(), 0
+            if i < len(keys) and keys[i].key.startswith(match):
+                return self._table()[keys[i].rec_no]
+        raise NotFoundError("%r not in %s" % (key, self.filename))
+
+
+class CdxTag(Idx):
+    """
+    one tag of a FoxPro compound index; iterated and searched like an Idx
+    """
+    # leaf nodes hold the record number, duplicate count and trailing count of
+    # each key packed into a few bytes, with the rest of each key stored from
+    # the end of the node backwards; interior entries are the full key followed
+    # by the (big-endian) record number and node pointer
+
+    Key = namedtuple('CdxKey', 'key rec_no')
+
+    @DataBlock(1024)
+    class Header(object):
+        root_node = Int32(0)
+        free_node_list = Int32(4, neg_one_is_none=True)
+        file_size = Int32(8)
+        key_length = Int16(12)
+        index_options = Int8(14)
+        index_signature = Int8(15)
+        descending = Int16(502)
+        for_expr_length = Int16(506)
+        key_expr_length = Int16(510)
+        expr_pool = Bytes(512, 512)
+
+    @DataBlock(512)
+    class Node(object):
+        attributes = Int16(0)
+        num_keys = Int16(2)
+        left_peer = Int32(4, neg_one_is_none=True)
+        right_peer = Int32(8, neg_one_is_none=True)
+        free_space = Int16(12)
+        rec_no_mask = Int32(14)
+        dup_mask = Int8(18)
+        trail_mask = Int8(19)
+        rec_no_bits = Int8(20)
+        dup_bits = Int8(21)
+        trail_bits = Int8(22)
+        info_size = Int8(23)
+        def __init__(self, byte_data, key_length, trail, base):
+            if len(byte_data) != 512:
+                raise DbfError("incomplete node: only received %d bytes" % len(byte_data))
+            self._data = byte_data
+            self._key_length = key_length
+            self._trail = trail
+            self._base = base
+            self._keys = None
+        def is_leaf(self):
+            return bool(self.attributes & 2)
+        def is_root(self):
+            return bool(self.attributes & 1)
+        def is_interior(self):
+            return not self.attributes & 2
+        def keys(self):
+            if self._keys is not None:
+                return self._keys
+            Key = CdxTag.Key
+            data = self._data
+            key_length = self._key_length
+            result = []
+            if not self.is_leaf():
+                size = key_length + 8
+                for start in range(12, 12 + self.num_keys * size, size):
+                    pointer = struct.unpack('>L', data[start+key_length+4:start+size])[0]
+                    result.append(Key(data[start:start+key_length], pointer))
+            else:
+                info_size = self.info_size
+                rec_no_mask, dup_mask, trail_mask = self.rec_no_mask, self.dup_mask, self.trail_mask
+                dup_shift = self.rec_no_bits
+                trail_shift = dup_shift + self.dup_bits
+                trail, base = self._trail, self._base
+                end = 512
+                key = b''
+                for start in range(24, 24 + self.num_keys * info_size, info_size):
+                    info = struct.unpack('<Q', data[start:start+info_size].ljust(8, b'\x00'))[0]
+                    dup = (info >> dup_shift) & dup_mask
+                    trailing = (info >> trail_shift) & trail_mask
+                    new = key_length - dup - trailing
+                    key = key[:dup] + data[end-new:end] + trail * trailing
+                    end -= new
+                    result.append(Key(key, (info & rec_no_mask) - base))
+            self._keys = result
+            return result
+
+    def __init__(self, cdx, name, offset, trail=None, base=1):
+        self.table = cdx.table
+        self.filename = cdx.filename
+        self.name = name
+        self.limit = cdx.limit
+        self.file = cdx.file
+        self.header = header = self.Header(_read_at(self.file, offset, 1024))
+        self.descending = bool(header.descending)
+        pool = header.expr_pool
+        self.key_expr = pool[:header.key_expr_length].split(b'\x00')[0]
+        self.for_expr = pool[header.key_expr_length:header.key_expr_length+header.for_expr_length].split(b'\x00')[0]
+        if trail is None:
+            # trailing bytes are dropped from keys: blanks for character keys,
+            # nulls for everything else
+            trail = b' '
+            table = self._table()
+            try:
+                if table.field_info(self.key_expr.strip().decode('ascii'))[0] is not FieldType.CHAR:
+                    trail = b'\x00'
+            except (DbfError, UnicodeError):
+                pass
+        self.trail = trail
+        self.base = base
+        self.root_node = self.read_node(header.root_node)
+        self.read_node = LruCache(maxsize=self.limit, func=self.read_node)
+
+    def __repr__(self):
+        return '%s(%r, key_expr=%r)' % (self.__class__.__name__, self.name, self.key_expr)
+
+    def close(self):
+        """
+        the index file is shared by all the tags and closed by Cdx.close()
+        """
+        pass
+
+    def read_node(self, offset):
+        """
+        reads the sector indicated, and returns a Node object
+        """
+        return self.Node(_read_at(self.file, offset, 512), self.header.key_length, self.trail, self.base)
+
+
+class Cdx(object):
+    """
+    FoxPro compound index (.cdx); the tags are available by name
+    """
+
+    def __init__(self, table, filename, size_limit=100, mmap=False):
+        self.table = weakref.ref(table)
+        self.filename = filename
+        self.limit = size_limit
+        # one handle for the life of the Cdx (or a read-only map of the file)
+        cdx = open(filename, 'rb')
+        if mmap:
+            cdx = _MappedFile(cdx)
+        self.file = cdx
+        # the tag directory is itself a compact index of tag name -> tag header
+        directory = CdxTag(self, None, 0, trail=b'\x00', base=0)
+        self._tags = {}
+        self._names = []
+        for key in directory._leaf_keys():
+            name = key.key.rstrip(b' \x00').decode('ascii')
+            self._names.append(name)
+            self._tags[name.upper()] = CdxTag(self, name, key.rec_no)
+
+    def __contains__(self, name):
+        return name.upper() in self._tags
+
+    def __getitem__(self, name):
+        try:
+            return self._tags[name.upper()]
+        except KeyError:
+            raise NotFoundError("tag %r not in %s" % (name, self.filename))
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def close(self):
+        """
+        closes the index file
+        """
+        self.file.close()
+
+    def tags(self):
+        """
+        returns the names of the tags
+        """
+        return self._names[:]
+
+
+class Ndx(object):
+    """
+    dBase III single key index (.ndx)
+    """
+    # pages are numbered from the start of the file; numeric and date keys are
+    # stored as little-endian doubles; interior entries only guide the search
+    # (every key is in a leaf), and the last child of an interior page follows
+    # its keys; there are no links between leaves
+
+    Key = namedtuple('NdxKey', 'key rec_no child')
+    interior_records = False
+
+    @DataBlock(512)
+    class Header(object):
+        root_node = Int32(0)
+        num_pages = Int32(4)
+        key_length = Int16(12)
+        max_keys = Int16(14)
+        key_type = Int16(16)
+        entry_size = Int16(18)
+        expr_pool = Bytes(24, fill_to=512)
+
+    @DataBlock(512)
+    class Node(object):
+        num_keys = Int32(0)
+        pool = Bytes(4, fill_to=512)
+        def __init__(self, byte_data, header):
+            if len(byte_data) != 512:
+                raise DbfError("incomplete node: only received %d bytes" % len(byte_data))
+            self._data = byte_data
+            self._key_length = header.key_length
+            self._entry_size = header.entry_size
+            self._keys = None
+        def _entry(self, i):
+            start = 4 + i * self._entry_size
+            child, rec_no = struct.unpack('<LL', self._data[start:start+8])
+            return Ndx.Key(self._data[start+8:start+8+self._key_length], rec_no - 1, child * 512)
+        def is_leaf(self):
+            return not self._entry(0).child
+        def keys(self):
+            if self._keys is None:
+                self._keys = [self._entry(i) for i in range(self.num_keys)]
+            return self._keys
+        @property
+        def last_child(self):
+            return self._entry(self.num_keys).child
+
+    def __init__(self, table, filename, size_limit=100, mmap=False):
+        self.table = weakref.ref(table)
+        self.filename = filename
+        self.limit = size_limit
+        # one handle for the life of the index (or a read-only map of the file)
+        index = open(filename, 'rb')
+        if mmap:
+            index = _MappedFile(index)
+        self.file = index
+        self.header = self.Header(_read_at(index, 0, self.Header._size_))
+        self.key_expr = self._key_expr()
+        self.root_node = self.read_node(self._root())
+        self.read_node = LruCache(maxsize=size_limit, func=self.read_node)
+
+    def __iter__(self):
+        table = self._table()
+        for key in self._scan(self._descend(self.root_node)):
+            yield table[key.rec_no]
+    forward = __iter__
+
+    def _child(self, node, i):
+        """
+        returns the offset of the i-th child of an interior node
+        """
+        keys = node.keys()
+        if i < len(keys):
+            return keys[i].child
+        return node.last_child
+
+    def _descend(self, node, last=False):
+        """
+        returns the path from node to its first (or last) leaf entry
+        """
+        path = []
+        while not node.is_leaf():
+            i = (0, len(node.keys()))[last]
+            path.append((node, i))
+            node = self.read_node(self._child(node, i))
+        path.append((node, (0, len(node.keys()))[last]))
+        return path
+
+    def _find(self, key):
+        """
+        returns the path from the root to the first entry not less than key
+        """
+        order = self._order
+        key = order(key)
+        path = []
+        node = self.root_node
+        while "descending":
+            i = bisect_left([order(k.key) for k in node.keys()], key)
+            path.append((node, i))
+            if node.is_leaf():
+                return path
+            node = self.read_node(self._child(node, i))
+
+    def _key_expr(self):
+        return self.header.expr_pool.split(b'\x00')[0]
+
+    def _order(self, key):
+        """
+        returns key in a form that sorts in index order
+        """
+        if self.header.key_type:
+            return struct.unpack('<d', key[:8])[0]
+        return key
+
+    def _root(self):
+        return self.header.root_node * 512
+
+    def _scan(self, path):
+        """
+        yields the entries in index order, starting from the end of path
+        """
+        # an interior step (node, i) is inside the i-th child: the i-th entry
+        # comes next, and then the following child
+        interior_records = self.interior_records
+        while path:
+            node, i = path.pop()
+            keys = node.keys()
+            if node.is_leaf():
+                for key in keys[i:]:
+                    yield key
+            elif i < len(keys):
+                if interior_records:
+                    yield keys[i]
+                path.append((node, i + 1))
+                path.extend(self._descend(self.read_node(self._child(node, i + 1))))
+
+    def _table(self):
+        table = self.table()
+        if table is None:
+            raise DbfError('the database linked to %r has been closed' % self.filename)
+        return table
+
+    def backward(self):
+        table = self._table()
+        interior_records = self.interior_records
+        path = self._descend(self.root_node, last=True)
+        while path:
+            node, i = path.pop()
+            keys = node.keys()
+            if node.is_leaf():
+                for key in reversed(keys[:i]):
+                    yield table[key.rec_no]
+            elif i > 0:
+                if interior_records:
+                    yield table[keys[i-1].rec_no]
+                path.append((node, i - 1))
+                path.extend(self._descend(self.read_node(self._child(node, i - 1)), last=True))
+
+    def close(self):
+        """
+        closes the index file
+        """
+        self.file.close()
+
+    def key_bytes(self, value, partial=False):
+        """
+        returns value as it is stored in the index: bytes as-is, text encoded
+        with the table's codepage and (unless partial) padded with spaces, and
+        numbers and dates (as julian day numbers) as doubles
+        """
+        if isinstance(value, bytes):
+            return value
+        elif isinstance(value, basestring):
+            data = self._table()._meta.encoder(value)[0]
+            if not partial:
+                data += b' ' * (self.header.key_length - len(data))
+            return data
+        elif isinstance(value, (Date, datetime.date)):
+            value = value.toordinal() + VFPTIME
+        elif not isinstance(value, (baseinteger, float, Decimal)):
+            raise TypeError('unable to make an index key from %r' % (value, ))
+        return struct.pack('<d', float(value))
+
+    def range(self, lo=None, hi=None):
+        """
+        yields the records whose keys are at least lo and less than hi, in key
+        order; lo and hi are converted by key_bytes (None is unbounded)
+        """
+        table = self._table()
+        order = self._order
+        if lo is None:
+            path = self._descend(self.root_node)
+        else:
+            path = self._find(self.key_bytes(lo, partial=True))
+        if hi is not None:
+            hi = order(self.key_bytes(hi, partial=True))
+        for key in self._scan(path):
+            if hi is not None and order(key.key) >= hi:
+                return
+            yield table[key.rec_no]
+
+    def read_node(self, offset):
+        """
+        reads the page at offset, and returns a Node object
+        """
+        return self.Node(_read_at(self.file, offset, self.Node._size_), self.header)
+
+    def seek(self, key, partial=False):
+        """
+        returns the first record whose key matches key (if partial, whose key
+        starts with key), reading one page per level of the index; raises
+        NotFoundError if there is none
+        """
+        match = self.key_bytes(key, partial=partial)
+        for found in self._scan(self._find(match)):
+            if partial:
+                matched = found.key.startswith(match)
+            else:
+                matched = self._order(found.key) == self._order(match)
+            if matched:
+                return self._table()[found.rec_no]
+            break
+        raise NotFoundError("%r not in %s" % (key, self.filename))
+
+
+class Ntx(Ndx):
+    """
+    Clipper single key index (.ntx)
+    """
+    # pages hold a table of item offsets followed by the items; pointers are
+    # file offsets, every item (interior ones included) is a key, and keys
+    # are always text: numbers are zero-filled strings and dates are YYYYMMDD
+
+    interior_records = True
+
+    @DataBlock(1024)
+    class Header(object):
+        signature = Int16(0)
+        version = Int16(2)
+        root_node = Int32(4)
+        free_node_list = Int32(8)
+        item_size = Int16(12)
+        key_length = Int16(14)
+        key_decimals = Int16(16)
+        max_items = Int16(18)
+        half_page = Int16(20)
+        expr_pool = Bytes(22, 256)
+        unique = Int8(278)
+
+    @DataBlock(1024)
+    class Node(object):
+        num_keys = Int16(0)
+        pool = Bytes(2, fill_to=1024)
+        def __init__(self, byte_data, header):
+            if len(byte_data) != 1024:
+                raise DbfError("incomplete node: only received %d bytes" % len(byte_data))
+            self._data = byte_data
+            self._key_length = header.key_length
+            self._keys = None
+        def _entry(self, i):
+            start = struct.unpack('<H', self._data[2+2*i:4+2*i])[0]
+            child, rec_no = struct.unpack('<LL', self._data[start:start+8])
+            return Ndx.Key(self._data[start+8:start+8+self._key_length], rec_no - 1, child)
+        def is_leaf(self):
+            return not self._entry(0).child
+        def keys(self):
+            if self._keys is None:
+                self._keys = [self._entry(i) for i in range(self.num_keys)]
+            return self._keys
+        @property
+        def last_child(self):
+            return self._entry(self.num_keys).child
+
+    def _order(self, key):
+        return key
+
+    def _root(self):
+        return self.header.root_node
+
+    def key_bytes(self, value, partial=False):
+        """
+        returns value as it is stored in the index: bytes as-is, text encoded
+        with the table's codepage and (unless partial) padded with spaces,
+        dates as YYYYMMDD, and numbers as zero-filled text
+        """
+        if isinstance(value, bytes):
+            return value
+        elif isinstance(value, (Date, datetime.date)):
+            return ('%04d%02d%02d' % (value.year, value.month, value.day)).encode('ascii')
+        elif isinstance(value, basestring):
+            data = self._table()._meta.encoder(value)[0]
+            if not partial:
+                data += b' ' * (self.header.key_length - len(data))
+            return data
+        elif not isinstance(value, (baseinteger, float, Decimal)):
+            raise TypeError('unable to make an index key from %r' % (value, ))
+        header = self.header
+        text = '%*.*f' % (header.key_length, header.key_decimals, value)
+        if value < 0:
+            # as Clipper does: negative digits sort below '0', larger
+            # magnitudes first
+            text = ''.join(
+                    chr(92 - ord(c)) if c.isdigit() else c
+                    for c in text.replace(' ', '0').replace('-', '0')
+                    )
+        else:
+            text = text.replace(' ', '0')
+        return text.encode('ascii')
+
 
 # table meta
 
@@ -9044,15 +12140,22 @@ def gather(record, data, drop=False):
     if not record_in_flux:
         record._start_flux()
     try:
-        record_fields = field_names(record)
-        for key in field_names(data):
-            value = data[key]
-            key = ensure_unicode(key).upper()
-            if not key in record_fields:
-                if drop:
-                    continue
-                raise FieldMissingError(key)
-            record[key] = value
+        meta = record._meta
+        if isinstance(record, Record) and meta.status == READ_WRITE:
+            if not isinstance(data, dict):
+                data = dict((key, data[key]) for key in field_names(data))
+            meta.row_encoder(record._data, data, meta, memos=record._memos, drop=drop)
+            record._dirty = True
+        else:
+            record_fields = field_names(record)
+            for key in field_names(data):
+                value = data[key]
+                key = ensure_unicode(key).upper()
+                if not key in record_fields:
+                    if drop:
+                        continue
+                    raise FieldMissingError(key)
+                record[key] = value
     except:
         if not record_in_flux:
             record._rollback_flux()
@@ -9060,6 +12163,61 @@ def gather(record, data, drop=False):
     if not record_in_flux:
         record._commit_flux()
 
+def parallel_scan(filename, func, workers=None, chunk=None, reducer=None, **kwargs):
+    """
+    calls func(record) for every record in the table at filename, using workers
+    processes (default: one per cpu); each worker opens its own read-only copy of
+    the table (kwargs are passed to Table) and handles chunk records at a time;
+    returns the list of results in record order, or, if reducer is given, the
+    results combined with reducer(previous, result) -- first within each chunk,
+    then across chunks in the parent
+
+    func, reducer, and the results must be picklable
+    """
+    count = len(Table(filename, **kwargs))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError("workers must be at least 1, not %r" % (workers, ))
+    if chunk is None:
+        chunk = max(1, -(-count // (workers * 4)))
+    if chunk < 1:
+        raise ValueError("chunk must be at least 1, not %r" % (chunk, ))
+    tasks = [
+            (filename, kwargs, func, reducer, start, min(start + chunk, count))
+            for start in range(0, count, chunk)
+            ]
+    if workers == 1 or len(tasks) < 2:
+        results = [_scan_chunk(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(_scan_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    if reducer is None:
+        return [result for chunk_results in results for result in chunk_results]
+    if not results:
+        raise DbfError("%s has no records to reduce" % filename)
+    return reduce(reducer, results)
+
+def _scan_chunk(task):
+    """
+    runs one parallel_scan task: opens the table and applies func to records
+    start through stop
+    """
+    filename, kwargs, func, reducer, start, stop = task
+    table = Table(filename, **kwargs)
+    table.open(READ_ONLY)
+    try:
+        results = [func(table[index]) for index in range(start, stop)]
+    finally:
+        table.close()
+    if reducer is None:
+        return results
+    return reduce(reducer, results)
+
 def scan(table, direction='forward', filter=lambda rec: True):
     """
     moves record pointer forward 1; returns False if Eof/Bof reached
@@ -6,6 +6,9 @@ import unittest
 import tempfile
 import shutil
 import stat
+import struct
+from array import array
+from functools import reduce
 from unittest import skipIf, TestCase as unittest_TestCase
 
 py_ver = sys.version_info[:2]
@@ -167,6 +170,282 @@ def inactive(rec):
         return recno(rec)
     return DoNotIndex
 
+def name_and_recno(rec):
+    return recno(rec), rec.name.strip()
+
+def longer_name(first, second):
+    if len(second[1]) > len(first[1]):
+        return second
+    return first
+
+def spec_block(size, head, tail=''):
+    """
+    returns size bytes: head, nulls, and then tail; head and tail are hex
+    digits, with whitespace and '#' comments ignored
+    """
+    def unhex(text):
+        digits = ''.join(line.split('#')[0] for line in text.split('\n'))
+        return codecs.decode(''.join(digits.split()).encode('ascii'), 'hex')
+    head, tail = unhex(head), unhex(tail)
+    assert len(head) + len(tail) <= size
+    return head + b'\x00' * (size - len(head) - len(tail)) + tail
+
+# the rows the index fixtures below were laid out for, by (one-based) record
+# number: ALPHA 3, ALPINE 5, BRAVO 1, CHARLIE 4, CHARLY 6, DELTA 2
+fixture_rows = (
+        ('BRAVO', 5), ('DELTA', -1), ('ALPHA', 30),
+        ('CHARLIE', 0), ('ALPINE', 12), ('CHARLY', 7),
+        )
+
+# a FoxPro .idx on NAME (C(8)), following the published file structure: a
+# 512-byte header, then 512-byte nodes of attributes, key count, left and
+# right neighbours, and (key, big-endian pointer or record number) entries;
+# interior entries hold the last key of each child
+idx_fixture = b''.join([
+        spec_block(512, '''
+            00020000    # root node at 0x200
+            ffffffff    # no free nodes
+            00080000    # end of file at 0x800
+            0800        # key length
+            00          # index options
+            00          # index signature
+            4e414d45    # key expression: NAME
+            '''),
+        spec_block(512, '''
+            0100                                    # root (interior) node
+            0200                                    # two keys
+            ffffffff ffffffff                       # no neighbours
+            425241564f202020 00000400               # BRAVO    -> node 0x400
+            44454c5441202020 00000600               # DELTA    -> node 0x600
+            '''),
+        spec_block(512, '''
+            0200                                    # leaf node
+            0300                                    # three keys
+            ffffffff 00060000                       # right neighbour at 0x600
+            414c504841202020 00000003               # ALPHA    -> record 3
+            414c50494e452020 00000005               # ALPINE   -> record 5
+            425241564f202020 00000001               # BRAVO    -> record 1
+            '''),
+        spec_block(512, '''
+            0200                                    # leaf node
+            0300                                    # three keys
+            00040000 ffffffff                       # left neighbour at 0x400
+            434841524c494520 00000004               # CHARLIE  -> record 4
+            434841524c592020 00000006               # CHARLY   -> record 6
+            44454c5441202020 00000002               # DELTA    -> record 2
+            '''),
+        ])
+
+# a FoxPro compound .cdx with two tags, NAME and QTY, following the published
+# compact index structure: 1024-byte headers (the first for the tag
+# directory), and 512-byte nodes; leaves hold packed (record number,
+# duplicate count, trailing count) entries, here three bytes each of 16, 4,
+# and 4 bits, with the new part of each key stored from the end of the node
+# backwards; trailing blanks are dropped from character keys and trailing
+# nulls from numeric ones, which are big-endian doubles with the sign bit
+# flipped (and every bit, for negative numbers)
+cdx_fixture = b''.join([
+        spec_block(1024, '''
+            00040000    # tag directory root at 0x400
+            ffffffff    # no free nodes
+            00160000    # end of file at 0x1600
+            0a00        # key length (tag names)
+            e0          # compact, compound index
+            01          # index signature
+            '''),
+        spec_block(512, '''
+            0300                    # root leaf
+            0200                    # two keys
+            ffffffff ffffffff       # no neighbours
+            db01                    # 475 bytes free
+            ffff0000 0f 0f          # record number, duplicate, and trail masks
+            10 04 04                # bits used by each
+            03                      # bytes per entry
+            000660                  # tag header at 0x600, 0 duplicate, 6 trailing: NAME
+            001070                  # tag header at 0x1000, 0 duplicate, 7 trailing: QTY
+            ''', '''
+            515459 4e414d45         # QTY, NAME
+            '''),
+        spec_block(502, '''
+            000a0000    # root node at 0xa00
+            ffffffff    # no free nodes
+            00160000    # end of file at 0x1600
+            0800        # key length
+            60          # compact, compound index
+            01          # index signature
+            ''') + spec_block(522, '''
+            0000        # ascending
+            0000
+            0100        # for expression length
+            0000
+            0500        # key expression length
+            4e414d4500  # key expression: NAME
+            00          # for expression: (none)
+            '''),
+        spec_block(512, '''
+            0100                                        # root (interior) node
+            0200                                        # two keys
+            ffffffff ffffffff                           # no neighbours
+            425241564f202020 00000001 00000c00          # BRAVO,  record 1 -> node 0xc00
+            44454c5441202020 00000002 00000e00          # DELTA,  record 2 -> node 0xe00
+            '''),
+        spec_block(512, '''
+            0200                    # leaf node
+            0300                    # three keys
+            ffffffff 000e0000       # right neighbour at 0xe00
+            d201                    # 466 bytes free
+            ffff0000 0f 0f 10 04 04 03
+            030030                  # record 3, 0 duplicate, 3 trailing: ALPHA
+            050023                  # record 5, 3 duplicate, 2 trailing: (ALP)INE
+            010030                  # record 1, 0 duplicate, 3 trailing: BRAVO
+            ''', '''
+            425241564f 494e45 414c504841
+            '''),
+        spec_block(512, '''
+            0200                    # leaf node
+            0300                    # three keys
+            000c0000 ffffffff       # left neighbour at 0xc00
+            d201                    # 466 bytes free
+            ffff0000 0f 0f 10 04 04 03
+            040010                  # record 4, 0 duplicate, 1 trailing: CHARLIE
+            060025                  # record 6, 5 duplicate, 2 trailing: (CHARL)Y
+            020030                  # record 2, 0 duplicate, 3 trailing: DELTA
+            ''', '''
+            44454c5441 59 434841524c4945
+            '''),
+        spec_block(502, '''
+            00140000    # root node at 0x1400
+            ffffffff    # no free nodes
+            00160000    # end of file at 0x1600
+            0800        # key length
+            60          # compact, compound index
+            01          # index signature
+            ''') + spec_block(522, '''
+            0000        # ascending
+            0000
+            0100        # for expression length
+            0000
+            0400        # key expression length
+            51545900    # key expression: QTY
+            00          # for expression: (none)
+            '''),
+        spec_block(512, '''
+            0300                    # root leaf
+            0600                    # six keys
+            ffffffff ffffffff       # no neighbours
+            c801                    # 456 bytes free
+            ffff0000 0f 0f 10 04 04 03
+            020000                  # record 2, 0 duplicate, 0 trailing: -1
+            040070                  # record 4, 0 duplicate, 7 trailing: 0
+            010060                  # record 1, 0 duplicate, 6 trailing: 5
+            060061                  # record 6, 1 duplicate, 6 trailing: 7
+            050061                  # record 5, 1 duplicate, 6 trailing: 12
+            030061                  # record 3, 1 duplicate, 6 trailing: 30
+            ''', '''
+            3e 28 1c c014 80 400fffffffffffff
+            '''),
+        ])
+
+# a dBase III .ndx on NAME, following the published layout: a 512-byte
+# header, then 512-byte pages of a key count and (child page, record number,
+# key) entries, with the last child of an interior page after its keys;
+# interior keys are the last key of each child, and every key is in a leaf
+ndx_fixture = b''.join([
+        spec_block(512, '''
+            01000000    # root at page 1
+            04000000    # four pages
+            00000000
+            0800        # key length
+            1f00        # 31 keys per page
+            0000        # character keys
+            1000        # 16 bytes per entry
+            00 00 0000  # not unique
+            4e414d45    # key expression: NAME
+            '''),
+        spec_block(512, '''
+            01000000                                    # one key
+            02000000 00000000 425241564f202020          # page 2, up to BRAVO
+            03000000                                    # then page 3
+            '''),
+        spec_block(512, '''
+            03000000                                    # three keys
+            00000000 03000000 414c504841202020          # ALPHA    record 3
+            00000000 05000000 414c50494e452020          # ALPINE   record 5
+            00000000 01000000 425241564f202020          # BRAVO    record 1
+            '''),
+        spec_block(512, '''
+            03000000                                    # three keys
+            00000000 04000000 434841524c494520          # CHARLIE  record 4
+            00000000 06000000 434841524c592020          # CHARLY   record 6
+            00000000 02000000 44454c5441202020          # DELTA    record 2
+            '''),
+        ])
+
+# a dBase III .ndx on QTY, a lone root page: numeric keys are little-endian
+# doubles
+ndx_qty_fixture = b''.join([
+        spec_block(512, '''
+            01000000    # root at page 1
+            02000000    # two pages
+            00000000
+            0800        # key length
+            1f00        # 31 keys per page
+            0100        # numeric keys
+            1000        # 16 bytes per entry
+            00 00 0000  # not unique
+            515459      # key expression: QTY
+            '''),
+        spec_block(512, '''
+            06000000                                    # six keys
+            00000000 02000000 000000000000f0bf          # -1       record 2
+            00000000 04000000 0000000000000000          # 0        record 4
+            00000000 01000000 0000000000001440          # 5        record 1
+            00000000 06000000 0000000000001c40          # 7        record 6
+            00000000 05000000 0000000000002840          # 12       record 5
+            00000000 03000000 0000000000003e40          # 30       record 3
+            '''),
+        ])
+
+# a Clipper .ntx on NAME, following the published layout: a 1024-byte header,
+# then 1024-byte pages of an item count, a table of item offsets, and (child
+# offset, record number, key) items, the last holding only a child; interior
+# items are keys too, so BRAVO is only in the root
+ntx_fixture = b''.join([
+        spec_block(1024, '''
+            0600        # signature
+            0100        # version
+            00040000    # root at 0x400
+            00000000    # no free pages
+            1000        # 16 bytes per item
+            0800        # key length
+            0000        # no decimals
+            3700        # 55 items per page
+            1b00        # at least 27 items per page
+            4e414d45    # key expression: NAME
+            '''),
+        spec_block(1024, '''
+            0100                                        # one item
+            7200 8200 ''' + '0000' * 54 + '''           # item offsets
+            00080000 01000000 425241564f202020          # page 0x800, then BRAVO record 1
+            000c0000 00000000 0000000000000000          # then page 0xc00
+            '''),
+        spec_block(1024, '''
+            0200                                        # two items
+            7200 8200 9200 ''' + '0000' * 53 + '''      # item offsets
+            00000000 03000000 414c504841202020          # ALPHA    record 3
+            00000000 05000000 414c50494e452020          # ALPINE   record 5
+            00000000 00000000 0000000000000000
+            '''),
+        spec_block(1024, '''
+            0300                                        # three items
+            7200 8200 9200 a200 ''' + '0000' * 52 + ''' # item offsets
+            00000000 04000000 434841524c494520          # CHARLIE  record 4
+            00000000 06000000 434841524c592020          # CHARLY   record 6
+            00000000 02000000 44454c5441202020          # DELTA    record 2
+            00000000 00000000 0000000000000000
+            '''),
+        ])
+
 def unicodify(data):
     if isinstance(data, list):
         for i, item in enumerate(data):
@@ -4195,6 +4474,973 @@ class TestDbfFunctions(TestCase):
         self.assertEqual(i, len(table))
         table.close()
 
+    def test_read_ahead(self):
+        "sequential scans with a read-ahead buffer"
+        table = self.dbf_table
+        table.open(mode=READ_WRITE)
+        self.assertEqual(table.read_ahead, dbf.default_read_ahead)
+        self.assertRaises(ValueError, setattr, table, 'read_ahead', 0)
+        table.read_ahead = 7
+        for i, record in enumerate(table):
+            self.assertEqual(record.name, self.dbf_namelist[i])
+            self.assertEqual(record.desc, self.dbf_desclist[i])
+            if i % 5 == 0:
+                with record:
+                    record.name = 'changed %d' % i
+        del record
+        for i, record in enumerate(table):
+            if i % 5 == 0:
+                self.assertEqual(record.name.strip(), 'changed %d' % i)
+            else:
+                self.assertEqual(record.name, self.dbf_namelist[i])
+        self.assertEqual(table[-1].name, self.dbf_namelist[-1])
+        self.assertEqual(table[3].name, self.dbf_namelist[3])
+        table.close()
+        table.open(mode=READ_WRITE)
+        table.read_ahead = len(table)
+        table.record_cache = 0
+        self.assertEqual(table[0].name.strip(), 'changed 0')
+        with table[11] as record:
+            record.name = 'buffered'
+        del record
+        self.assertEqual(table[11].name.strip(), 'buffered')
+        table.close()
+
+    def test_record_cache(self):
+        "recently used records are kept in memory"
+        table = self.dbf_table
+        table.open(mode=READ_WRITE)
+        self.assertEqual(table.record_cache, dbf.default_record_cache)
+        self.assertRaises(ValueError, setattr, table, 'record_cache', -1)
+        table.record_cache = 3
+        first = id(table[0])
+        self.assertEqual(id(table[0]), first)
+        for i in range(1, 6):
+            table[i]
+        self.assertEqual(table.cache_info(), (1, 6, 3, 3))
+        self.assertEqual(len(table._table._weakref_list), 3)
+        # records in use keep their identity even when pushed out of the cache
+        record = table[7]
+        for i in range(8, 12):
+            table[i]
+        self.assertTrue(table[7] is record)
+        with record:
+            record.name = 'cached'
+        del record
+        self.assertEqual(table[7].name.strip(), 'cached')
+        table.record_cache = 0
+        for i in range(5):
+            table[i]
+        self.assertEqual(table.cache_info().currsize, 0)
+        self.assertEqual(len(table._table._weakref_list), 0)
+        table.close()
+        table.open()
+        self.assertEqual(table[7].name.strip(), 'cached')
+        table.close()
+        cache = dbf.LruCache(maxsize=10, maxbytes=8)
+        cache['a'] = 'abc'
+        cache['b'] = 'defg'
+        cache['c'] = 'hi'
+        self.assertFalse('a' in cache)
+        self.assertEqual(cache.get('b'), 'defg')
+        self.assertEqual(cache.bytes, 6)
+        del cache['c']
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('c', 'missing'), 'missing')
+        self.assertEqual(cache.info(), (1, 1, 10, 1))
+
+    def test_record_tuple(self):
+        "records decoded in one pass"
+        for table in (self.dbf_table, self.vfp_table):
+            table.open(mode=READ_WRITE)
+            names = field_names(table)
+            for record in table:
+                values = record._as_tuple()
+                self.assertEqual(values, tuple(record[name] for name in names))
+                self.assertEqual(tuple(record), values)
+                self.assertEqual(scatter(record, as_type=tuple), values)
+            with table[3] as record:
+                record.desc = 'in flux'
+                self.assertEqual(record._as_tuple()[names.index('desc')], 'in flux')
+            table.close()
+        table = Table(
+                os.path.join(tempdir, 'nulltuple'),
+                'name C(10) null; age N(3,0) null; wisdom M null',
+                dbf_type='vfp',
+                )
+        with table:
+            table.append(('ethan', 29, 'some'))
+            table.append({'name': 'ethan'})
+            self.assertEqual(table[0]._as_tuple(), ('ethan     ', 29, 'some'))
+            self.assertTrue(table[1]._as_tuple()[1] is Null)
+            self.assertTrue(table[1]._as_tuple()[2] is Null)
+        table.close()
+
+    def test_row_encoder(self):
+        "records encoded in one pass"
+        table = Table(
+                os.path.join(tempdir, 'nullencode'),
+                'name C(10) null; age N(3,0) null; wisdom M null; paid L',
+                dbf_type='vfp',
+                )
+        with table:
+            table.append(('ethan', 29, 'some', True))
+            table.append({'name': 'ethan', 'wisdom': Null})
+            table.append({'NAME': 'tony', 'nonesuch': 1}, drop=True)
+            self.assertRaises(FieldMissingError, table.append, {'name': 'tony', 'nonesuch': 1})
+            self.assertRaises(DataOverflowError, table.append, {'name': 'a much longer name', 'wisdom': 'lost'})
+            self.assertRaises(DataOverflowError, table.append, ('ethan', 1234))
+            self.assertEqual(len(table), 3)
+            self.assertEqual(table[0]._as_tuple(), ('ethan     ', 29, 'some', True))
+            self.assertEqual(table[1].name, 'ethan     ')
+            self.assertTrue(table[1].age is Null)
+            self.assertTrue(table[1].wisdom is Null)
+            self.assertEqual(table[2].name, 'tony      ')
+            record = table[0]
+            gather(record, {'age': Null, 'wisdom': 'more'})
+            self.assertTrue(record.age is Null)
+            self.assertEqual(record.wisdom, 'more')
+            self.assertRaises(DataOverflowError, gather, record, {'age': 5, 'name': 'a much longer name'})
+            self.assertTrue(record.age is Null)
+            with record:
+                record.age = 30
+                record.name = 'e'
+            self.assertEqual(record._as_tuple(), ('e         ', 30, 'more', True))
+        table.close()
+        table.open()
+        self.assertEqual(table[0]._as_tuple(), ('e         ', 30, 'more', True))
+        self.assertTrue(table[1].age is Null)
+        table.close()
+
+    def test_iter_rows(self):
+        "rows decoded without creating records"
+        table = self.vfp_table
+        table.open(mode=READ_WRITE)
+        dbf.delete(table[2])
+        expected = [record._as_tuple() for record in table]
+        table.record_cache = 0
+        rows = list(table.iter_rows())
+        self.assertEqual(rows, expected)
+        self.assertEqual(len(table._table._weakref_list), 0)
+        rows = list(table.iter_rows(include_deleted=False, start=1, stop=5))
+        self.assertEqual(rows, expected[1:2] + expected[3:5])
+        rows = list(table.iter_rows('qty, name', as_type='namedtuple'))
+        self.assertEqual(rows[7].name, self.vfp_namelist[7])
+        self.assertEqual(rows[7].qty, table[7].qty)
+        self.assertEqual(rows[7], (table[7].qty, self.vfp_namelist[7]))
+        self.assertTrue(type(rows[0]) is type(next(table.iter_rows(['qty', 'name'], as_type='namedtuple'))))
+        rows = list(table.iter_rows(['desc'], as_type='dict'))
+        self.assertEqual(rows[5], {'DESC': self.vfp_desclist[5]})
+        self.assertRaises(FieldMissingError, list, table.iter_rows('nonesuch'))
+        self.assertRaises(DbfError, list, table.iter_rows(as_type='list'))
+        dbf.undelete(table[2])
+        table.close()
+        self.assertRaises(DbfError, list, table.iter_rows())
+        table = Table(':memory:', 'name C(10); age N(3,0) null', dbf_type='vfp', on_disk=False)
+        table.open(mode=READ_WRITE)
+        table.append(('ethan', 29))
+        table.append({'name': 'allen'})
+        self.assertEqual(list(table.iter_rows(as_type='namedtuple')), [('ethan     ', 29), ('allen     ', Null)])
+
+    def test_parallel_scan(self):
+        "records scanned by several processes"
+        table = self.dbf_table
+        expected = [(i, name.strip()) for i, name in enumerate(self.dbf_namelist)]
+        longest = reduce(longer_name, expected)
+        for workers, chunk in ((1, None), (3, 4), (2, len(table))):
+            results = dbf.parallel_scan(table.filename, name_and_recno, workers=workers, chunk=chunk)
+            self.assertEqual(results, expected)
+            result = dbf.parallel_scan(table.filename, name_and_recno, workers=workers, chunk=chunk, reducer=longer_name)
+            self.assertEqual(result, longest)
+        self.assertRaises(ValueError, dbf.parallel_scan, table.filename, name_and_recno, workers=0)
+        self.assertEqual(dbf.parallel_scan(self.empty_dbf_table.filename, name_and_recno, workers=2), [])
+        self.assertRaises(DbfError, dbf.parallel_scan, self.empty_dbf_table.filename, name_and_recno, reducer=longer_name)
+
+    def test_threaded_reads(self):
+        "one open table read by several threads"
+        import threading
+        errors = []
+        for table, names, descs in (
+                (self.dbf_table, self.dbf_namelist, self.dbf_desclist),
+                (self.vfp_table, self.vfp_namelist, self.vfp_desclist),
+            ):
+            table.open(mode=READ_WRITE)
+            table.record_cache = 0
+            table.read_ahead = 3
+            def reader(offset):
+                try:
+                    for n in range(20):
+                        for i in range(offset, len(table), 3):
+                            table.goto(i)
+                            record = table[i]
+                            if record.name != names[i] or record.desc != descs[i]:
+                                errors.append((i, record.name, record.desc))
+                            if recno(table.current_record) != i:
+                                errors.append(('navigation', i, recno(table.current_record)))
+                except Exception:
+                    errors.append(sys.exc_info()[1])
+            threads = [threading.Thread(target=reader, args=(i % 3, )) for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(table._index, -1)
+            table.goto(5)
+            thread = threading.Thread(target=table.goto, args=(7, ))
+            thread.start()
+            thread.join()
+            self.assertEqual(recno(table.current_record), 5)
+            table.close()
+        self.assertEqual(errors, [])
+
+    def test_memo_cache(self):
+        "recently read memos are kept in memory"
+        for table, descs in ((self.dbf_table, self.dbf_desclist), (self.vfp_table, self.vfp_desclist)):
+            table.open(mode=READ_WRITE)
+            self.assertEqual(table.memo_cache, dbf.default_memo_cache)
+            self.assertRaises(ValueError, setattr, table, 'memo_cache', -1)
+            self.assertEqual(table[1].desc, descs[1])
+            self.assertEqual(table[1].desc, descs[1])
+            hits, misses, maxsize, currsize = table.memo_cache_info()
+            self.assertEqual((hits, misses, maxsize), (1, 1, dbf.default_memo_cache))
+            self.assertTrue(currsize >= len(descs[1]))
+            self.assertEqual(scatter(table[1])['desc'], descs[1])
+            self.assertEqual(table.memo_cache_info().hits, 2)
+            with table[1] as record:
+                record.desc = 'a new memo'
+            self.assertEqual(table[1].desc, 'a new memo')
+            table.memo_cache = len(descs[2]) + 1
+            self.assertTrue(table.memo_cache_info().currsize <= len(descs[2]) + 1)
+            self.assertEqual(table[2].desc, descs[2])
+            self.assertEqual(table[3].desc, descs[3])
+            self.assertEqual(table[2].desc, descs[2])
+            self.assertTrue(table.memo_cache_info().currsize <= len(descs[2]) + 1)
+            table.zap()
+            self.assertEqual(table.memo_cache_info().currsize, 0)
+            table.append({'name': 'zapped', 'desc': 'fresh'})
+            self.assertEqual(table[0].desc, 'fresh')
+            table.close()
+        self.assertEqual(Table(':memory:', 'desc M', on_disk=False).memo_cache_info(), (0, 0, 0, 0))
+
+    def test_large_db3_memos(self):
+        "db3 memos read in chunks and through a memory map"
+        filename = os.path.join(tempdir, 'bigmemo')
+        table = Table(filename, 'name C(10); notes M', dbf_type='db3')
+        sizes = (1, 510, 511, 4094, 4095, 4096, 8191, 300000)
+        notes = []
+        with table:
+            for size in sizes:
+                note = ('abc\x1a' * size)[:size-1] + 'z'    # a trailing ^Z would merge with the terminator
+                notes.append(note)
+                table.append(('%d' % size, note))
+        table.close()
+        for mmap in (False, True):
+            table = Table(filename, mmap=mmap)
+            table.memo_cache = 0
+            with table:
+                self.assertEqual(isinstance(table._meta.mfd, dbf._MappedFile), mmap)
+                for record, note in zip(table, notes):
+                    self.assertEqual(record.notes, note)
+                table.append(('more', 'after mapping'))
+                self.assertEqual(table[-1].notes, 'after mapping')
+                self.assertEqual(table[len(sizes)-1].notes, notes[-1])
+            table.close()
+
+    def test_buffered_memo_writes(self):
+        "memos are buffered and written with the next block pointer on flush"
+        for dbf_type, pointer in (('db3', '<'), ('vfp', '>')):
+            filename = os.path.join(tempdir, 'memobuffer_%s' % dbf_type)
+            table = Table(filename, 'name C(10); notes M', dbf_type=dbf_type)
+            with table:
+                table.append(('first', 'one memo'))
+                memo = table._meta.memo
+                self.assertEqual(len(memo.pending), 0)
+                for record in dbf.Process(table):
+                    record.notes = 'x' * 1000
+                    record.notes = 'y' * 10
+                # a committed record never points at memos still in the buffer
+                self.assertEqual(len(memo.pending), 0)
+                with open(table._meta.memoname, 'rb') as memo_file:
+                    self.assertEqual(struct.unpack(pointer + 'L', memo_file.read(4))[0], memo.nextmemo)
+                with table[0] as record:
+                    record.notes = 'z' * 600
+                self.assertEqual(len(memo.pending), 0)
+                self.assertEqual(table[0].notes, 'z' * 600)
+                # memos written without a record go through the buffer
+                block = memo.put_memo(b'buffered')
+                self.assertTrue(memo.pending)
+                self.assertEqual(memo.get_memo(block), b'buffered')
+                self.assertEqual(len(memo.pending), 0)
+                for record in dbf.Process(table):
+                    record.notes = 'a longer note'
+                nextmemo = memo.nextmemo
+            self.assertEqual(memo.pending, bytearray())
+            with open(table._meta.memoname, 'rb') as memo_file:
+                self.assertEqual(struct.unpack(pointer + 'L', memo_file.read(4))[0], nextmemo)
+            dbf.verify_memos = True
+            try:
+                with table:
+                    self.assertEqual(table[0].notes, 'a longer note')
+                    table.append(('second', 'two'))
+                    self.assertEqual(table._meta.memo.nextmemo, nextmemo + 1)
+                    self.assertEqual(table[1].notes, 'two')
+            finally:
+                dbf.verify_memos = False
+            table.close()
+
+    def test_restructure_streaming(self):
+        "changing the layout copies unchanged fields as bytes and converts the rest"
+        for on_disk in (True, False):
+            table = Table(
+                    os.path.join(tempdir, 'restructure'),
+                    'name C(20); qty N(5,0); paid L; notes M; born D NULL',
+                    dbf_type='vfp', on_disk=on_disk,
+                    )
+            table.open(mode=READ_WRITE)
+            rows = []
+            for i in range(30):
+                row = ('name %d' % i, i * 3, i % 2 == 0, 'note %d' % i * i, Null if i % 4 else Date(2000, 1, i % 28 + 1))
+                rows.append(row)
+                table.append(row)
+            dbf.delete(table[5])
+            mapper = dbf._RowMapper(table._meta, table._meta)
+            self.assertEqual(mapper.converts, ('NOTES', ))
+            self.assertEqual(len(mapper.copies), 2)
+            table.add_fields('extra C(5)')
+            table.resize_field('name', 8)
+            table.delete_fields('qty')
+            self.assertEqual(len(table), 30)
+            for i, record in enumerate(table):
+                name, qty, paid, notes, born = rows[i]
+                self.assertEqual(record.name, name.ljust(8))
+                self.assertEqual(record.paid, paid)
+                self.assertEqual(record.notes, notes)
+                self.assertTrue(record.born is born or record.born == born)
+                self.assertEqual(record.extra, '     ')
+                self.assertEqual(dbf.is_deleted(record), i == 5)
+            table.disallow_nulls('born')
+            for i, record in enumerate(table):
+                if rows[i][4] is Null:
+                    self.assertFalse(record.born)
+                else:
+                    self.assertEqual(record.born, rows[i][4])
+            table.close()
+
+    def test_index_bulk_build(self):
+        "indices are built with one sort and merge batches of changes"
+        table = Table(':memory:', 'name C(10); qty N(5,0)', on_disk=False)
+        table.open(mode=READ_WRITE)
+        for i in range(200):
+            table.append(('n%d' % (i * 7 % 13), i))
+        bonus = {}
+        def key(record):
+            if record.qty % 10 == 9:
+                return DoNotIndex
+            return record.name, bonus.get(dbf.recno(record), 0)
+        index = table.create_index(key)
+        def expected():
+            pairs = [(key(r), dbf.recno(r)) for r in table if key(r) is not DoNotIndex]
+            pairs.sort(key=lambda pair: pair[0])
+            return [recno for value, recno in pairs]
+        self.assertEqual(len(index), 180)
+        self.assertEqual(index._rec_by_val, expected())
+        # appends in key order take the fast path
+        table.append(('zz', 1000))
+        table.append(('zz', 1001))
+        self.assertEqual(index._rec_by_val[-2:], [200, 201])
+        self.assertEqual(index._rec_by_val, expected())
+        for recno in range(0, 200, 3):
+            bonus[recno] = -recno
+        index.update(table[recno] for recno in range(0, 202, 3))
+        self.assertEqual(index._rec_by_val, expected())
+        self.assertEqual(index._values, sorted(index._values))
+        self.assertEqual(len(index._records), len(index._values))
+        table.extend([('a', 1), ('zzz', 2), ('n3', 19)])
+        self.assertEqual(index._rec_by_val, expected())
+        table.close()
+
+    def test_deferred_indexes(self):
+        "index maintenance held back by deferred_indexes() is applied once on exit"
+        filename = os.path.join(tempdir, 'deferred')
+        table = Table(filename, 'name C(10); qty N(6,0)')
+        table.open(mode=READ_WRITE)
+        table.extend([('n%03d' % (i * 37 % 200), i) for i in range(200)])
+        calls = []
+        def by_qty(record):
+            calls.append(dbf.recno(record))
+            return record.qty
+        qty_index = table.create_index(by_qty)
+        name_index = table.create_index(lambda rec: rec.name, name='by_name')
+        self.assertEqual(len(table._indexen), 2)
+        del calls[:]
+        with table.deferred_indexes():
+            with table.deferred_indexes():
+                for record in table[:50]:
+                    dbf.write(record, qty=1000 - dbf.recno(record))
+            # still deferred until the outer block exits
+            self.assertEqual(qty_index[-1].qty, 199)
+            table.append(('a', -1))
+            dbf.write(table[0], name='zzz')
+            self.assertEqual(calls, [])
+            self.assertEqual(len(name_index), 200)
+        self.assertEqual(sorted(calls), list(range(50)) + [200])
+        self.assertEqual([r.qty for r in qty_index], sorted(r.qty for r in table))
+        self.assertEqual(qty_index[0].name.strip(), 'a')
+        self.assertEqual(len(name_index), 201)
+        self.assertEqual([r.name for r in name_index], sorted(r.name for r in table))
+        self.assertEqual(name_index[-1].name.strip(), 'zzz')
+        # and without deferral, each write updates the indices at once
+        dbf.write(table[1], qty=-5)
+        self.assertEqual(qty_index[0].qty, -5)
+        self.assertFalse(table._indexen.dirty)
+        del qty_index
+        self.assertEqual(len(table._indexen), 1)
+        # closing inside the block brings the indices up to date first
+        with table.deferred_indexes():
+            dbf.write(table[2], name='aaa')
+            table.close()
+        self.assertFalse(table._indexen.dirty)
+        table.open(mode=READ_WRITE)
+        name_index = table.create_index(lambda rec: rec.name, name='by_name')
+        self.assertEqual([dbf.recno(r) for r in name_index.search('aaa'.ljust(10))], [2])
+        self.assertEqual([r.name for r in name_index], sorted(r.name for r in table))
+        table.close()
+
+    def test_hash_index(self):
+        "hash indices answer equality lookups and follow record changes"
+        filename = os.path.join(tempdir, 'hashed')
+        table = Table(filename, 'cust C(10); qty N(6,0)')
+        table.open(mode=READ_WRITE)
+        table.extend([('c%03d' % (i % 50), i) for i in range(200)])
+        def cust(record):
+            if record.qty < 0:
+                return DoNotIndex
+            return record.cust.strip()
+        index = table.create_hash_index(cust)
+        self.assertTrue(isinstance(index, dbf.HashIndex))
+        self.assertEqual(len(index), 200)
+        found = index.search('c007')
+        self.assertTrue(isinstance(found, List))
+        self.assertEqual([dbf.recno(r) for r in found], [7, 57, 107, 157])
+        self.assertEqual([dbf.recno(r) for r in index['c007']], [7, 57, 107, 157])
+        self.assertEqual([dbf.recno(r) for r in index[table[57]]], [7, 57, 107, 157])
+        self.assertEqual(len(index.search('nope')), 0)
+        self.assertRaises(NotFoundError, index.__getitem__, 'nope')
+        self.assertTrue(table[7] in index)
+        self.assertRaises(DbfError, index.index_search, 'c007')
+        dbf.write(table[7], cust='zzz')
+        dbf.write(table[57], qty=-1)
+        table.append(('c007', 500))
+        self.assertEqual([dbf.recno(r) for r in index['c007']], [107, 157, 200])
+        self.assertEqual([dbf.recno(r) for r in index['zzz']], [7])
+        self.assertEqual(len(index), 200)
+        self.assertEqual(len(index.search('c00', partial=True)), 39)
+        # positions follow record order
+        self.assertEqual([dbf.recno(r) for r in index[:3]], [0, 1, 2])
+        self.assertEqual(dbf.recno(index[-1]), 200)
+        self.assertEqual(len(list(index)), 200)
+        with table.deferred_indexes():
+            for record in table[100:110]:
+                dbf.write(record, cust='bulk')
+            self.assertEqual(len(index.search('bulk')), 0)
+        self.assertEqual(len(index['bulk']), 10)
+        for record in index['c007']:
+            dbf.delete(record)
+        table.pack()
+        self.assertEqual(len(index), 198)
+        self.assertFalse(index.search('c007'))
+        self.assertEqual([dbf.recno(r) for r in index['zzz']], [7])
+        table.close()
+
+    def test_idx_fixture(self):
+        "Idx reads a .idx laid out byte by byte from the FoxPro file structure"
+        table = Table(':memory:', 'name C(8); qty N(5,0)', on_disk=False)
+        table.open(mode=READ_WRITE)
+        table.extend(fixture_rows)
+        filename = os.path.join(tempdir, 'fixture.idx')
+        with open(filename, 'wb') as idx:
+            idx.write(idx_fixture)
+        for mmap in (False, True):
+            idx = dbf.Idx(table, filename, mmap=mmap)
+            self.assertEqual(idx.header.key_expr, b'NAME')
+            self.assertEqual(idx.header.key_length, 8)
+            self.assertTrue(idx.root_node.is_root())
+            self.assertFalse(idx.root_node.is_leaf())
+            self.assertEqual([dbf.recno(r) for r in idx], [2, 4, 0, 3, 5, 1])
+            self.assertEqual([dbf.recno(r) for r in idx.backward()], [1, 5, 3, 0, 4, 2])
+            self.assertEqual(dbf.recno(idx.seek('ALPINE')), 4)
+            self.assertEqual(dbf.recno(idx.seek('CHARLY')), 5)
+            self.assertEqual(dbf.recno(idx.seek('DELTA')), 1)
+            self.assertEqual(dbf.recno(idx.seek('CHAR', partial=True)), 3)
+            self.assertRaises(NotFoundError, idx.seek, 'ALP')
+            self.assertRaises(NotFoundError, idx.seek, 'ECHO')
+            self.assertEqual([r.name.strip() for r in idx.range('ALPINE', 'CHARLY')], ['ALPINE', 'BRAVO', 'CHARLIE'])
+            self.assertEqual([r.name.strip() for r in idx.range('C')], ['CHARLIE', 'CHARLY', 'DELTA'])
+            self.assertEqual([r.name.strip() for r in idx.range(hi='ALPINE')], ['ALPHA'])
+            self.assertEqual(list(idx.range('E')), [])
+            # nodes already read are not read again
+            before = idx.read_node.info().misses
+            idx.seek('CHARLY')
+            self.assertEqual(idx.read_node.info().misses, before)
+            idx.close()
+        # an index of no records is a lone root leaf without keys
+        with open(filename, 'wb') as idx:
+            idx.write(idx_fixture[:512])
+            idx.write(spec_block(512, '0300 0000 ffffffff ffffffff'))
+        idx = dbf.Idx(table, filename)
+        self.assertEqual(list(idx), [])
+        self.assertRaises(NotFoundError, idx.seek, 'ALPHA')
+        idx.close()
+        table.close()
+
+    def test_cdx_fixture(self):
+        "Cdx reads a .cdx laid out byte by byte from the FoxPro compact index structure"
+        table = Table(':memory:', 'name C(8); qty N(5,0)', on_disk=False)
+        table.open(mode=READ_WRITE)
+        table.extend(fixture_rows)
+        filename = os.path.join(tempdir, 'fixture.cdx')
+        with open(filename, 'wb') as cdx:
+            cdx.write(cdx_fixture)
+        for mmap in (False, True):
+            cdx = dbf.Cdx(table, filename, mmap=mmap)
+            self.assertEqual(cdx.tags(), ['NAME', 'QTY'])
+            self.assertTrue('qty' in cdx)
+            self.assertRaises(NotFoundError, cdx.__getitem__, 'missing')
+            name, qty = cdx['name'], cdx['qty']
+            self.assertEqual((name.key_expr, qty.key_expr), (b'NAME', b'QTY'))
+            self.assertEqual(name.for_expr, b'')
+            self.assertEqual((name.trail, qty.trail), (b' ', b'\x00'))
+            self.assertFalse(name.descending)
+            self.assertFalse(name.root_node.is_leaf())
+            leaves = [name.read_node(0xc00), name.read_node(0xe00)]
+            self.assertEqual(
+                    [(key.key, key.rec_no) for leaf in leaves for key in leaf.keys()],
+                    [
+                        (b'ALPHA   ', 2), (b'ALPINE  ', 4), (b'BRAVO   ', 0),
+                        (b'CHARLIE ', 3), (b'CHARLY  ', 5), (b'DELTA   ', 1),
+                        ],
+                    )
+            self.assertEqual([dbf.recno(r) for r in name], [2, 4, 0, 3, 5, 1])
+            self.assertEqual([dbf.recno(r) for r in name.backward()], [1, 5, 3, 0, 4, 2])
+            self.assertEqual(dbf.recno(name.seek('ALPINE')), 4)
+            self.assertEqual(dbf.recno(name.seek('CHARLY')), 5)
+            self.assertEqual(dbf.recno(name.seek('CHARL', partial=True)), 3)
+            self.assertRaises(NotFoundError, name.seek, 'ECHO')
+            self.assertEqual([r.name.strip() for r in name.range('ALPINE', 'CHARLY')], ['ALPINE', 'BRAVO', 'CHARLIE'])
+            self.assertEqual(
+                    [(key.key, key.rec_no) for key in qty.root_node.keys()],
+                    [(qty.key_bytes(n), rec_no) for n, rec_no in ((-1, 1), (0, 3), (5, 0), (7, 5), (12, 4), (30, 2))],
+                    )
+            self.assertEqual([r.qty for r in qty], [-1, 0, 5, 7, 12, 30])
+            self.assertEqual([r.qty for r in qty.backward()], [30, 12, 7, 5, 0, -1])
+            self.assertEqual(dbf.recno(qty.seek(-1)), 1)
+            self.assertEqual(dbf.recno(qty.seek(7)), 5)
+            self.assertRaises(NotFoundError, qty.seek, 6)
+            self.assertEqual([r.qty for r in qty.range(0, 12)], [0, 5, 7])
+            cdx.close()
+        table.close()
+
+    def test_ndx_ntx_fixtures(self):
+        "Ndx and Ntx read files laid out byte by byte from the dBase III and Clipper layouts"
+        table = Table(':memory:', 'name C(8); qty N(5,0)', on_disk=False)
+        table.open(mode=READ_WRITE)
+        table.extend(fixture_rows)
+        for cls, fixture in ((dbf.Ndx, ndx_fixture), (dbf.Ntx, ntx_fixture)):
+            filename = os.path.join(tempdir, 'fixture.' + cls.__name__.lower())
+            with open(filename, 'wb') as index:
+                index.write(fixture)
+            for mmap in (False, True):
+                index = cls(table, filename, mmap=mmap)
+                self.assertEqual(index.key_expr, b'NAME')
+                self.assertEqual(index.header.key_length, 8)
+                self.assertFalse(index.root_node.is_leaf())
+                self.assertEqual([dbf.recno(r) for r in index], [2, 4, 0, 3, 5, 1])
+                self.assertEqual([dbf.recno(r) for r in index.backward()], [1, 5, 3, 0, 4, 2])
+                self.assertEqual(dbf.recno(index.seek('ALPINE')), 4)
+                self.assertEqual(dbf.recno(index.seek('BRAVO')), 0)
+                self.assertEqual(dbf.recno(index.seek('CHARLY')), 5)
+                self.assertEqual(dbf.recno(index.seek('CHAR', partial=True)), 3)
+                self.assertRaises(NotFoundError, index.seek, 'ALP')
+                self.assertRaises(NotFoundError, index.seek, 'ECHO')
+                self.assertEqual(
+                        [r.name.strip() for r in index.range('ALPINE', 'CHARLY')],
+                        ['ALPINE', 'BRAVO', 'CHARLIE'],
+                        )
+                self.assertEqual([r.name.strip() for r in index.range('BRAVO')], ['BRAVO', 'CHARLIE', 'CHARLY', 'DELTA'])
+                self.assertEqual([r.name.strip() for r in index.range(hi='BRAVO')], ['ALPHA', 'ALPINE'])
+                index.close()
+        filename = os.path.join(tempdir, 'fixture_qty.ndx')
+        with open(filename, 'wb') as index:
+            index.write(ndx_qty_fixture)
+        qty = dbf.Ndx(table, filename)
+        self.assertTrue(qty.root_node.is_leaf())
+        self.assertEqual([r.qty for r in qty], [-1, 0, 5, 7, 12, 30])
+        self.assertEqual([r.qty for r in qty.backward()], [30, 12, 7, 5, 0, -1])
+        self.assertEqual(dbf.recno(qty.seek(-1)), 1)
+        self.assertEqual(dbf.recno(qty.seek(12)), 4)
+        self.assertRaises(NotFoundError, qty.seek, 6)
+        self.assertEqual([r.qty for r in qty.range(0, 12)], [0, 5, 7])
+        qty.close()
+        # Clipper keys are text, numbers included
+        ntx = dbf.Ntx(table, os.path.join(tempdir, 'fixture.ntx'))
+        self.assertEqual(ntx.key_bytes(12), b'00000012')
+        self.assertEqual(ntx.key_bytes(datetime.date(2020, 1, 2)), b'20200102')
+        self.assertTrue(ntx.key_bytes(-12) < ntx.key_bytes(-5) < ntx.key_bytes(0) < ntx.key_bytes(3))
+        ntx.close()
+        table.close()
+
+    def test_index_duplicate_keys(self):
+        "changing a record with a duplicated key moves that record's entry"
+        table = Table(':memory:', 'name C(10); qty N(5,0)', on_disk=False)
+        table.open(mode=READ_WRITE)
+        for i in range(60):
+            table.append(('n%d' % (i % 4), i))
+        index = table.create_index(lambda rec: rec.name)
+        def check():
+            for value, rec_num in zip(index._values, index._rec_by_val):
+                self.assertEqual(value, (table[rec_num].name, ))
+            self.assertEqual(sorted(index._rec_by_val), list(range(len(table))))
+            self.assertEqual(len(index._values), len(index._records))
+            self.assertEqual(index._values, sorted(index._values))
+        # the first record with a key is not the one changing
+        dbf.write(table[9], name='n0')
+        check()
+        self.assertEqual(dbf.recno(index[-1]), 59)
+        self.assertEqual(len(index.search('n1'.ljust(10))), 14)
+        for i in range(300):
+            dbf.write(table[i * 37 % 60], name='n%d' % (i * 11 % 5))
+            check()
+        for i in range(60):
+            self.assertEqual(len(index.search(table[i].name)), len([r for r in table if r.name == table[i].name]))
+        table.close()
+
+    def test_persistent_index(self):
+        "named indices are kept in a .pdx file and reused when the table is reopened"
+        filename = os.path.join(tempdir, 'persistent')
+        table = Table(filename, 'name C(10); qty N(6,0)')
+        table.open(mode=READ_WRITE)
+        table.extend([('n%d' % (i * 7919 % 3000), i) for i in range(3000)])
+        by_name = table.create_index(lambda rec: rec.name.strip(), name='by_name', key_id='name')
+        by_qty = table.create_index(lambda rec: -rec.qty, name='by_qty')
+        self.assertTrue(isinstance(by_name, dbf.ContainedIndex))
+        self.assertEqual(len(by_name), 3000)
+        names = sorted(('n%d' % (i * 7919 % 3000), i) for i in range(3000))
+        self.assertEqual([dbf.recno(r) for r in by_name[:5]], [n[1] for n in names[:5]])
+        self.assertEqual(by_qty[0].qty, 2999)
+        self.assertEqual([r.qty for r in by_name.search('n1000')], [dict((n, i) for n, i in names)['n1000']])
+        self.assertEqual(len(by_name.search('n10', partial=True)), 111)
+        dbf.write(table[5], name='aaa')
+        table.append(('zzz', -1))
+        self.assertEqual(dbf.recno(by_name[0]), 5)
+        self.assertEqual(by_name[-1].name.strip(), 'zzz')
+        self.assertEqual(by_qty[-1].name.strip(), 'zzz')
+        self.assertTrue(table[5] in by_name)
+        self.assertEqual(by_name.index_search('aaa'), 0)
+        self.assertFalse(by_name.index_search('aab', nearest=True))
+        table.close()
+        del by_name, by_qty
+        table = Table(filename)
+        table.open(mode=READ_WRITE)
+        calls = []
+        def name_key(record):
+            calls.append(dbf.recno(record))
+            return record.name.strip()
+        # reused as stored, without running the key function over the table
+        by_name = table.create_index(name_key, name='by_name', key_id='name')
+        self.assertEqual(calls, [])
+        self.assertEqual(len(by_name), 3001)
+        self.assertEqual(dbf.recno(by_name[0]), 5)
+        self.assertEqual([r.name.strip() for r in by_name[-2:]], ['n999', 'zzz'])
+        for record in table[:10]:
+            dbf.delete(record)
+        table.pack()
+        self.assertEqual(len(by_name), 2991)
+        self.assertEqual(by_name[0].name.strip(), 'n1')
+        by_qty = table.create_index(lambda rec: -rec.qty, name='by_qty')
+        self.assertEqual(len(by_qty), 2991)
+        self.assertEqual(by_qty[0].qty, 2999)
+        # the same name with another key is rebuilt, not reused
+        by_qty = table.create_index(lambda rec: rec.qty, name='by_qty')
+        self.assertEqual(by_qty[0].name.strip(), 'zzz')
+        self.assertEqual([r.qty for r in by_qty[1:3]], [10, 11])
+        self.assertEqual(dbf._key_id(lambda rec: rec.qty), dbf._key_id(lambda rec: rec.qty))
+        self.assertNotEqual(dbf._key_id(lambda rec: rec.qty), dbf._key_id(lambda rec: -rec.qty))
+        self.assertNotEqual(dbf._key_id(lambda rec: rec.qty), dbf._key_id(lambda rec: rec.name))
+        index_file = table._meta.index_file
+        by_qty.drop()
+        self.assertTrue(index_file.free)
+        self.assertFalse('by_qty' in index_file.directory)
+        table.close()
+
+    def test_persistent_index_stale(self):
+        "a stored index is rebuilt if the table changed while it was not loaded"
+        filename = os.path.join(tempdir, 'stale')
+        table = Table(filename, 'name C(10)')
+        table.open(mode=READ_WRITE)
+        table.extend([('n%d' % i, ) for i in range(100)])
+        byname = table.create_index(lambda rec: rec.name.strip(), name='byname')
+        table.close()
+        del byname
+        calls = []
+        def key(record):
+            calls.append(dbf.recno(record))
+            return record.name.strip()
+        # changed (same record count) without the index
+        table.open(mode=READ_WRITE)
+        dbf.write(table[0], name='zzzzzz')
+        table.close()
+        table.open(mode=READ_WRITE)
+        byname = table.create_index(key, name='byname')
+        self.assertEqual(len(calls), 100)
+        self.assertEqual([dbf.recno(r) for r in byname.search('zzzzzz')], [0])
+        self.assertEqual(len(byname.search('n0')), 0)
+        table.close()
+        # unchanged, so reused
+        del calls[:]
+        table.open(mode=READ_WRITE)
+        byname = table.create_index(key, name='byname')
+        self.assertEqual(calls, [])
+        self.assertEqual(len(byname.search('zzzzzz')), 1)
+        # not closed cleanly
+        table._meta.index_file.close()
+        table._meta.index_file = None
+        table.close()
+        table.open(mode=READ_WRITE)
+        byname = table.create_index(key, name='byname')
+        self.assertEqual(len(calls), 100)
+        table.close()
+
+    def test_persistent_index_nodes(self):
+        "index nodes are stored as tagged bytes; bad nodes and oversized keys raise"
+        values = (
+                None, dbf.Null, True, False, dbf.Logical(True), dbf.Logical(None),
+                0, -5, 2**70, 1.5, dbf.Decimal('3.25'), u'\xe9t\xe9', b'\x00raw', dbf.Char('chr'),
+                datetime.date(2020, 1, 2), dbf.Date(2020, 1, 2), dbf.Date(),
+                datetime.datetime(2020, 1, 2, 3, 4, 5, 6), dbf.DateTime(2020, 1, 2, 3, 4, 5), dbf.DateTime(),
+                datetime.time(23, 59, 58, 7), dbf.Time(1, 2, 3), dbf.Time(),
+                (1, (u'a', [2, 3])),
+                )
+        for value in values:
+            data = dbf._pack_key(value)
+            result, end = dbf._unpack_key(data + b'tail', 0)
+            self.assertEqual(end, len(data))
+            self.assertEqual(type(result), type(value))
+            if value is not dbf.Null:
+                self.assertEqual(result, value)
+        self.assertRaises(DbfError, dbf._pack_key, object())
+        filename = os.path.join(tempdir, 'nodes')
+        table = Table(filename, 'name C(200); qty N(6,0)')
+        table.open(mode=READ_WRITE)
+        table.extend([((u'%d' % i) * (i % 40 + 1), i) for i in range(400)])
+        by_name = table.create_index(lambda rec: (rec.name.strip(), rec.qty), name='by_name')
+        for i in range(400, 700):
+            table.append(((u'%d' % i) * (i % 40 + 1), i))
+        self.assertEqual(len(by_name), 700)
+        self.assertEqual(
+                [dbf.recno(r) for r in by_name],
+                [i for n, i in sorted(((u'%d' % i) * (i % 40 + 1), i) for i in range(700))],
+                )
+        # a key larger than max_entry is refused, and the old entry is kept
+        repeat = [8]
+        big = table.create_index(lambda rec: rec.name.strip() * repeat[0], name='big')
+        repeat[0] = 20
+        self.assertRaises(DbfError, big, table[39])
+        self.assertEqual(len(big), 700)
+        repeat[0] = 8
+        self.assertEqual([dbf.recno(r) for r in big.search(table[39].name.strip() * 8)], [39])
+        index_file = table._meta.index_file
+        block = by_name._keys.root
+        table.close()
+        # a node that is not in the expected layout (here, a pickle) is bad data
+        import pickle
+        payload = pickle.dumps((True, [], [], [], 0, 0), 2)
+        with open(filename + '.pdx', 'r+b') as pdx:
+            pdx.seek(block * index_file.block_size)
+            pdx.write(struct.pack('<L', len(payload)) + payload)
+        table.open(mode=READ_WRITE)
+        by_name = table.create_index(lambda rec: (rec.name.strip(), rec.qty), name='by_name')
+        self.assertRaises(BadDataError, len, by_name)
+        table.close()
+
+    def test_pack_streaming(self):
+        "pack moves raw record blocks and renumbers records still in use"
+        for table in (self.dbf_table, self.vfp_table):
+            table.open(mode=READ_WRITE)
+            table.read_ahead = 7
+            table.record_cache = 0
+            length = len(table)
+            for i, record in enumerate(table):
+                if i % 3 == 0 or i == length - 1:
+                    dbf.delete(record)
+            del record
+            survivors = [r.name for r in table if not dbf.is_deleted(r)]
+            kept = [table[i] for i in range(length) if not dbf.is_deleted(table[i])][::4]
+            gone = [table[i] for i in range(length) if dbf.is_deleted(table[i])][:3]
+            table.pack()
+            self.assertEqual(len(table), len(survivors))
+            self.assertEqual([r.name for r in table], survivors)
+            for record in kept:
+                self.assertTrue(table[dbf.recno(record)] is record)
+            for record in gone:
+                self.assertEqual(dbf.recno(record), -1)
+            expected = table._meta.header.start + len(survivors) * table._meta.header.record_length
+            if table is self.dbf_table:
+                expected += 1
+            self.assertEqual(os.path.getsize(table.filename), expected)
+            table.close()
+            table.open()
+            self.assertEqual([r.name for r in table], survivors)
+            table.close()
+
+    def test_pack_memos(self):
+        "pack_memos and pack(memos=True) drop unreferenced memos"
+        for dbf_type in ('db3', 'fp', 'vfp'):
+            filename = os.path.join(tempdir, 'memopack_%s' % dbf_type)
+            table = Table(filename, 'name C(10); notes M; extra M', dbf_type=dbf_type)
+            with table:
+                for i in range(20):
+                    table.append(('rec%d' % i, 'note %d ' % i * 50, ''))
+                for j in range(3):
+                    for record in dbf.Process(table):
+                        record.notes = 'update %d of %s ' % (j, record.name.strip()) * 50
+                        record.extra = 'extra %s' % record.name.strip()
+                for record in table[::2]:
+                    dbf.delete(record)
+                table._meta.memo.flush()
+                size = os.path.getsize(table._meta.memoname)
+                table.pack_memos()
+                self.assertEqual(len(table), 20)
+                packed = os.path.getsize(table._meta.memoname)
+                self.assertTrue(packed < size / 2)
+                for i, record in enumerate(table):
+                    self.assertEqual(record.notes, 'update 2 of rec%d ' % i * 50)
+                    self.assertEqual(record.extra, 'extra rec%d' % i)
+                table.pack(memos=True)
+                self.assertTrue(os.path.getsize(table._meta.memoname) < packed)
+                dbf.write(table[0], extra='changed')
+                self.assertEqual(len(table), 10)
+            table.close()
+            table = Table(filename)
+            table.open()
+            self.assertEqual(table[0].extra, 'changed')
+            for i, record in enumerate(table):
+                self.assertEqual(record.name.strip(), 'rec%d' % (i * 2 + 1))
+                self.assertEqual(record.notes, 'update 2 of rec%d ' % (i * 2 + 1) * 50)
+            table.close()
+
+    def test_pack_memos_failure(self):
+        "pack_memos leaves both files untouched when it cannot finish"
+        for dbf_type in ('db3', 'vfp'):
+            filename = os.path.join(tempdir, 'memofail_%s' % dbf_type)
+            table = Table(filename, 'name C(10); notes M', dbf_type=dbf_type)
+            with table:
+                for i in range(30):
+                    table.append(('rec%d' % i, 'note %d ' % i * 40))
+                for record in dbf.Process(table):
+                    record.notes = 'second %s ' % record.name.strip() * 40
+                table._meta.memo.flush()
+                table._meta.dfd.flush()
+                files = table.filename, table._meta.memoname
+                before = [open(name, 'rb').read() for name in files]
+                passes = []
+                raw_blocks = table._raw_blocks
+                def failing_blocks(*args):
+                    # the second pass is the one writing the new table
+                    passes.append(args)
+                    if len(passes) == 2:
+                        raise IOError('disk full')
+                    return raw_blocks(*args)
+                table._raw_blocks = failing_blocks
+                self.assertRaises(IOError, table.pack_memos)
+                del table._raw_blocks
+                self.assertEqual([open(name, 'rb').read() for name in files], before)
+                self.assertFalse(os.path.exists(table.filename + '.pack'))
+                self.assertFalse(os.path.exists(table._meta.memoname + '.pack'))
+                self.assertEqual(table[3].notes, 'second rec3 ' * 40)
+                table.pack_memos()
+                self.assertTrue(os.path.getsize(table._meta.memoname) < len(before[1]))
+                self.assertEqual([r.notes for r in table], ['second rec%d ' % i * 40 for i in range(30)])
+                dbf.write(table[29], notes='after')
+            table.open()
+            self.assertEqual(table[3].notes, 'second rec3 ' * 40)
+            self.assertEqual(table[29].notes, 'after')
+            table.close()
+
+    def test_pack_memos_interrupted(self):
+        "a pack_memos swap cut short between its renames is finished on open"
+        for dbf_type in ('db3', 'vfp'):
+            filename = os.path.join(tempdir, 'memocrash_%s' % dbf_type)
+            table = Table(filename, 'name C(10); notes M', dbf_type=dbf_type)
+            table.open(mode=READ_WRITE)
+            for i in range(30):
+                table.append(('rec%d' % i, 'note %d ' % i * 40))
+            for record in dbf.Process(table):
+                record.notes = 'second %s ' % record.name.strip() * 40
+            table.close()
+            table.open(mode=READ_WRITE)
+            files = table.filename, table._meta.memoname
+            size = os.path.getsize(files[1])
+            replace_file = dbf._replace_file
+            def crash(source, target):
+                # the memo file is renamed first; stop before the table
+                if source == files[0] + '.pack':
+                    raise KeyboardInterrupt
+                replace_file(source, target)
+            dbf._replace_file = crash
+            try:
+                self.assertRaises(KeyboardInterrupt, table.pack_memos)
+            finally:
+                dbf._replace_file = replace_file
+            self.assertTrue(os.path.exists(files[0] + '.pack'))
+            self.assertFalse(os.path.exists(files[1] + '.pack'))
+            self.assertTrue(os.path.getsize(files[1]) < size)
+            table._meta.mfd.close()
+            table = Table(filename)
+            table.open()
+            self.assertFalse(os.path.exists(files[0] + '.pack'))
+            self.assertEqual([r.notes for r in table], ['second rec%d ' % i * 40 for i in range(30)])
+            table.close()
+            before = [open(name, 'rb').read() for name in files]
+            # a crash before the renames leaves both .pack files, which go
+            for name in files:
+                with open(name + '.pack', 'wb') as pack:
+                    pack.write(b'partial')
+            table.open()
+            self.assertFalse(os.path.exists(files[0] + '.pack'))
+            self.assertFalse(os.path.exists(files[1] + '.pack'))
+            self.assertEqual([open(name, 'rb').read() for name in files], before)
+            self.assertEqual(table[3].notes, 'second rec3 ' * 40)
+            table.close()
+
+    def test_memory_mapped(self):
+        "table file accessed through a memory map"
+        for original in (self.dbf_table, self.vfp_table):
+            table = Table(original.filename, mmap=True)
+            table.open(mode=READ_WRITE)
+            self.assertTrue(isinstance(table._meta.dfd, dbf._MappedFile))
+            for i, record in enumerate(table):
+                self.assertEqual(record.paid, self.dbf_paidlist[i] if original is self.dbf_table else self.vfp_paidlist[i])
+            with table[7] as record:
+                record.qty = 1234
+            del record
+            table.append({'name':'mapped', 'qty':42})
+            self.assertEqual(table[-1].name.strip(), 'mapped')
+            self.assertEqual(table[-1].qty, 42)
+            dbf.delete(table[0])
+            table.pack()
+            length = len(table)
+            table.close()
+            table = Table(original.filename)
+            table.open()
+            self.assertEqual(len(table), length)
+            self.assertEqual(table[6].qty, 1234)
+            self.assertEqual(table[-1].name.strip(), 'mapped')
+            table.close()
+            table.open(mode=READ_ONLY, mmap=True)
+            self.assertEqual(table[6].qty, 1234)
+            self.assertEqual(len(list(table)), length)
+            table.close()
+
     def test_undelete(self):
         "delete, undelete"
         table = Table(':memory:', 'name C(10)', dbf_type='db3', on_disk=False)
@@ -4518,6 +5764,113 @@ class TestDbfFunctions(TestCase):
         table3.close()
         table.close()
 
+    def test_extend(self):
+        "bulk append"
+        for table in (self.dbf_table, self.vfp_table):
+            table.open(mode=READ_WRITE)
+            table2 = table.new(os.path.join(tempdir, 'temptable_extend'))
+            table2.open(mode=READ_WRITE)
+            table2.read_ahead = 7
+            by_name = table2.create_index(lambda rec: rec.name.strip())
+            table2.extend(table)
+            table2.extend(dbf.scatter(record) for record in table)
+            table2.extend([('tuple', True, 17), {'name': 'dict', 'desc': 'a memo'}])
+            self.assertEqual(len(table2), len(table) * 2 + 2)
+            self.assertEqual(len(by_name), len(table2))
+            for i, record in enumerate(table):
+                self.assertEqual(record, table2[i])
+                self.assertEqual(record, table2[i + len(table)])
+            self.assertEqual(table2[-2].name.strip(), 'tuple')
+            self.assertEqual(table2[-2].qty, 17)
+            self.assertEqual(table2[-1].desc, 'a memo')
+            self.assertEqual(by_name.search('dict')[0].desc, 'a memo')
+            self.assertRaises(FieldMissingError, table2.extend, [{'name': 'kept'}, {'bogus': 1}])
+            self.assertEqual(len(table2), len(table) * 2 + 3)
+            self.assertEqual(table2[-1].name.strip(), 'kept')
+            # the rows kept from a failed extend are indexed too
+            self.assertEqual(len(by_name), len(table2))
+            self.assertEqual(dbf.recno(by_name.search('kept')[0]), len(table2) - 1)
+            # memos are on disk before the rows that point to them
+            memo, dfd = table2._meta.memo, table2._meta.dfd
+            pending = []
+            def write(data, write=dfd.write):
+                pending.append(len(memo.pending))
+                return write(data)
+            dfd.write = write
+            table2.extend({'name': 'memo %d' % i, 'desc': 'note %d' % i} for i in range(20))
+            del dfd.write
+            self.assertTrue(len(pending) >= 3)
+            self.assertEqual(set(pending), set([0]))
+            table2.close()
+            table2.open()
+            self.assertEqual(len(table2), len(table) * 2 + 23)
+            self.assertEqual(table2[len(table) * 2 + 1].desc, 'a memo')
+            self.assertEqual(table2[-1].desc, 'note 19')
+            self.assertEqual(table2[len(table)], table[0])
+            table2.close()
+            table.close()
+
+    def test_columns(self):
+        "columnar extraction"
+        for table in (self.dbf_table, self.vfp_table):
+            table.open()
+            table.read_ahead = 9
+            columns = table.columns(None)
+            self.assertEqual(len(columns), len(table.field_names))
+            for name, values in zip(table.field_names, columns):
+                self.assertEqual(values, [record[name] for record in table])
+            self.assertEqual(table.column('name', 3, 20), [record.name for record in table[3:20]])
+            self.assertEqual(table.column('qty', -5), [record.qty for record in table[-5:]])
+            qty = table.column('qty', as_type=array)
+            self.assertEqual(qty.typecode, 'd')
+            self.assertEqual(list(qty), [record.qty for record in table])
+            self.assertEqual(table.column('paid', as_type=tuple), tuple(record.paid for record in table))
+            self.assertRaises(DbfError, table.column, 'paid', as_type=array)
+            self.assertRaises(FieldMissingError, table.column, 'bogus')
+            table.close()
+        table = self.vfp_table.open()
+        age, mass = table.columns('age, mass', as_type=array)
+        self.assertEqual((age.typecode, mass.typecode), ('i', 'd'))
+        self.assertEqual(list(age), self.vfp_agelist)
+        self.assertEqual(list(mass), self.vfp_masslist)
+        table.close()
+        self.assertRaises(DbfError, table.column, 'age')
+
+    @skipIf(dbf.numpy is None, 'NumPy not installed')
+    def test_columns_numpy(self):
+        "columnar extraction into NumPy arrays"
+        import numpy
+        table = self.vfp_table.open()
+        age = table.column('age', as_type=numpy.ndarray)
+        self.assertEqual(age.dtype, numpy.dtype('i'))
+        self.assertEqual(age.sum(), sum(self.vfp_agelist))
+        table.close()
+
+    @skipIf(dbf.numpy is None, 'NumPy not installed')
+    def test_as_numpy(self):
+        "structured NumPy view of the records"
+        table = self.vfp_table
+        table.open(mode=READ_WRITE)
+        dbf.delete(table[3])
+        view = table.as_numpy()
+        self.assertEqual(len(view), len(table))
+        self.assertEqual(list(view['AGE']), self.vfp_agelist)
+        self.assertEqual(list(view['ATOM']), self.vfp_agelist)
+        self.assertEqual(list(view['MASS']), self.vfp_masslist)
+        self.assertEqual(list(view['_DELETED']), [b' '] * 3 + [b'*'] + [b' '] * (len(table) - 4))
+        for record, price, meeting, name in zip(table, view['PRICE'], view['MEETING'], view['NAME']):
+            self.assertEqual(Decimal(int(price)) / 10000, record.price)
+            self.assertEqual(list(meeting), list(struct.unpack('<ii', dbf.update_vfp_datetime(record.meeting))))
+            self.assertEqual(name.decode('ascii').strip(), record.name.strip())
+        view = table.as_numpy(10, 20)
+        self.assertEqual(list(view['AGE']), self.vfp_agelist[10:20])
+        table.close()
+        self.assertEqual(list(view['AGE']), self.vfp_agelist[10:20])
+        table = Table(':memory:', 'age I; mass B', dbf_type='vfp', on_disk=False)
+        table.open(mode=READ_WRITE)
+        table.append((7, 1.5))
+        self.assertEqual(list(table.as_numpy()['AGE']), [7])
+
     def test_slices(self):
         "slices"
         table = self.dbf_table
@@ -4670,14 +6023,14 @@ class TestDbfFunctions(TestCase):
 
     def test_memos_after_close(self):
         "memos available after close/open"
-        table = dbf.Table('tempy', 'name C(20); desc M', dbf_type='db3', default_data_types=dict(C=Char))
+        table = dbf.Table(os.path.join(tempdir, 'tempy'), 'name C(20); desc M', dbf_type='db3', default_data_types=dict(C=Char))
         table.open(mode=READ_WRITE)
         table.append(('Author','dashing, debonair, delightful'))
         table.close()
         table.open(mode=READ_WRITE)
         self.assertEqual(tuple(table[0]), ('Author','dashing, debonair, delightful'))
         table.close()
-        table2 = dbf.Table('tempy', 'name C(20); desc M', dbf_type='db3')
+        table2 = dbf.Table(os.path.join(tempdir, 'tempy'), 'name C(20); desc M', dbf_type='db3')
         table2.open(mode=READ_WRITE)
         table2.append(('Benedict', 'brilliant, bombastic, bothered'))
         table2.close()
@@ -4688,7 +6041,7 @@ class TestDbfFunctions(TestCase):
 
     def test_field_type(self):
         "table.type(field) == ('C', Char)"
-        table = dbf.Table('tempy', 'name C(20); desc M', dbf_type='db3', default_data_types=dict(C=Char))
+        table = dbf.Table(os.path.join(tempdir, 'tempy'), 'name C(20); desc M', dbf_type='db3', default_data_types=dict(C=Char))
         table.open(mode=READ_WRITE)
         field_info = table.field_info('name')
         self.assertEqual(field_info, (dbf.FieldType.CHAR, 20, 0, Char))
@@ -4711,6 +6064,30 @@ class TestDbfFunctions(TestCase):
         backup.close()
         table.close()
 
+    def test_backup_is_file_copy(self):
+        "disk backups of disk tables copy the files"
+        for table in (self.dbf_table, self.vfp_table):
+            table.open(mode=READ_WRITE)
+            table.append({'name': 'unflushed'})
+            dbf.write(table[-1], desc='buffered memo')
+            backup = table.create_backup()
+            for original, copy in ((table.filename, backup.filename), (table._meta.memoname, backup._meta.memoname)):
+                with open(original, 'rb') as a:
+                    with open(copy, 'rb') as b:
+                        self.assertEqual(a.read(), b.read())
+            memory = table.create_backup(on_disk=False)
+            memory.open()
+            backup.open()
+            self.assertEqual(len(backup), len(table))
+            self.assertEqual(len(memory), len(table))
+            self.assertEqual(backup[-1].desc, 'buffered memo')
+            self.assertEqual(memory[-1].desc, 'buffered memo')
+            for i, record in enumerate(table):
+                self.assertEqual(tuple(backup[i]), tuple(record))
+            backup.close()
+            memory.close()
+            table.close()
+
     def test_memo_file_size_before_backup(self):
         table = self.odd_memo_vfp_table
         self.assertEqual(48, table._meta.memo_size)
@@ -4736,7 +6113,7 @@ class TestDbfFunctions(TestCase):
     def test_export(self):
         for table in self.dbf_table, self.vfp_table:
             table.open(mode=READ_WRITE)
-            dbf.export(table, filename='test_export.csv')
+            dbf.export(table, filename=os.path.join(tempdir, 'test_export.csv'))
 
     def test_index_search(self):
         table = Table("unordered", "icao C(20)", default_data_types=dict(C=Char), on_disk=False).open(mode=READ_WRITE)